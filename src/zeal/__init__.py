@@ -1,9 +1,31 @@
-from .errors import NPlusOneError, ZealError
-from .listeners import setup, teardown, zeal_context, zeal_ignore
+from .errors import (
+    DuplicateQueryError,
+    NPlusOneError,
+    OverfetchError,
+    QueryBudgetError,
+    UnusedPrefetchError,
+    ZealError,
+)
+from .executor import ZealExecutor
+from .listeners import (
+    assert_max_queries,
+    get_memory_usage,
+    setup,
+    teardown,
+    zeal_context,
+    zeal_ignore,
+)
 
 __all__ = [
     "ZealError",
     "NPlusOneError",
+    "DuplicateQueryError",
+    "UnusedPrefetchError",
+    "OverfetchError",
+    "QueryBudgetError",
+    "ZealExecutor",
+    "assert_max_queries",
+    "get_memory_usage",
     "setup",
     "teardown",
     "zeal_context",
@@ -0,0 +1,180 @@
+import re
+from fnmatch import translate
+from typing import TYPE_CHECKING, Optional, TypedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import models
+
+from .constants import get_model_fields
+from .errors import ZealConfigError
+
+if TYPE_CHECKING:
+    # available in typing module in Python 3.11+
+    from typing_extensions import NotRequired
+
+# `raise` is a keyword, so we need the functional syntax here.
+AllowListEntry = TypedDict(
+    "AllowListEntry",
+    {
+        "model": str,
+        "field": "NotRequired[Optional[str]]",
+        # if set, the entry doesn't silence N+1s but overrides how they are
+        # reported: `threshold` replaces ZEAL_NPLUSONE_THRESHOLD and `raise`
+        # replaces ZEAL_RAISE.
+        "threshold": "NotRequired[int]",
+        "raise": "NotRequired[bool]",
+    },
+)
+
+_FNMATCH_CHARS = "*?[]"
+
+
+def _is_pattern(value: str) -> bool:
+    return any(char in value for char in _FNMATCH_CHARS)
+
+
+def _validate_allowlist(allowlist: list[AllowListEntry]):
+    for entry in allowlist:
+        if "threshold" in entry and not isinstance(entry["threshold"], int):
+            raise ZealConfigError(
+                f"Threshold for '{entry['model']}' must be an integer"
+            )
+        # if this is an fnmatch, don't do anything
+        if _is_pattern(entry["model"]):
+            continue
+        if not apps.models_ready:
+            # Django has not been initialized yet
+            continue
+        fields = get_model_fields(entry["model"])
+        if fields is None:
+            raise ZealConfigError(
+                f"Model '{entry['model']}' not found in installed Django models"
+            )
+
+        if "field" not in entry or not entry["field"]:
+            continue
+
+        if _is_pattern(entry["field"]):
+            continue
+
+        if entry["field"] == "get()":
+            continue
+
+        if entry["field"] not in fields:
+            raise ZealConfigError(
+                f"Field '{entry['field']}' not found on '{entry['model']}'"
+            )
+
+
+class Rule:
+    """
+    What to do about N+1s on a (model, field) matched by an allowlist
+    entry. A rule without a threshold or raise override silences them.
+    """
+
+    __slots__ = ("threshold", "should_raise", "silenced")
+
+    def __init__(self, entry: AllowListEntry):
+        self.threshold: Optional[int] = entry.get("threshold")
+        self.should_raise: Optional[bool] = entry.get("raise")
+        self.silenced = self.threshold is None and self.should_raise is None
+
+
+def _translate(pattern: str) -> str:
+    # fnmatch anchors its patterns at the end (with \Z, or \z on newer
+    # Pythons), which we don't want since we join several of them.
+    return translate(pattern)[:-2]
+
+
+class CompiledAllowlist:
+    """
+    An allowlist compiled for fast lookups. Entries without wildcards are
+    kept in a hash map, and all wildcard entries are joined into a single
+    regex. As with the plain list, the first matching entry wins, and
+    results are cached per (model, field).
+    """
+
+    __slots__ = ("_rules", "_exact", "_pattern", "_cache")
+
+    def __init__(self, allowlist: list[AllowListEntry]):
+        self._rules = [Rule(entry) for entry in allowlist]
+        # (model label, field or None for any field) -> index of the first
+        # entry with that key
+        self._exact: dict[tuple[str, Optional[str]], int] = {}
+        alternatives = []
+        for index, entry in enumerate(allowlist):
+            model = entry["model"]
+            field = entry.get("field") or "*"
+            if not _is_pattern(model) and (
+                field == "*" or not _is_pattern(field)
+            ):
+                key = (model, None if field == "*" else field)
+                self._exact.setdefault(key, index)
+            else:
+                alternatives.append(
+                    f"(?P<e{index}>{_translate(model)}\0{_translate(field)})"
+                )
+        self._pattern = (
+            re.compile("|".join(alternatives)) if alternatives else None
+        )
+        self._cache: dict[tuple[type[models.Model], str], Optional[Rule]] = {}
+
+    def __bool__(self):
+        return bool(self._rules)
+
+    def match(self, model: type[models.Model], field: str) -> Optional[Rule]:
+        key = (model, field)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        label = f"{model._meta.app_label}.{model.__name__}"
+        indices = [
+            index
+            for index in (
+                self._exact.get((label, field)),
+                self._exact.get((label, None)),
+            )
+            if index is not None
+        ]
+        if self._pattern is not None:
+            match = self._pattern.fullmatch(f"{label}\0{field}")
+            if match is not None:
+                assert match.lastgroup is not None
+                indices.append(int(match.lastgroup[1:]))
+
+        rule = self._rules[min(indices)] if indices else None
+        self._cache[key] = rule
+        return rule
+
+
+_settings_allowlist: Optional[CompiledAllowlist] = None
+
+
+def get_settings_allowlist() -> CompiledAllowlist:
+    """
+    Returns ZEAL_ALLOWLIST, validated and compiled. This only happens once
+    per process (or when the setting changes in tests).
+    """
+    global _settings_allowlist
+    if _settings_allowlist is None:
+        allowlist = (
+            settings.ZEAL_ALLOWLIST
+            if hasattr(settings, "ZEAL_ALLOWLIST")
+            else []
+        )
+        _validate_allowlist(allowlist)
+        _settings_allowlist = CompiledAllowlist(allowlist)
+    return _settings_allowlist
+
+
+def _reset_settings_allowlist(*, setting: str, **kwargs):
+    global _settings_allowlist
+    if setting == "ZEAL_ALLOWLIST":
+        _settings_allowlist = None
+
+
+setting_changed.connect(_reset_settings_allowlist)
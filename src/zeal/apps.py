@@ -1,13 +1,23 @@
 from django.apps import AppConfig
-
-from .patch import patch
+from django.conf import settings
 
 
 class ZealConfig(AppConfig):
     name = "zeal"
 
     def ready(self):
-        from .constants import initialize_app_registry
+        lazy = (
+            settings.ZEAL_LAZY_PATCH
+            if hasattr(settings, "ZEAL_LAZY_PATCH")
+            else False
+        )
+        if lazy:
+            # processes that never enable zeal (e.g. migrations or shells)
+            # don't even import the patches
+            from . import listeners
+
+            listeners._install_on_setup = True
+        else:
+            from .patch import install
 
-        initialize_app_registry()
-        patch()
+            install()
@@ -0,0 +1,154 @@
+import json
+import os
+from collections.abc import Iterable
+from typing import Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import models
+
+from .errors import ZealConfigError
+
+# (model label, field, call site)
+BaselineEntry = tuple[str, str, str]
+
+BASELINE_VERSION = 1
+
+
+class Baseline:
+    """
+    Known N+1s that shouldn't be reported, loaded from ZEAL_BASELINE_FILE.
+
+    Each N+1 is identified by its model, field and call site, where the
+    call site is the path of the calling file (relative to the baseline
+    file) and the calling function. Unlike line numbers, these don't
+    change on every edit. Entries are kept in a set, and the result for
+    each N+1 key is cached, so checking an N+1 costs one dict lookup.
+    """
+
+    __slots__ = ("path", "_root", "_entries", "_keys", "hits")
+
+    def __init__(self, path: str, entries: Iterable[BaselineEntry] = ()):
+        self.path = path
+        self._root = os.path.dirname(os.path.abspath(path))
+        self._entries: set[BaselineEntry] = set(entries)
+        # N+1 key -> whether it's in the baseline
+        self._keys: dict[tuple, bool] = {}
+        # entries that were hit in this process
+        self.hits: set[BaselineEntry] = set()
+
+    @classmethod
+    def load(cls, path: str) -> "Baseline":
+        """
+        Loads a baseline file. A missing file is an empty baseline, so
+        that it can be generated in the first place.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        except ValueError as e:
+            raise ZealConfigError(
+                f"ZEAL_BASELINE_FILE '{path}' is not valid JSON: {e}"
+            ) from e
+        if not isinstance(data, dict) or data.get("version") != (
+            BASELINE_VERSION
+        ):
+            raise ZealConfigError(
+                f"ZEAL_BASELINE_FILE '{path}' is not a zeal baseline file"
+            )
+        return cls(
+            path,
+            (
+                (entry["model"], entry["field"], entry["site"])
+                for entry in data["entries"]
+            ),
+        )
+
+    def site(self, filename: str, function: str) -> str:
+        path = os.path.relpath(filename, self._root)
+        return f"{path.replace(os.sep, '/')}:{function}"
+
+    def covers(
+        self, key: tuple[type[models.Model], str, str, int], function: str
+    ) -> bool:
+        """
+        Returns whether the N+1 with the given key, whose call site is in
+        `function`, is in the baseline.
+        """
+        try:
+            return self._keys[key]
+        except KeyError:
+            pass
+        model, field, filename, _ = key
+        entry = (
+            f"{model._meta.app_label}.{model.__name__}",
+            field,
+            self.site(filename, function),
+        )
+        covered = self._keys[key] = entry in self._entries
+        if covered:
+            self.hits.add(entry)
+        return covered
+
+    def stale(self) -> list[BaselineEntry]:
+        """
+        Returns the entries that weren't hit in this process, e.g. because
+        the N+1 was fixed. This is only meaningful once all the code the
+        baseline was generated from (e.g. the whole test suite) has run.
+        """
+        return sorted(self._entries - self.hits)
+
+    def write(self, entries: Iterable[BaselineEntry]):
+        """
+        Replaces the baseline file with the given entries.
+        """
+        data = {
+            "version": BASELINE_VERSION,
+            "entries": [
+                {"model": model, "field": field, "site": site}
+                for model, field, site in sorted(set(entries))
+            ],
+        }
+        with open(self.path, "w") as f:
+            json.dump(data, f, indent=2)
+            f.write("\n")
+
+    def __contains__(self, entry: object) -> bool:
+        return entry in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_baseline: Optional[Baseline] = None
+_baseline_loaded = False
+
+
+def get_baseline() -> Optional[Baseline]:
+    """
+    Returns the baseline from ZEAL_BASELINE_FILE, or None if it isn't set.
+    The file is only read once per process (or when the setting changes in
+    tests).
+    """
+    global _baseline, _baseline_loaded
+    if not _baseline_loaded:
+        path = (
+            settings.ZEAL_BASELINE_FILE
+            if hasattr(settings, "ZEAL_BASELINE_FILE")
+            else None
+        )
+        _baseline = Baseline.load(str(path)) if path else None
+        _baseline_loaded = True
+    return _baseline
+
+
+def _reset_baseline(*, setting: str, **kwargs):
+    global _baseline, _baseline_loaded
+    if setting == "ZEAL_BASELINE_FILE":
+        _baseline = None
+        _baseline_loaded = False
+
+
+setting_changed.connect(_reset_baseline)
@@ -1,27 +1,57 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 from django.apps import apps
+from django.db import models
+from django.db.models.signals import class_prepared
 
-ALL_APPS = {}
+# "app_label.ModelName" -> the names of the model's fields and reverse
+# accessors. This is only used to validate allowlists, so each model is
+# looked up the first time an allowlist names it, rather than all of them
+# at startup.
+ALL_APPS: dict[str, set[str]] = {}
 
 
-def initialize_app_registry():
-    if TYPE_CHECKING:
-        # pyright is unhappy with model._meta.related_objects below,
-        # so we need to skip this code path in type checking
-        return
+def get_model_fields(label: str) -> Optional[set[str]]:
+    """
+    Returns the field names of the model with the given label (e.g.
+    `social.User`), or None if there's no such model. The app registry
+    must be ready.
+    """
+    try:
+        return ALL_APPS[label]
+    except KeyError:
+        pass
 
-    for model in apps.get_models():
-        # Get direct fields
-        fields = set(
-            field.name for field in model._meta.get_fields(include_hidden=True)
-        )
+    app_label, _, model_name = label.partition(".")
+    try:
+        model = apps.get_model(app_label, model_name)
+    except LookupError:
+        return None
+    # get_model() ignores case, but allowlists don't
+    if model.__name__ != model_name:
+        return None
+
+    # Get direct fields
+    fields = set(
+        field.name for field in model._meta.get_fields(include_hidden=True)
+    )
 
-        # Get reverse relations using related_objects
-        reverse_fields = set(
+    # Get reverse relations using related_objects
+    if not TYPE_CHECKING:
+        # pyright is unhappy with model._meta.related_objects
+        fields |= set(
             rel.get_accessor_name() for rel in model._meta.related_objects
         )
 
-        ALL_APPS[f"{model._meta.app_label}.{model.__name__}"] = (
-            fields | reverse_fields
-        )
+    ALL_APPS[label] = fields
+    return fields
+
+
+def _reset_app_registry(sender: type[models.Model], **kwargs):
+    # a model registered after startup (e.g. in tests) can add reverse
+    # accessors to models that were already looked up
+    if sender._meta.apps is apps:
+        ALL_APPS.clear()
+
+
+class_prepared.connect(_reset_app_registry)
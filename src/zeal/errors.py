@@ -6,5 +6,21 @@ class NPlusOneError(ZealError):
     pass
 
 
+class DuplicateQueryError(ZealError):
+    pass
+
+
+class UnusedPrefetchError(ZealError):
+    pass
+
+
+class OverfetchError(ZealError):
+    pass
+
+
+class QueryBudgetError(ZealError):
+    pass
+
+
 class ZealConfigError(ZealError):
     pass
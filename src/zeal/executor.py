@@ -0,0 +1,71 @@
+"""
+Runs work on other threads in the zeal context of the thread that hands it
+off. Threads don't inherit context variables, so without this, N+1s in
+work fanned out to a thread pool go unnoticed.
+"""
+
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Callable, TypeVar
+
+from .listeners import (
+    NPlusOneContext,
+    _add_sql_wrappers,
+    _fork_context,
+    _needs_sql_wrapper,
+    _nplusone_context,
+)
+
+T = TypeVar("T")
+
+
+def wrap(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    Returns a version of `fn` that runs in the current zeal context, from
+    whichever thread calls it.
+
+    Each call counts its queries in its own copy of the context, so
+    threads never write to the same counters. Once the call returns, its
+    copy is handed back to the context and merged in by the thread that
+    owns it (the next time that thread runs a query, or at teardown), so
+    no locks are taken on the counters, even on free-threaded Python.
+    """
+    context = _nplusone_context.get()
+    if not context.enabled:
+        return fn
+    # other context variables (e.g. the ones zeal uses to track which
+    # query is running) are handed off as well
+    parent = copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs) -> T:
+        # a context can only be entered by one thread at a time
+        return parent.copy().run(_run, context, fn, *args, **kwargs)
+
+    return wrapper
+
+
+def _run(context: NPlusOneContext, fn: Callable[..., T], *args, **kwargs):
+    shard = _fork_context(context)
+    _nplusone_context.set(shard)
+    if _needs_sql_wrapper(shard):
+        # in case the worker's connection was opened before zeal was
+        # installed
+        _add_sql_wrappers()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # work that this call handed off in turn is merged in along with
+        # it, by the thread that owns `context`
+        context.pending.append(shard)
+
+
+class ZealExecutor(ThreadPoolExecutor):
+    """
+    A `ThreadPoolExecutor` that runs the work submitted to it in the zeal
+    context of the submitting thread (see `wrap`).
+    """
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return super().submit(wrap(fn), *args, **kwargs)
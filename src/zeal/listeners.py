@@ -1,93 +1,230 @@
+import asyncio
 import logging
+import threading
+import time
 import warnings
+import weakref
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from collections import deque
+from collections.abc import Hashable
 from contextlib import contextmanager
-from contextvars import ContextVar, Token
-from dataclasses import dataclass, field
-from fnmatch import fnmatch
-from typing import TYPE_CHECKING, Optional, TypedDict, Union
+from contextvars import ContextVar, Token, copy_context
+from dataclasses import dataclass, field, replace
+from typing import Any, Optional, TypedDict
 
 from django.conf import settings
-from django.db import models
+from django.db import connections, models
+from django.db.backends.signals import connection_created
 
-from zeal.util import get_caller, get_stack
+from zeal.util import get_call_site, get_caller, get_stack
 
-from .constants import ALL_APPS
-from .errors import NPlusOneError, ZealConfigError, ZealError
-from .signals import nplusone_detected
+from .allowlist import (
+    AllowListEntry,
+    CompiledAllowlist,
+    Rule,
+    _validate_allowlist,
+    get_settings_allowlist,
+)
+from .baseline import Baseline, get_baseline
+from .errors import (
+    DuplicateQueryError,
+    NPlusOneError,
+    OverfetchError,
+    QueryBudgetError,
+    UnusedPrefetchError,
+    ZealError,
+)
+from .report import Report, ReportEntry
+from .signals import (
+    duplicate_query_detected,
+    nplusone_detected,
+    overfetch_detected,
+    query_budget_exceeded,
+    report_generated,
+    unused_prefetch_detected,
+)
+from .sql import _in_tracked_query, parse_query
+from .store import CallStore, IgnoredKeys
+from .suggestions import get_suggestion
 
-if TYPE_CHECKING:
-    # available in typing module in Python 3.11+
-    from typing_extensions import NotRequired
+# tuple of (model, pk), e.g. `(User, 123)`
+InstanceKey = tuple[type[models.Model], Any]
 
 
 class QuerySource(TypedDict):
     model: type[models.Model]
     field: str
-    instance_key: Optional[str]  # e.g. `User:123`
+    instance_key: Optional[InstanceKey]
 
 
-# tuple of (model, field, caller) or (model, field, filename, lineno)
-CountsKey = Union[
-    tuple[type[models.Model], str, str],
-    tuple[type[models.Model], str, str, int],
-]
+# tuple of (model, field, filename, lineno)
+CountsKey = tuple[type[models.Model], str, str, int]
 
+# How many call stacks reports keep per N+1 key
+REPORT_SAMPLE_STACKS = 3
 
-class AllowListEntry(TypedDict):
-    model: str
-    field: "NotRequired[Optional[str]]"
 
+class PrefetchRecord:
+    """
+    One level of a `prefetch_related()` lookup that was fetched in a zeal
+    context. `used` is set once any of the prefetched caches is read.
+    """
 
-def _validate_allowlist(allowlist: list[AllowListEntry]):
-    for entry in allowlist:
-        fnmatch_chars = "*?[]"
-        # if this is an fnmatch, don't do anything
-        if any(char in entry["model"] for char in fnmatch_chars):
-            continue
-        if not ALL_APPS:
-            # zeal has not been initialized yet
-            continue
-        if entry["model"] not in ALL_APPS:
-            raise ZealConfigError(
-                f"Model '{entry['model']}' not found in installed Django models"
-            )
+    __slots__ = ("model", "field", "lookup", "caller", "rows", "used")
+
+    def __init__(
+        self,
+        model: type[models.Model],
+        field: str,
+        lookup: str,
+        caller: tuple[str, int, str],
+        rows: int,
+    ):
+        self.model = model
+        self.field = field
+        self.lookup = lookup
+        self.caller = caller
+        self.rows = rows
+        self.used = False
 
-        if "field" not in entry or not entry["field"]:
-            continue
 
-        if any(char in entry["field"] for char in fnmatch_chars):
-            continue
+class QueryCost:
+    """
+    The database time (in seconds) and rows returned by the queries
+    attributed to one N+1 key.
+    """
 
-        if entry["field"] == "get()":
-            continue
+    __slots__ = ("time", "rows")
+
+    def __init__(self):
+        self.time = 0.0
+        self.rows = 0
+
+
+# The N+1 key that the queries being run are attributed to, while
+# ZEAL_MEASURE_QUERIES is on
+_query_key: ContextVar[Optional[CountsKey]] = ContextVar(
+    "_query_key", default=None
+)
 
-        if entry["field"] not in ALL_APPS[entry["model"]]:
-            raise ZealConfigError(
-                f"Field '{entry['field']}' not found on '{entry['model']}'"
-            )
+
+class ColumnUsage:
+    """
+    The columns loaded and read on the instances that one call site
+    fetched for one model in a zeal context. `tracked` are the attnames of
+    the columns whose reads are tracked, and `wide` are the large columns
+    (e.g. text or JSON) among them that are worth reporting if they're
+    never read.
+    """
+
+    __slots__ = ("model", "caller", "tracked", "wide", "loaded", "read")
+
+    def __init__(
+        self,
+        model: type[models.Model],
+        caller: tuple[str, int, str],
+        tracked: list[str],
+        wide: list[models.Field],
+    ):
+        self.model = model
+        self.caller = caller
+        self.tracked = tracked
+        self.wide = wide
+        self.loaded: set[str] = set()
+        self.read: set[str] = set()
+
+
+class QueryBudget:
+    """
+    The number of queries a zeal context may run, and how many it has run
+    so far. `should_raise` overrides ZEAL_RAISE for the budget alone.
+    """
+
+    __slots__ = ("limit", "count", "should_raise")
+
+    def __init__(self, limit: int, should_raise: Optional[bool] = None):
+        self.limit = limit
+        self.count = 0
+        self.should_raise = should_raise
 
 
 @dataclass
 class NPlusOneContext:
     enabled: bool = False
-    calls: dict[CountsKey, list] = field(
-        default_factory=lambda: defaultdict(list)
-    )
-    ignored: set[str] = field(default_factory=set)
+    calls: CallStore = field(default_factory=CallStore)
+    ignored: IgnoredKeys = field(default_factory=IgnoredKeys)
     allowlist: list[AllowListEntry] = field(default_factory=list)
-    # Cache for keys that have already been checked and found allowlisted,
-    # so we can skip the expensive _alert() path on subsequent accesses.
-    _allowlisted_keys: set[tuple[type[models.Model], str]] = field(
-        default_factory=set
+    # Overrides ZEAL_RAISE for this context when set, e.g. for sampled
+    # requests that should report N+1s without failing the request.
+    raise_errors: Optional[bool] = None
+    # Whether to also detect N+1s from repeated SQL (ZEAL_DETECT_SQL)
+    detect_sql: bool = False
+    # How often the same SQL and parameters may run before it's reported
+    # (ZEAL_DUPLICATE_QUERY_THRESHOLD), or None to not check
+    duplicate_threshold: Optional[int] = None
+    # (sql, params) -> count, with the caller of each execution
+    queries: CallStore = field(default_factory=CallStore)
+    # Whether to report prefetches that are never read at teardown, from
+    # ZEAL_DETECT_UNUSED_PREFETCHES
+    detect_unused_prefetches: bool = False
+    prefetches: list[PrefetchRecord] = field(default_factory=list)
+    # Whether to report wide columns that are loaded but never read at
+    # teardown, from ZEAL_DETECT_OVERFETCHING
+    detect_overfetching: bool = False
+    column_usage: dict[
+        tuple[type[models.Model], tuple[str, int, str]], ColumnUsage
+    ] = field(default_factory=dict)
+    # The usage that reads of each fetched instance's columns count
+    # towards, by the id of the instance. Kept here rather than on the
+    # instances, so that nothing is tracked once the context ends.
+    column_reads: dict[int, tuple[weakref.KeyedRef, ColumnUsage]] = field(
+        default_factory=dict
     )
+    # Whether to measure the time and rows of the queries attributed to
+    # each N+1 key (ZEAL_MEASURE_QUERIES)
+    measure_queries: bool = False
+    costs: dict[CountsKey, QueryCost] = field(default_factory=dict)
+    # Whether to collect N+1s into one report at teardown instead of
+    # alerting on each of them (ZEAL_REPORT)
+    report: bool = False
+    # key -> (rule, suggestion, calling function, the counters the key was
+    # found in) for each N+1 found in report mode
+    flagged: dict[
+        CountsKey, tuple[Optional[Rule], Optional[str], str, CallStore]
+    ] = field(default_factory=dict)
+    # Whether to record where instances were loaded from, to suggest how
+    # to load the relations that N+1s are found on (ZEAL_SUGGEST_FIXES)
+    suggest_fixes: bool = False
+    # Known N+1s that aren't reported (ZEAL_BASELINE_FILE)
+    baseline: Optional[Baseline] = None
+    # The query budget (ZEAL_MAX_QUERIES), checked at teardown
+    budget: Optional[QueryBudget] = None
+    # Contexts of work that other threads finished for this context (see
+    # `zeal.executor`), merged in by the thread that owns this context
+    pending: deque["NPlusOneContext"] = field(default_factory=deque)
+    # For a `zeal_ignore()` block, the context it was entered in, which
+    # shares its pending work and gets that work merged into its counts
+    outer: Optional["NPlusOneContext"] = None
+    # How many of the calls counted for each key were on ignored (e.g.
+    # singly-loaded) instances, so that merging these calls into another
+    # context doesn't report them
+    ignored_calls: dict[CountsKey, int] = field(default_factory=dict)
+    # Allowlist rule (or None) for each (model, field) seen so far, so
+    # that notify() only looks up the allowlists once per pair.
+    _rules: dict[tuple[type[models.Model], str], Optional[Rule]] = field(
+        default_factory=dict
+    )
+    # `allowlist`, compiled on first use
+    _compiled_allowlist: Optional[CompiledAllowlist] = None
     # Cached settings values, lazily populated on first notify() call
     # to avoid expensive hasattr(settings, ...) on every notify() call.
     _threshold: Optional[int] = None
     _show_all_callers: Optional[bool] = None
 
 
+# The default context is shared by everything that runs outside a zeal
+# context, so it's never written to: listeners return early when it's
+# disabled.
 _nplusone_context: ContextVar[NPlusOneContext] = ContextVar(
     "nplusone",
     default=NPlusOneContext(),
@@ -104,14 +241,38 @@ class Listener(ABC):
     @abstractmethod
     def error_class(self) -> type[ZealError]: ...
 
-    @property
-    def _allowlist(self) -> list[AllowListEntry]:
-        if hasattr(settings, "ZEAL_ALLOWLIST"):
-            settings_allowlist = settings.ZEAL_ALLOWLIST
-        else:
-            settings_allowlist = []
+    def _get_rule(
+        self,
+        context: NPlusOneContext,
+        model: type[models.Model],
+        field: str,
+    ) -> Optional[Rule]:
+        """
+        Returns the first allowlist rule matching this model and field,
+        looking at ZEAL_ALLOWLIST before the context's own allowlist. A
+        rule from the context that silences N+1s (e.g. from `zeal_ignore()`)
+        still beats a settings rule that only overrides how they're
+        reported.
+        """
+        key = (model, field)
+        try:
+            return context._rules[key]
+        except KeyError:
+            pass
 
-        return [*settings_allowlist, *_nplusone_context.get().allowlist]
+        rule = get_settings_allowlist().match(model, field)
+        if (rule is None or not rule.silenced) and context.allowlist:
+            if context._compiled_allowlist is None:
+                context._compiled_allowlist = CompiledAllowlist(
+                    context.allowlist
+                )
+            context_rule = context._compiled_allowlist.match(model, field)
+            if context_rule is not None and (
+                rule is None or context_rule.silenced
+            ):
+                rule = context_rule
+        context._rules[key] = rule
+        return rule
 
     def _alert(
         self,
@@ -119,29 +280,15 @@ class Listener(ABC):
         field: str,
         message: str,
         calls: list,
+        rule: Optional[Rule] = None,
+        suggestion: Optional[str] = None,
+        caller: Optional[tuple[str, int, str]] = None,
     ):
-        should_error = (
-            settings.ZEAL_RAISE if hasattr(settings, "ZEAL_RAISE") else True
-        )
         should_include_all_callers = (
             settings.ZEAL_SHOW_ALL_CALLERS
             if hasattr(settings, "ZEAL_SHOW_ALL_CALLERS")
             else False
         )
-        is_allowlisted = False
-        for entry in self._allowlist:
-            model_match = fnmatch(
-                f"{model._meta.app_label}.{model.__name__}", entry["model"]
-            )
-            field_match = fnmatch(field, entry.get("field") or "*")
-            if model_match and field_match:
-                is_allowlisted = True
-                break
-
-        if is_allowlisted:
-            _nplusone_context.get()._allowlisted_keys.add((model, field))
-            return
-
         if should_include_all_callers:
             # calls contains lists of (filename, lineno, funcname) tuples
             # Use the first frame of the first call as the "caller" for warn_explicit
@@ -167,16 +314,38 @@ class Listener(ABC):
                     else:
                         message += f"  {frame.filename}:{frame.lineno} in {frame.function}\n"
         else:
-            caller_filename, caller_lineno, caller_funcname = get_caller()
+            caller_filename, caller_lineno, caller_funcname = (
+                caller or get_caller()
+            )
             message = f"{message} at {caller_filename}:{caller_lineno} in {caller_funcname}"
+        if suggestion is not None:
+            message = f"{message.rstrip()}\nSuggestion: {suggestion}"
+        self._raise_or_warn(message, rule, caller_filename, caller_lineno)
+
+    def _raise_or_warn(
+        self,
+        message: str,
+        rule: Optional[Rule],
+        filename: str,
+        lineno: int,
+    ):
+        should_error = _nplusone_context.get().raise_errors
+        if should_error is None and rule is not None:
+            should_error = rule.should_raise
+        if should_error is None:
+            should_error = (
+                settings.ZEAL_RAISE
+                if hasattr(settings, "ZEAL_RAISE")
+                else True
+            )
         if should_error:
             raise self.error_class(message)
         else:
             warnings.warn_explicit(
                 message,
                 UserWarning,
-                filename=caller_filename,
-                lineno=caller_lineno,
+                filename=filename,
+                lineno=lineno,
             )
 
 
@@ -189,11 +358,22 @@ class NPlusOneListener(Listener):
         self,
         model: type[models.Model],
         field: str,
-        instance_key: Optional[str],
-    ):
+        instance_key: Optional[InstanceKey],
+        instance: Optional[models.Model] = None,
+        filtered: bool = False,
+    ) -> Optional[CountsKey]:
+        """
+        Records a query for the relation `field` of `model`, and returns
+        the key it was counted under. `instance` is the instance the
+        relation was accessed on, if known, and is used to suggest a fix;
+        `filtered` means that the related queryset was filtered or
+        otherwise changed before it was evaluated.
+        """
         context = _nplusone_context.get()
         if not context.enabled:
-            return
+            return None
+        if context.pending:
+            _merge_pending(context)
         # Lazy-cache settings on first call to avoid hasattr() overhead per call
         show_all_callers = context._show_all_callers
         if show_all_callers is None:
@@ -202,18 +382,71 @@ class NPlusOneListener(Listener):
                 and settings.ZEAL_SHOW_ALL_CALLERS
             )
             context._show_all_callers = show_all_callers
-        if show_all_callers:
-            stack = get_stack()
-            caller_fn, caller_lineno, _ = stack[0]
-            key = (model, field, caller_fn, caller_lineno)
-            context.calls[key].append(stack)
-            count = len(context.calls[key])
+        fn, lineno = get_call_site()
+        key = (model, field, fn, lineno)
+        calls = context.calls
+        if show_all_callers or (
+            # reports only keep a few sample stacks per key
+            context.report
+            and (key not in calls or calls[key] < REPORT_SAMPLE_STACKS)
+        ):
+            count = calls.record(key, get_stack())
         else:
-            fn, lineno, _ = get_caller()
-            key = (model, field, fn, lineno)
-            calls_list = context.calls[key]
-            calls_list.append(None)
-            count = len(calls_list)
+            count = calls.record(key)
+        if count == 1:
+            # for reports and the baseline, which identify call sites by
+            # function, even once the calls are merged into another context
+            calls.set_function(key, get_caller()[2])
+        if instance_key is not None and instance_key in context.ignored:
+            ignored_calls = context.ignored_calls
+            ignored_calls[key] = ignored_calls.get(key, 0) + 1
+            return key
+        rule = self._get_rule(context, model, field)
+        if rule is not None and rule.silenced:
+            return key
+        if count >= self._get_threshold(context, rule):
+            self._flag(
+                context,
+                key,
+                count,
+                rule,
+                get_suggestion(instance, model, field, filtered),
+            )
+        return key
+
+    def notify_merged(
+        self,
+        context: NPlusOneContext,
+        child: NPlusOneContext,
+        key: CountsKey,
+    ):
+        """
+        Checks `key` once the calls of `child` (e.g. a worker thread's
+        context) have been merged into `context`, for an N+1 that neither
+        of them reached on its own. The allowlist that applies is the one
+        the child's calls were made under.
+        """
+        child_count = child.calls[key]
+        if child_count <= child.ignored_calls.get(key, 0):
+            return
+        model, field, filename, lineno = key
+        rule = self._get_rule(child, model, field)
+        if rule is not None and rule.silenced:
+            return
+        # the merged key may have been evicted
+        count = context.calls[key] if key in context.calls else 0
+        if (
+            max(count - child_count, child_count)
+            < self._get_threshold(context, rule)
+            <= count
+        ):
+            self._flag(context, key, count, rule, None)
+
+    def _get_threshold(
+        self, context: NPlusOneContext, rule: Optional[Rule]
+    ) -> int:
+        if rule is not None and rule.threshold is not None:
+            return rule.threshold
         threshold = context._threshold
         if threshold is None:
             threshold = (
@@ -222,24 +455,70 @@ class NPlusOneListener(Listener):
                 else 2
             )
             context._threshold = threshold
-        if count >= threshold and instance_key not in context.ignored:
-            # Skip _alert() entirely if this (model, field) was already allowlisted
-            alert_key = (model, field)
-            if alert_key not in context._allowlisted_keys:
-                message = f"N+1 detected on {model._meta.app_label}.{model.__name__}.{field}"
-                self._alert(model, field, message, context.calls[key])
-
-    def ignore(self, instance_key: Optional[str]):
+        return threshold
+
+    def _flag(
+        self,
+        context: NPlusOneContext,
+        key: CountsKey,
+        count: int,
+        rule: Optional[Rule],
+        suggestion: Optional[str],
+    ):
+        """
+        Reports the N+1 on `key`, unless the baseline covers it. In report
+        mode it's only collected, to be reported at teardown.
+        """
+        # the function the key was recorded in, which may not be on the
+        # current stack if the calls were merged from another context
+        function = context.calls.function(key)
+        baseline = context.baseline
+        if baseline is not None and baseline.covers(key, function):
+            return
+        if context.report:
+            if key not in context.flagged:
+                context.flagged[key] = (
+                    rule,
+                    suggestion,
+                    function,
+                    context.calls,
+                )
+            return
+        model, field, filename, lineno = key
+        message = self._get_message(model, field)
+        if context.measure_queries:
+            message += _format_cost(count, context.costs.get(key))
+        self._alert(
+            model,
+            field,
+            message,
+            context.calls.stacks(key),
+            rule,
+            suggestion,
+            (filename, lineno, function),
+        )
+
+    def _get_message(self, model: type[models.Model], field: str) -> str:
+        return (
+            f"N+1 detected on {model._meta.app_label}.{model.__name__}.{field}"
+        )
+
+    def ignore(
+        self,
+        instance_key: Optional[InstanceKey],
+        instance: Optional[models.Model] = None,
+    ):
         """
         Tells the listener to ignore N+1s arising from this instance.
 
         This is used when the given instance is singly-loaded, e.g. via `.first()`
-        or `.get()`. This is to prevent false positives.
+        or `.get()`. This is to prevent false positives. If `instance` is
+        given, the key is only ignored for as long as it's alive.
         """
         context = _nplusone_context.get()
-        if not instance_key:
+        if not context.enabled or not instance_key:
             return
-        context.ignored.add(instance_key)
+        context.ignored.add(instance_key, instance)
 
     def _alert(
         self,
@@ -247,42 +526,743 @@ class NPlusOneListener(Listener):
         field: str,
         message: str,
         calls: list,
+        rule: Optional[Rule] = None,
+        suggestion: Optional[str] = None,
+        caller: Optional[tuple[str, int, str]] = None,
     ):
-        super()._alert(model, field, message, calls)
+        super()._alert(model, field, message, calls, rule, suggestion, caller)
         nplusone_detected.send(
             sender=self,
             exception=self.error_class(message),
         )
 
+    def report(self, context: NPlusOneContext) -> Report:
+        """
+        Builds the report of the N+1s found in a zeal context in report
+        mode, and emits it: it's sent with the `report_generated` signal,
+        appended to ZEAL_REPORT_FILE if set, and then alerted on once.
+        """
+        report = Report()
+        rules = []
+        for key, (
+            rule,
+            suggestion,
+            function,
+            calls,
+        ) in context.flagged.items():
+            model, field, filename, lineno = key
+            entry = ReportEntry(
+                model=f"{model._meta.app_label}.{model.__name__}",
+                field=field,
+                filename=filename,
+                lineno=lineno,
+                function=function,
+                count=calls[key] if key in calls else 0,
+                stacks=[list(stack) for stack in calls.stacks(key)],
+                suggestion=suggestion,
+            )
+            if context.measure_queries:
+                cost = context.costs.get(key)
+                entry.db_time_ms = cost.time * 1000 if cost else 0.0
+                entry.rows = cost.rows if cost else 0
+            report.entries.append(entry)
+            rules.append(rule)
+        report_generated.send(sender=self, report=report)
+        path = (
+            settings.ZEAL_REPORT_FILE
+            if hasattr(settings, "ZEAL_REPORT_FILE")
+            else None
+        )
+        if path:
+            report.write(path)
+        if report.entries:
+            message = report.format()
+            first = report.entries[0]
+            self._raise_or_warn(
+                message, _combine_rules(rules), first.filename, first.lineno
+            )
+            nplusone_detected.send(
+                sender=self,
+                exception=self.error_class(message),
+            )
+        return report
+
+
+def _combine_rules(rules: list[Optional[Rule]]) -> Optional[Rule]:
+    """
+    Picks the rule whose `raise` override applies to a report: any rule
+    that raises wins, and rules that don't raise only apply if every entry
+    has one.
+    """
+    for rule in rules:
+        if rule is not None and rule.should_raise:
+            return rule
+    if rules and all(
+        rule is not None and rule.should_raise is False for rule in rules
+    ):
+        return rules[0]
+    return None
+
+
+class SQLListener(NPlusOneListener):
+    """
+    Detects N+1s from the SQL that's executed rather than from ORM calls,
+    so that raw SQL, `.extra()` and direct manager calls are covered too.
+    Queries are counted per fingerprint and call site, and the fingerprint
+    is used as the field for thresholds and allowlists.
+    """
+
+    def notify(self, sql: str) -> Optional[CountsKey]:  # type: ignore[override]
+        parsed = parse_query(sql)
+        if parsed is None:
+            return None
+        model, fingerprint = parsed
+        return super().notify(model, fingerprint, None)
+
+    def _get_message(self, model: type[models.Model], field: str) -> str:
+        return (
+            f"N+1 detected on {model._meta.app_label}.{model.__name__} "
+            f"from SQL: {field}"
+        )
+
+
+def _format_cost(count: int, cost: Optional[QueryCost]) -> str:
+    time_ms = cost.time * 1000 if cost is not None else 0.0
+    rows = cost.rows if cost is not None else 0
+    return f": {count} queries, {time_ms:,.1f} ms DB time, {rows:,} rows"
+
+
+def record_cost(key: CountsKey, seconds: float = 0.0, rows: int = 0):
+    """
+    Adds the time and rows of a query to the cost of an N+1 key.
+    """
+    context = _nplusone_context.get()
+    cost = context.costs.get(key)
+    if cost is None:
+        costs = context.costs
+        max_keys = context.calls.max_keys
+        if max_keys is not None and len(costs) >= max_keys * 2:
+            # drop the costs of keys that the counters have evicted
+            for stale in [k for k in costs if k not in context.calls]:
+                del costs[stale]
+        cost = costs[key] = QueryCost()
+    cost.time += seconds
+    cost.rows += rows
+
+
+def _freeze_params(params) -> Hashable:
+    if isinstance(params, (list, tuple)):
+        params = tuple(params)
+    elif isinstance(params, dict):
+        params = tuple(sorted(params.items()))
+    try:
+        hash(params)
+    except TypeError:
+        # e.g. lists or dicts passed for JSON fields
+        return repr(params)
+    return params
+
+
+class DuplicateQueryListener(Listener):
+    """
+    Detects the same SELECT statement being run several times with the
+    same parameters in a zeal context.
+    """
+
+    @property
+    def error_class(self):
+        return DuplicateQueryError
+
+    def notify(self, sql: str, params):  # type: ignore[override]
+        context = _nplusone_context.get()
+        if context.pending:
+            _merge_pending(context)
+        parsed = parse_query(sql)
+        if parsed is None:
+            return
+        model, fingerprint = parsed
+        rule = self._get_rule(context, model, fingerprint)
+        if rule is not None and rule.silenced:
+            return
+        key = (sql, _freeze_params(params))
+        count = context.queries.record(key, [get_caller()])
+        if count >= self._get_threshold(context, rule):
+            self._alert(model, sql, params, context.queries.stacks(key), rule)
+
+    def notify_merged(
+        self,
+        context: NPlusOneContext,
+        child: NPlusOneContext,
+        key: tuple[str, Hashable],
+    ):
+        """
+        Checks `key` once the queries of `child` have been merged into
+        `context`, like `NPlusOneListener.notify_merged`.
+        """
+        sql, params = key
+        parsed = parse_query(sql)
+        if parsed is None:
+            return
+        model, fingerprint = parsed
+        rule = self._get_rule(child, model, fingerprint)
+        if rule is not None and rule.silenced:
+            return
+        child_count = child.queries[key]
+        count = context.queries[key] if key in context.queries else 0
+        if (
+            max(count - child_count, child_count)
+            < self._get_threshold(context, rule)
+            <= count
+        ):
+            self._alert(model, sql, params, context.queries.stacks(key), rule)
+
+    def _get_threshold(
+        self, context: NPlusOneContext, rule: Optional[Rule]
+    ) -> int:
+        if rule is not None and rule.threshold is not None:
+            return rule.threshold
+        assert context.duplicate_threshold is not None
+        return context.duplicate_threshold
+
+    def _alert(  # type: ignore[override]
+        self,
+        model: type[models.Model],
+        sql: str,
+        params,
+        calls: list,
+        rule: Optional[Rule] = None,
+    ):
+        message = (
+            f"Duplicate query detected on {model._meta.app_label}."
+            f"{model.__name__} ({len(calls)} times): {sql} with params "
+            f"{params!r}, run from:"
+        )
+        for [(filename, lineno, funcname)] in calls:
+            message += f"\n  {filename}:{lineno} in {funcname}"
+        [(filename, lineno, _)] = calls[-1]
+        self._raise_or_warn(message, rule, filename, lineno)
+        duplicate_query_detected.send(
+            sender=self,
+            exception=self.error_class(message),
+        )
+
+
+class UnusedPrefetchListener(Listener):
+    """
+    Reports prefetches whose results were never read, once the zeal context
+    they were fetched in ends.
+    """
+
+    @property
+    def error_class(self):
+        return UnusedPrefetchError
+
+    def notify(self, context: NPlusOneContext):  # type: ignore[override]
+        for record in context.prefetches:
+            if not record.used:
+                self._alert(record)
+
+    def _alert(self, record: PrefetchRecord):  # type: ignore[override]
+        model = record.model
+        filename, lineno, funcname = record.caller
+        message = (
+            f"Unused prefetch detected on {model._meta.app_label}."
+            f"{model.__name__}.{record.field}: "
+            f"prefetch_related({record.lookup!r}) at {filename}:{lineno} in "
+            f"{funcname} fetched {record.rows} rows that were never read"
+        )
+        self._raise_or_warn(message, None, filename, lineno)
+        unused_prefetch_detected.send(
+            sender=self,
+            exception=self.error_class(message),
+        )
+
+
+class OverfetchListener(Listener):
+    """
+    Reports call sites that loaded wide columns without ever reading them,
+    once the zeal context they were loaded in ends, along with the
+    `.only()` call that would have been enough.
+    """
+
+    @property
+    def error_class(self):
+        return OverfetchError
+
+    def notify(self, context: NPlusOneContext):  # type: ignore[override]
+        for usage in context.column_usage.values():
+            unread = [
+                field.name
+                for field in usage.wide
+                if field.attname in usage.loaded
+                and field.attname not in usage.read
+            ]
+            if unread:
+                self._alert(usage, unread)
+
+    def _alert(self, usage: ColumnUsage, unread: list[str]):  # type: ignore[override]
+        model = usage.model
+        filename, lineno, funcname = usage.caller
+        only = [model._meta.pk.name] + [
+            field.name
+            for field in model._meta.concrete_fields
+            if not field.primary_key
+            and (
+                field.attname in usage.read
+                or field.attname not in usage.tracked
+            )
+        ]
+        message = (
+            f"Over-fetched columns on {model._meta.app_label}."
+            f"{model.__name__} at {filename}:{lineno} in {funcname}: "
+            f"{', '.join(unread)} loaded but never read. "
+            f"Suggestion: .only({', '.join(repr(name) for name in only)})"
+        )
+        self._raise_or_warn(message, None, filename, lineno)
+        overfetch_detected.send(
+            sender=self,
+            exception=self.error_class(message),
+        )
+
+
+class QueryBudgetListener(Listener):
+    """
+    Reports zeal contexts that ran more queries than their budget allows,
+    once they end. The breakdown comes from the N+1 counters, so it shows
+    which relations the queries came from.
+    """
+
+    # how many call sites to list in the breakdown
+    max_breakdown = 10
+
+    @property
+    def error_class(self):
+        return QueryBudgetError
+
+    def notify(self, context: NPlusOneContext):  # type: ignore[override]
+        budget = context.budget
+        if budget is not None and budget.count > budget.limit:
+            self._alert(context, budget)
+
+    def _alert(self, context: NPlusOneContext, budget: QueryBudget):  # type: ignore[override]
+        message = (
+            f"Query budget exceeded: {budget.count} queries run, "
+            f"{budget.limit} allowed"
+        )
+        counts = sorted(
+            context.calls.items(), key=lambda item: item[1], reverse=True
+        )
+        if counts:
+            message += ". Queries by call site:"
+        shown = counts[: self.max_breakdown]
+        for (model, field_name, filename, lineno), count in shown:
+            label = f"{model._meta.app_label}.{model.__name__}"
+            # fields from the SQL listener are query fingerprints
+            if " " in field_name:
+                label = f"{label} from SQL: {field_name}"
+            else:
+                label = f"{label}.{field_name}"
+            message += f"\n  {count} x {label} at {filename}:{lineno}"
+        if len(counts) > self.max_breakdown:
+            message += (
+                f"\n  ...and {len(counts) - self.max_breakdown} more call "
+                "sites"
+            )
+        other = budget.count - sum(count for _, count in counts)
+        if counts and other > 0:
+            message += f"\n  {other} other queries"
+        if counts:
+            _, _, filename, lineno = counts[0][0]
+        else:
+            filename, lineno, _ = get_caller()
+        if budget.should_raise:
+            raise self.error_class(message)
+        self._raise_or_warn(message, None, filename, lineno)
+        query_budget_exceeded.send(
+            sender=self,
+            exception=self.error_class(message),
+        )
+
 
 n_plus_one_listener = NPlusOneListener()
+sql_listener = SQLListener()
+duplicate_query_listener = DuplicateQueryListener()
+unused_prefetch_listener = UnusedPrefetchListener()
+overfetch_listener = OverfetchListener()
+query_budget_listener = QueryBudgetListener()
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    zeal_context = _nplusone_context.get()
+    if not zeal_context.enabled:
+        return execute(sql, params, many, context)
+    if zeal_context.budget is not None:
+        zeal_context.budget.count += 1
+    key = None
+    if not many:
+        if zeal_context.detect_sql and not _in_tracked_query.get():
+            key = sql_listener.notify(sql)
+        if zeal_context.duplicate_threshold is not None:
+            duplicate_query_listener.notify(sql, params)
+    if not zeal_context.measure_queries:
+        return execute(sql, params, many, context)
+    orm_key = _query_key.get()
+    if orm_key is None and key is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        if orm_key is not None:
+            # the ORM counts the rows it loads itself
+            record_cost(orm_key, elapsed)
+        else:
+            rowcount = context["cursor"].rowcount
+            record_cost(key, elapsed, rowcount if rowcount > 0 else 0)  # type: ignore
+
+
+def _needs_sql_wrapper(context: NPlusOneContext) -> bool:
+    return (
+        context.detect_sql
+        or context.duplicate_threshold is not None
+        or context.measure_queries
+        or context.budget is not None
+    )
+
 
+# Whether `install()` has connected the SQL execute wrapper
+_sql_wrapper_connected = False
 
-def setup() -> Optional[Token]:
+
+def _add_sql_wrapper(connection, **kwargs):
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+def _add_sql_wrappers():
+    """
+    Adds the SQL execute wrapper to the current thread's connections that
+    don't have it yet, e.g. ones opened before zeal was installed.
+    """
+    if _sql_wrapper_connected:
+        for connection in connections.all():
+            _add_sql_wrapper(connection)
+
+
+def _connect_sql_wrapper():
+    """
+    Adds the SQL execute wrapper to every database connection, including
+    the ones that other threads open later: connections are per thread,
+    so e.g. the queries that async views run with `sync_to_async` use
+    other connections than the thread that enabled zeal. The wrapper stays
+    in place and checks the zeal context of each query, so it does next
+    to nothing outside of one.
+    """
+    global _sql_wrapper_connected
+    _sql_wrapper_connected = True
+    connection_created.connect(_add_sql_wrapper)
+    _add_sql_wrappers()
+
+
+def _disconnect_sql_wrapper():
+    """
+    Stops adding the SQL execute wrapper to new connections, and removes
+    it from the current thread's connections.
+    """
+    global _sql_wrapper_connected
+    _sql_wrapper_connected = False
+    connection_created.disconnect(_add_sql_wrapper)
+    for connection in connections.all():
+        if _execute_wrapper in connection.execute_wrappers:
+            connection.execute_wrappers.remove(_execute_wrapper)
+
+
+def _fork_context(context: NPlusOneContext) -> NPlusOneContext:
+    """
+    Returns the context for a task started in `context`: it counts its own
+    calls, so that each task is checked on its own until it's merged back
+    in, and shares everything that's reported on once the outer context
+    ends.
+    """
+    return replace(
+        context,
+        calls=context.calls.fork(),
+        ignored=context.ignored.fork(),
+        queries=context.queries.fork(),
+        costs={},
+        flagged={},
+        ignored_calls={},
+        budget=(
+            QueryBudget(context.budget.limit, context.budget.should_raise)
+            if context.budget is not None
+            else None
+        ),
+        pending=deque(),
+        outer=None,
+    )
+
+
+def _merge_context(context: NPlusOneContext, child: NPlusOneContext):
+    """
+    Rolls the counts of a finished task up into the context it was started
+    in.
+    """
+    _merge_pending(child)
+    context.calls.merge(child.calls)
+    context.queries.merge(child.queries)
+    if context.budget is not None and child.budget is not None:
+        context.budget.count += child.budget.count
+    context.ignored.update(child.ignored)
+    for key, count in child.ignored_calls.items():
+        context.ignored_calls[key] = context.ignored_calls.get(key, 0) + count
+    for key, child_cost in child.costs.items():
+        cost = context.costs.get(key)
+        if cost is None:
+            cost = context.costs[key] = QueryCost()
+        cost.time += child_cost.time
+        cost.rows += child_cost.rows
+    for key, (rule, suggestion, function, _) in child.flagged.items():
+        if key not in context.flagged:
+            context.flagged[key] = (rule, suggestion, function, context.calls)
+
+
+def _merge_pending(context: NPlusOneContext):
+    """
+    Merges the contexts that other threads have finished with, and reports
+    the N+1s and duplicate queries that only the merged counts reach. Only
+    the thread that owns `context` calls this, and `deque` appends and
+    pops are thread-safe, so the counters themselves never need a lock.
+    """
+    pending = context.pending
+    # a zeal_ignore() block's counts are thrown away when it ends, so
+    # work merged in the block is counted in the context outside of it
+    if context.outer is not None:
+        context = context.outer
+    while pending:
+        child = pending.popleft()
+        _merge_context(context, child)
+        for key in child.calls:
+            # fields from the SQL listener are query fingerprints
+            listener = sql_listener if " " in key[1] else n_plus_one_listener
+            listener.notify_merged(context, child, key)
+        if context.duplicate_threshold is not None:
+            for key in child.queries:
+                duplicate_query_listener.notify_merged(context, child, key)
+
+
+class _TaskFactory:
+    """
+    An asyncio task factory that gives every task started in a zeal
+    context its own copy of that context, and hands it back once the task
+    is done. It's merged in like the work of other threads (see
+    `_merge_pending`), so that N+1s that only the merged counts reach are
+    reported from the code that started the task rather than from a done
+    callback, where errors would only be logged.
+    """
+
+    __slots__ = ("previous",)
+
+    def __init__(self, previous):
+        self.previous = previous
+
+    def __call__(self, loop, coro, **kwargs):
+        context = _nplusone_context.get()
+        if not context.enabled or kwargs.get("context") is not None:
+            return self._create(loop, coro, **kwargs)
+        child = _fork_context(context)
+
+        def create():
+            _nplusone_context.set(child)
+            return self._create(loop, coro, **kwargs)
+
+        # tasks copy the context they're created in
+        task = copy_context().run(create)
+        task.add_done_callback(lambda _: context.pending.append(child))
+        return task
+
+    def _create(self, loop, coro, **kwargs):
+        if self.previous is not None:
+            return self.previous(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+
+def _install_task_factory():
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # not running in an event loop, e.g. in a sync view
+        return
+    if not isinstance(loop.get_task_factory(), _TaskFactory):
+        loop.set_task_factory(_TaskFactory(loop.get_task_factory()))
+
+
+# Set when the app is loaded with ZEAL_LAZY_PATCH, so that the ORM is only
+# patched once zeal is first enabled
+_install_on_setup = False
+_install_lock = threading.Lock()
+
+
+def _install_lazily():
+    global _install_on_setup
+    with _install_lock:
+        if _install_on_setup:
+            # imported here since it imports (and patches) a good part of
+            # the ORM
+            from .patch import install
+
+            install()
+            _install_on_setup = False
+
+
+def setup(
+    *,
+    raise_errors: Optional[bool] = None,
+    max_queries: Optional[int] = None,
+    report: Optional[bool] = None,
+) -> Optional[Token]:
+    """
+    Enables N+1 detection. If `raise_errors` is given, it takes precedence
+    over the ZEAL_RAISE setting until the matching `teardown()`, and
+    `max_queries` and `report` likewise take precedence over
+    ZEAL_MAX_QUERIES and ZEAL_REPORT.
+    """
+    if _install_on_setup:
+        _install_lazily()
     # if we're already in an ignore-context, we don't want to override
     # it.
     context = _nplusone_context.get()
-    if hasattr(settings, "ZEAL_ALLOWLIST"):
-        _validate_allowlist(settings.ZEAL_ALLOWLIST)
-    return _nplusone_context.set(
-        NPlusOneContext(enabled=True, allowlist=context.allowlist)
+    # validates ZEAL_ALLOWLIST the first time zeal is enabled
+    get_settings_allowlist()
+    max_keys = (
+        settings.ZEAL_MAX_KEYS if hasattr(settings, "ZEAL_MAX_KEYS") else None
+    )
+    if max_queries is None and hasattr(settings, "ZEAL_MAX_QUERIES"):
+        max_queries = settings.ZEAL_MAX_QUERIES
+    if report is None:
+        report = (
+            settings.ZEAL_REPORT if hasattr(settings, "ZEAL_REPORT") else False
+        )
+    new_context = NPlusOneContext(
+        enabled=True,
+        calls=CallStore(max_keys),
+        ignored=IgnoredKeys(max_keys),
+        allowlist=[*context.allowlist],
+        raise_errors=raise_errors,
+        detect_sql=(
+            settings.ZEAL_DETECT_SQL
+            if hasattr(settings, "ZEAL_DETECT_SQL")
+            else False
+        ),
+        duplicate_threshold=(
+            settings.ZEAL_DUPLICATE_QUERY_THRESHOLD
+            if hasattr(settings, "ZEAL_DUPLICATE_QUERY_THRESHOLD")
+            else None
+        ),
+        queries=CallStore(max_keys),
+        detect_unused_prefetches=(
+            settings.ZEAL_DETECT_UNUSED_PREFETCHES
+            if hasattr(settings, "ZEAL_DETECT_UNUSED_PREFETCHES")
+            else False
+        ),
+        detect_overfetching=(
+            settings.ZEAL_DETECT_OVERFETCHING
+            if hasattr(settings, "ZEAL_DETECT_OVERFETCHING")
+            else False
+        ),
+        measure_queries=(
+            settings.ZEAL_MEASURE_QUERIES
+            if hasattr(settings, "ZEAL_MEASURE_QUERIES")
+            else False
+        ),
+        report=report,
+        suggest_fixes=(
+            settings.ZEAL_SUGGEST_FIXES
+            if hasattr(settings, "ZEAL_SUGGEST_FIXES")
+            else False
+        ),
+        baseline=get_baseline(),
+        budget=QueryBudget(max_queries) if max_queries is not None else None,
     )
+    if _needs_sql_wrapper(new_context):
+        _add_sql_wrappers()
+    _install_task_factory()
+    return _nplusone_context.set(new_context)
 
 
-def teardown(token: Optional[Token] = None):
+def _reset(token: Optional[Token]):
     if token:
         _nplusone_context.reset(token)
     else:
         _nplusone_context.set(NPlusOneContext())
 
 
+def teardown(token: Optional[Token] = None) -> Optional[Report]:
+    """
+    Disables N+1 detection, after reporting anything that can only be
+    detected once the context is over (e.g. unused prefetches). In report
+    mode, returns the context's report.
+    """
+    context = _nplusone_context.get()
+    report = None
+    try:
+        _merge_pending(context)
+        if context.enabled and context.report:
+            report = n_plus_one_listener.report(context)
+        if context.enabled:
+            query_budget_listener.notify(context)
+        if context.enabled and context.detect_unused_prefetches:
+            unused_prefetch_listener.notify(context)
+        if context.enabled and context.detect_overfetching:
+            overfetch_listener.notify(context)
+    finally:
+        _reset(token)
+    return report
+
+
 @contextmanager
-def zeal_context():
-    token = setup()
+def zeal_context(
+    *,
+    raise_errors: Optional[bool] = None,
+    max_queries: Optional[int] = None,
+):
+    token = setup(raise_errors=raise_errors, max_queries=max_queries)
     try:
         yield
-    finally:
-        teardown(token)
+    except BaseException:
+        # don't report anything else on top of the error
+        _reset(token)
+        raise
+    teardown(token)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int):
+    """
+    Runs the block in a zeal context that raises a QueryBudgetError if it
+    runs more than `max_queries` queries, whatever ZEAL_RAISE is set to.
+    Unlike `assertNumQueries`, the error says where the queries came from.
+    """
+    with zeal_context(max_queries=max_queries):
+        _nplusone_context.get().budget.should_raise = True  # type: ignore
+        yield
+
+
+def get_memory_usage() -> int:
+    """
+    Returns an estimate, in bytes, of the memory that the current zeal
+    context uses to remember call sites, queries and ignored instances,
+    e.g. to pick a ZEAL_MAX_KEYS for long-running contexts. Returns 0
+    outside of a zeal context.
+    """
+    context = _nplusone_context.get()
+    if not context.enabled:
+        return 0
+    return (
+        context.calls.memory_usage()
+        + context.queries.memory_usage()
+        + context.ignored.memory_usage()
+    )
 
 
 @contextmanager
@@ -299,6 +1279,30 @@ def zeal_ignore(allowlist: Optional[list[AllowListEntry]] = None):
         calls=old_context.calls.copy(),
         ignored=old_context.ignored.copy(),
         allowlist=[*old_context.allowlist, *allowlist],
+        raise_errors=old_context.raise_errors,
+        detect_sql=old_context.detect_sql,
+        duplicate_threshold=old_context.duplicate_threshold,
+        queries=old_context.queries.copy(),
+        detect_unused_prefetches=old_context.detect_unused_prefetches,
+        detect_overfetching=old_context.detect_overfetching,
+        # shared with the outer context, which reports on them when it ends
+        prefetches=old_context.prefetches,
+        column_usage=old_context.column_usage,
+        column_reads=old_context.column_reads,
+        measure_queries=old_context.measure_queries,
+        costs=old_context.costs,
+        report=old_context.report,
+        flagged=old_context.flagged,
+        suggest_fixes=old_context.suggest_fixes,
+        baseline=old_context.baseline,
+        budget=old_context.budget,
+        # so that work handed off in here is merged into the outer context
+        # even if it finishes after the block
+        pending=old_context.pending,
+        outer=(
+            old_context.outer if old_context.outer is not None else old_context
+        ),
+        ignored_calls=dict(old_context.ignored_calls),
     )
     token = _nplusone_context.set(new_context)
     try:
@@ -1,25 +1,106 @@
-from asgiref.sync import iscoroutinefunction
+import random
+from contextlib import AbstractContextManager, ExitStack, nullcontext
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest
 from django.utils.decorators import sync_and_async_middleware
 
 from .listeners import zeal_context
 
 
-@sync_and_async_middleware
-def zeal_middleware(get_response):
-    if iscoroutinefunction(get_response):
+def _has_view_sample_rates() -> bool:
+    return hasattr(settings, "ZEAL_SAMPLE_RATES") and bool(
+        settings.ZEAL_SAMPLE_RATES
+    )
+
+
+def _get_sample_rate(view_name: Optional[str] = None) -> Optional[float]:
+    """
+    Returns the fraction of requests to the given URL name that zeal
+    should run on, or None if sampling is not configured (in which case
+    every request is checked).
+    """
+    if view_name is not None and _has_view_sample_rates():
+        if view_name in settings.ZEAL_SAMPLE_RATES:
+            return settings.ZEAL_SAMPLE_RATES[view_name]
+
+    if hasattr(settings, "ZEAL_SAMPLE_RATE"):
+        return settings.ZEAL_SAMPLE_RATE
+    return None
+
+
+def _sampled_context(sample_rate: Optional[float]) -> AbstractContextManager:
+    if sample_rate is None:
+        return zeal_context()
+    if random.random() >= sample_rate:
+        # unsampled requests never call setup()/teardown(), so the patched
+        # ORM sees zeal as disabled and takes its cheapest path.
+        return nullcontext()
+    # sampled requests are usually production traffic, so we report
+    # N+1s (via warnings and the nplusone_detected signal) but never
+    # fail the request.
+    return zeal_context(raise_errors=False)
+
+
+class _ZealMiddleware:
+    """
+    Runs each request in a zeal context. With per-URL sample rates
+    (ZEAL_SAMPLE_RATES), the context is only entered in `process_view`,
+    once Django has resolved the URL, so that the URL isn't resolved a
+    second time just to pick the rate.
+    """
 
-        async def async_middleware(request):
-            with zeal_context():
-                response = await get_response(request)
-            return response
+    def __init__(self, get_response):
+        self.get_response = get_response
 
-        return async_middleware
+    def _enter(self, request: HttpRequest, contexts: ExitStack):
+        if _has_view_sample_rates():
+            request._zeal_contexts = contexts  # type: ignore[attr-defined]
+        else:
+            contexts.enter_context(_sampled_context(_get_sample_rate()))
 
-    else:
+    def _enter_for_view(self, request: HttpRequest):
+        contexts = request.__dict__.pop("_zeal_contexts", None)
+        if contexts is not None:
+            match = request.resolver_match
+            view_name = match.view_name if match is not None else None
+            contexts.enter_context(
+                _sampled_context(_get_sample_rate(view_name))
+            )
 
-        def middleware(request):
-            with zeal_context():
-                response = get_response(request)
-            return response
 
-        return middleware
+class _SyncZealMiddleware(_ZealMiddleware):
+    def __call__(self, request: HttpRequest):
+        with ExitStack() as contexts:
+            self._enter(request, contexts)
+            response = self.get_response(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self._enter_for_view(request)
+
+
+class _AsyncZealMiddleware(_ZealMiddleware):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        markcoroutinefunction(self)
+
+    async def __call__(self, request: HttpRequest):
+        with ExitStack() as contexts:
+            self._enter(request, contexts)
+            response = await self.get_response(request)
+        return response
+
+    # async, so that it runs in the request's task and the zeal context
+    # it enters is the one the view sees
+    async def process_view(self, request, view_func, view_args, view_kwargs):
+        self._enter_for_view(request)
+
+
+@sync_and_async_middleware
+def zeal_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        return _AsyncZealMiddleware(get_response)
+    return _SyncZealMiddleware(get_response)
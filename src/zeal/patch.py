@@ -1,22 +1,38 @@
 import functools
 import importlib
-import inspect
+import weakref
 from contextvars import ContextVar
-from typing import Any, Callable, Optional, TypedDict, Union
+from typing import Any, Callable, Optional, Union
 
+from django.apps import apps
 from django.db import models
+from django.db.models.constants import LOOKUP_SEP
 from django.db.models.fields.related_descriptors import (
     ForwardManyToOneDescriptor,
     ReverseOneToOneDescriptor,
     create_forward_many_to_many_manager,
     create_reverse_many_to_one_manager,
 )
-from django.db.models.query import QuerySet
+from django.db.models.query import ModelIterable, QuerySet
 from django.db.models.query_utils import DeferredAttribute
-
-from zeal.util import is_single_query
-
-from .listeners import QuerySource, n_plus_one_listener
+from django.utils.functional import cached_property
+
+from zeal.util import get_caller, is_single_query
+
+from .listeners import (
+    ColumnUsage,
+    InstanceKey,
+    PrefetchRecord,
+    QuerySource,
+    _connect_sql_wrapper,
+    _disconnect_sql_wrapper,
+    _nplusone_context,
+    _query_key,
+    n_plus_one_listener,
+    record_cost,
+)
+from .sql import _in_tracked_query
+from .suggestions import get_origin, tag_instances
 
 # Set to True while inside Django's internal prefetch path
 # (QuerySet._prefetch_related_objects or the query module's
@@ -43,29 +59,45 @@ _in_prefetch_queryset: ContextVar[bool] = ContextVar(
 # instead of on the resolved model's .get().
 _in_gfk_get: ContextVar[bool] = ContextVar("_in_gfk_get", default=False)
 
+# The (filename, lineno, funcname) that called `.prefetch_related()` on
+# the queryset whose prefetches are currently being fetched, if known.
+_prefetch_site: ContextVar[Optional[tuple[str, int, str]]] = ContextVar(
+    "_prefetch_site", default=None
+)
+
+# The queryset being evaluated by the patched `_fetch_all`, and what its
+# parser returned, so that its instances can be tagged with their origin
+# before their prefetches are fetched.
+_fetching: ContextVar[Optional[tuple[QuerySet, Optional[QuerySource]]]] = (
+    ContextVar("_fetching", default=None)
+)
 
-class QuerysetContext(TypedDict):
-    args: Optional[Any]
-    kwargs: Optional[Any]
+_MISSING = object()
 
-    # Used by managers built via factory functions like
-    # create_forward_many_to_many_manager, create_reverse_many_to_one_manager,
-    # and create_generic_related_manager. Contains the call args captured at
-    # factory invocation time.
-    manager_call_args: Optional[dict[str, Any]]
+# (owner, attribute name, original value) for every patch applied by
+# install(), in the order they were applied. uninstall() walks this in
+# reverse to put the original Django callables back.
+_installed_patches: list[tuple[Any, str, Any]] = []
+_installed = False
 
-    # used by ReverseManyToOne. a django model instance.
-    instance: Optional[models.Model]
+# Patched related manager classes, keyed on the Django factory function
+# that built them and the arguments it was called with.
+_manager_classes: dict[tuple, type] = {}
 
 
-Parser = Callable[[QuerysetContext], QuerySource]
+# Turns the object that built a tracked queryset (a relation descriptor
+# or related manager) and the instance it was built for into a
+# QuerySource.
+Parser = Callable[[Any, Optional[models.Model]], QuerySource]
 
 
 def get_instance_key(
-    instance: Union[models.Model, dict[str, Any]],
-) -> Optional[str]:
+    instance: Union[models.Model, dict[str, Any], None],
+) -> Optional[InstanceKey]:
     if isinstance(instance, models.Model):
-        return f"{instance.__class__.__name__}:{instance.pk}"
+        # the model class itself (rather than its name) tells apart models
+        # with the same name in different apps
+        return (instance.__class__, instance.pk)
     else:
         # when calling a queryset with `.values(...).get()`, the instance
         # we get here may be a dict. we don't handle that case formally,
@@ -73,87 +105,83 @@ def get_instance_key(
         return None
 
 
+def _patch_attribute(owner: Any, name: str, value: Any):
+    _installed_patches.append((owner, name, vars(owner).get(name, _MISSING)))
+    setattr(owner, name, value)
+
+
 def patch_module_function(original, patched):
     module = importlib.import_module(original.__module__)
-    setattr(module, original.__name__, patched)
-
+    _patch_attribute(module, original.__name__, patched)
 
-def patch_queryset_fetch_all(
-    queryset: models.QuerySet, parser: Parser, context: QuerysetContext
-):
-    fetch_all = queryset._fetch_all
-
-    def wrapper(*args, **kwargs):
-        if (
-            queryset._result_cache is None
-            and not _in_prefetch_queryset.get()
-            and not getattr(queryset, "__zeal_skip_notify", False)
-        ):
-            parsed = parser(context)
-            n_plus_one_listener.notify(
-                parsed["model"],
-                parsed["field"],
-                parsed["instance_key"],
-            )
-        return fetch_all(*args, **kwargs)
 
-    return wrapper
+def track_queryset(
+    queryset: models.QuerySet,
+    parser: Parser,
+    owner: Any,
+    instance: Optional[models.Model],
+) -> models.QuerySet:
+    """
+    Marks a related queryset so that evaluating it, or any queryset cloned
+    from it, notifies the N+1 listener. The patched QuerySet methods in
+    `patch_global_queryset` do the rest, so no per-queryset functions are
+    created.
+    """
+    # don't overwrite the source of a queryset we're already tracking,
+    # and leave querysets built while zeal is disabled untouched.
+    if queryset._zeal_source is None and _nplusone_context.get().enabled:  # type: ignore
+        queryset._zeal_source = (parser, owner, instance)  # type: ignore
+    return queryset
 
 
 def patch_queryset_function(
-    queryset_func: Callable[..., models.QuerySet],
-    parser: Parser,
-    context: Optional[QuerysetContext] = None,
+    queryset_func: Callable[..., models.QuerySet], parser: Parser
 ):
-    if context is None:
-        context = {
-            "args": None,
-            "kwargs": None,
-            "manager_call_args": None,
-            "instance": None,
-        }
+    """
+    Wraps a relation descriptor's `get_queryset(**hints)`.
+    """
 
-    def wrapper(*args, **kwargs):
-        queryset = queryset_func(*args, **kwargs)
+    def wrapper(self, *args, **kwargs):
+        # `get_queryset` can in some cases be called without an instance
+        # hint. In those cases, we ignore the instance.
+        return track_queryset(
+            queryset_func(self, *args, **kwargs),
+            parser,
+            self,
+            kwargs.get("instance"),
+        )
 
-        # don't patch the same queryset more than once
-        if (
-            hasattr(queryset, "__zeal_patched") and queryset.__zeal_patched  # type: ignore
-        ):
-            return queryset
+    return wrapper
 
-        if args and args != context.get("args"):
-            context["args"] = args
 
-        # When comparing kwargs, we must use id() rather than == because
-        # __eq__ methods on model instances can trigger infinite recursion.
-        if kwargs:
-            existing_kwargs = context.get("kwargs")
-            if existing_kwargs is None or any(
-                id(v) != id(existing_kwargs.get(k)) for k, v in kwargs.items()
-            ):
-                context["kwargs"] = kwargs
+def patch_manager_get_queryset(manager: type, parser: Parser):
+    """
+    Wraps `get_queryset()` on a related manager class built by one of
+    Django's manager factories. The manager is the queryset's owner, and
+    its `instance` is the model instance the relation was accessed on.
+    """
+    get_queryset = manager.get_queryset
 
-        queryset._clone = patch_queryset_function(  # type: ignore
-            queryset._clone,  # type: ignore
-            parser,
-            context=context,
-        )
-        queryset._fetch_all = patch_queryset_fetch_all(
-            queryset, parser, context
-        )
-        queryset.__zeal_patched = True  # type: ignore
-        return queryset
+    def wrapper(self):
+        queryset = get_queryset(self)
+        record = queryset._zeal_prefetch  # type: ignore
+        if record is not None and not _in_queryset_prefetch.get():
+            # this is the prefetched cache, and it's being read
+            record.used = True
+        return track_queryset(queryset, parser, self, self.instance)
 
-    return wrapper
+    manager.get_queryset = wrapper  # type: ignore
 
 
-def _wrap_prefetch(target, notify_fn):
+def _wrap_prefetch(target, notify_fn, setter=setattr):
     """Notify on per-instance prefetch_related_objects() calls.
 
     Wraps get_prefetch_querysets (Django 5.0+) when present, else
     the deprecated singular form. Only fires for single-instance
     calls; bulk prefetches are correct usage.
+
+    `setter` is used to apply the patch; pass `_patch_attribute` for
+    Django's own classes so that uninstall() can revert it.
     """
     attr_name = (
         "get_prefetch_querysets"
@@ -163,17 +191,26 @@ def _wrap_prefetch(target, notify_fn):
     original = getattr(target, attr_name)
 
     def patched(self, instances, *args, **kwargs):
-        if not _in_queryset_prefetch.get() and len(instances) == 1:
+        notify = not _in_queryset_prefetch.get() and len(instances) == 1
+        if notify:
             notify_fn(self, instances[0])
         token = _in_prefetch_queryset.set(True)
+        # the prefetch query is the one just reported, so the SQL listener
+        # shouldn't count it again, whether it runs in here (as for reverse
+        # foreign keys) or once the caller evaluates the queryset
+        tracked_token = _in_tracked_query.set(True) if notify else None
         try:
             result = original(self, instances, *args, **kwargs)
         finally:
+            if tracked_token is not None:
+                _in_tracked_query.reset(tracked_token)
             _in_prefetch_queryset.reset(token)
-        result[0].__zeal_skip_notify = True  # type: ignore
+        result[0]._zeal_skip_notify = True  # type: ignore
+        if notify:
+            result[0]._zeal_reported = True  # type: ignore
         return result
 
-    setattr(target, attr_name, patched)
+    setter(target, attr_name, patched)
 
 
 def patch_forward_many_to_one_descriptor():
@@ -182,25 +219,22 @@ def patch_forward_many_to_one_descriptor():
     a subclass of ForwardManyToOneDescriptor.
     """
 
-    def parser(context: QuerysetContext) -> QuerySource:
-        assert "args" in context and context["args"] is not None
-        descriptor = context["args"][0]
-
-        if "kwargs" in context and context["kwargs"] is not None:
-            instance = context["kwargs"]["instance"]
-            instance_key = get_instance_key(instance)
-        else:
-            # `get_queryset` can in some cases be called without any
-            # kwargs. In those cases, we ignore the instance.
-            instance_key = None
+    def parser(
+        descriptor: ForwardManyToOneDescriptor,
+        instance: Optional[models.Model],
+    ) -> QuerySource:
         return {
             "model": descriptor.field.model,
             "field": descriptor.field.name,
-            "instance_key": instance_key,
+            "instance_key": get_instance_key(instance),
         }
 
-    ForwardManyToOneDescriptor.get_queryset = patch_queryset_function(
-        ForwardManyToOneDescriptor.get_queryset, parser=parser
+    _patch_attribute(
+        ForwardManyToOneDescriptor,
+        "get_queryset",
+        patch_queryset_function(
+            ForwardManyToOneDescriptor.get_queryset, parser=parser
+        ),
     )
 
     _wrap_prefetch(
@@ -209,75 +243,74 @@ def patch_forward_many_to_one_descriptor():
             self.field.model,
             self.field.name,
             instance_key=get_instance_key(instance),
+            instance=instance,
         ),
+        setter=_patch_attribute,
     )
 
 
+def get_related_field_name(
+    related_name: Optional[str], related_model: type[models.Model]
+) -> str:
+    return related_name or f"{related_model._meta.model_name}_set"
+
+
 def parse_related_parts(
     model: type[models.Model],
     related_name: Optional[str],
     related_model: type[models.Model],
 ) -> tuple[type[models.Model], str]:
-    field_name = related_name or f"{related_model._meta.model_name}_set"
-    return (model, field_name)
+    return (model, get_related_field_name(related_name, related_model))
+
+
+def _get_manager_class(key: tuple, build: Callable[[], type]) -> type:
+    """
+    Returns the patched manager class for the given factory arguments,
+    building it on first use. Django calls its manager factories once per
+    descriptor, and again whenever a related manager is called with a
+    custom `manager=`, so this saves redoing the same work for the same
+    relation.
+    """
+    manager = _manager_classes.get(key)
+    if manager is None:
+        manager = _manager_classes[key] = build()
+    return manager
 
 
 def patch_reverse_many_to_one_descriptor():
-    def parser(context: QuerysetContext) -> QuerySource:
-        assert (
-            "manager_call_args" in context
-            and context["manager_call_args"] is not None
-            and "rel" in context["manager_call_args"]
-        )
-        assert "instance" in context and context["instance"] is not None
-        rel = context["manager_call_args"]["rel"]
+    def build_manager(superclass: type, rel) -> type:
+        manager = create_reverse_many_to_one_manager(superclass, rel)
         model, field = parse_related_parts(
             rel.model, rel.related_name, rel.related_model
         )
-        return {
-            "model": model,
-            "field": field,
-            "instance_key": get_instance_key(context["instance"]),
-        }
-
-    def patched_create_reverse_many_to_one_manager(*args, **kwargs):
-        manager_call_args = inspect.getcallargs(
-            create_reverse_many_to_one_manager, *args, **kwargs
-        )
-        manager = create_reverse_many_to_one_manager(*args, **kwargs)
-
-        def patch_init_method(func):
-            @functools.wraps(func)
-            def wrapper(self, instance):
-                self.get_queryset = patch_queryset_function(
-                    self.get_queryset,
-                    parser,
-                    context={
-                        "args": None,
-                        "kwargs": None,
-                        "manager_call_args": manager_call_args,
-                        "instance": instance,
-                    },
-                )
-                return func(self, instance)
 
-            return wrapper
+        def parser(manager, instance: Optional[models.Model]) -> QuerySource:
+            return {
+                "model": model,
+                "field": field,
+                "instance_key": get_instance_key(instance),
+            }
 
-        manager.__init__ = patch_init_method(manager.__init__)  # type: ignore
+        patch_manager_get_queryset(manager, parser)
 
         def notify_fn(self, instance):
-            rel = manager_call_args["rel"]
-            model, field_name = parse_related_parts(
-                rel.model, rel.related_name, rel.related_model
-            )
             n_plus_one_listener.notify(
-                model, field_name, instance_key=get_instance_key(instance)
+                model,
+                field,
+                instance_key=get_instance_key(instance),
+                instance=instance,
             )
 
         _wrap_prefetch(manager, notify_fn)
 
         return manager
 
+    def patched_create_reverse_many_to_one_manager(superclass, rel):
+        return _get_manager_class(
+            (create_reverse_many_to_one_manager, superclass, rel),
+            lambda: build_manager(superclass, rel),
+        )
+
     patch_module_function(
         create_reverse_many_to_one_manager,
         patched_create_reverse_many_to_one_manager,
@@ -285,23 +318,23 @@ def patch_reverse_many_to_one_descriptor():
 
 
 def patch_reverse_one_to_one_descriptor():
-    def parser(context: QuerysetContext) -> QuerySource:
-        assert "args" in context and context["args"] is not None
-        descriptor = context["args"][0]
+    def parser(
+        descriptor: ReverseOneToOneDescriptor,
+        instance: Optional[models.Model],
+    ) -> QuerySource:
         field = descriptor.related.field
-        if "kwargs" in context and context["kwargs"] is not None:
-            instance = context["kwargs"]["instance"]
-            instance_key = get_instance_key(instance)
-        else:
-            instance_key = None
         return {
             "model": field.related_model,
             "field": field.remote_field.name,
-            "instance_key": instance_key,
+            "instance_key": get_instance_key(instance),
         }
 
-    ReverseOneToOneDescriptor.get_queryset = patch_queryset_function(
-        ReverseOneToOneDescriptor.get_queryset, parser
+    _patch_attribute(
+        ReverseOneToOneDescriptor,
+        "get_queryset",
+        patch_queryset_function(
+            ReverseOneToOneDescriptor.get_queryset, parser
+        ),
     )
 
     _wrap_prefetch(
@@ -310,84 +343,52 @@ def patch_reverse_one_to_one_descriptor():
             self.related.field.related_model,
             self.related.field.remote_field.name,
             instance_key=get_instance_key(instance),
+            instance=instance,
         ),
+        setter=_patch_attribute,
     )
 
 
 def patch_many_to_many_descriptor():
-    def parser(context: QuerysetContext) -> QuerySource:
-        assert (
-            "manager_call_args" in context
-            and context["manager_call_args"] is not None
-            and "rel" in context["manager_call_args"]
-        )
-        assert "instance" in context and context["instance"] is not None
-        rel = context["manager_call_args"]["rel"]
-        instance = context["instance"]
-        model = instance.__class__
-        is_reverse = context["manager_call_args"]["reverse"]
-        if is_reverse:
-            field_name = rel.related_name
+    def build_manager(superclass: type, rel, reverse: bool) -> type:
+        manager = create_forward_many_to_many_manager(superclass, rel, reverse)
+        if reverse:
+            related_name = rel.related_name
             related_model = rel.related_model
         else:
-            field_name = rel.field.name
+            related_name = rel.field.name
             related_model = rel.model
+        # the model is only known once we have an instance
+        field = get_related_field_name(related_name, related_model)
 
-        model, field_name = parse_related_parts(
-            model, field_name, related_model
-        )
-        return {
-            "model": model,
-            "field": field_name,
-            "instance_key": get_instance_key(instance),
-        }
-
-    def patched_create_forward_many_to_many_manager(*args, **kwargs):
-        manager_call_args = inspect.getcallargs(
-            create_forward_many_to_many_manager, *args, **kwargs
-        )
-        manager = create_forward_many_to_many_manager(*args, **kwargs)
-
-        def patch_init_method(func):
-            @functools.wraps(func)
-            def wrapper(self, instance):
-                self.get_queryset = patch_queryset_function(
-                    self.get_queryset,
-                    parser,
-                    context={
-                        "args": None,
-                        "kwargs": None,
-                        "manager_call_args": manager_call_args,
-                        "instance": instance,
-                    },
-                )
-                return func(self, instance)
-
-            return wrapper
+        def parser(manager, instance: Optional[models.Model]) -> QuerySource:
+            assert instance is not None
+            return {
+                "model": instance.__class__,
+                "field": field,
+                "instance_key": get_instance_key(instance),
+            }
 
-        manager.__init__ = patch_init_method(manager.__init__)  # type: ignore
+        patch_manager_get_queryset(manager, parser)
 
         def notify_fn(self, instance):
-            rel = manager_call_args["rel"]
-            is_reverse = manager_call_args["reverse"]
-            if is_reverse:
-                field_name = rel.related_name
-                related_model = rel.related_model
-            else:
-                field_name = rel.field.name
-                related_model = rel.model
-            model = instance.__class__
-            model, field_name = parse_related_parts(
-                model, field_name, related_model
-            )
             n_plus_one_listener.notify(
-                model, field_name, instance_key=get_instance_key(instance)
+                instance.__class__,
+                field,
+                instance_key=get_instance_key(instance),
+                instance=instance,
             )
 
         _wrap_prefetch(manager, notify_fn)
 
         return manager
 
+    def patched_create_forward_many_to_many_manager(superclass, rel, reverse):
+        return _get_manager_class(
+            (create_forward_many_to_many_manager, superclass, rel, reverse),
+            lambda: build_manager(superclass, rel, reverse),
+        )
+
     patch_module_function(
         create_forward_many_to_many_manager,
         patched_create_forward_many_to_many_manager,
@@ -409,19 +410,28 @@ def patch_generic_foreign_key():
     def patched_get(self, instance, cls=None):
         if instance is None:
             return original_get(self, instance, cls)
+        key = None
         if _would_hit_db(self, instance):
-            n_plus_one_listener.notify(
+            key = n_plus_one_listener.notify(
                 instance.__class__,
                 self.name,
                 instance_key=get_instance_key(instance),
+                instance=instance,
             )
         token = _in_gfk_get.set(True)
+        key_token = (
+            _query_key.set(key)
+            if key is not None and _nplusone_context.get().measure_queries
+            else None
+        )
         try:
             return original_get(self, instance, cls)
         finally:
+            if key_token is not None:
+                _query_key.reset(key_token)
             _in_gfk_get.reset(token)
 
-    GenericForeignKey.__get__ = patched_get  # type: ignore
+    _patch_attribute(GenericForeignKey, "__get__", patched_get)
 
 
 def patch_generic_related_manager():
@@ -429,58 +439,38 @@ def patch_generic_related_manager():
         create_generic_related_manager,
     )
 
-    def parser(context: QuerysetContext) -> QuerySource:
-        assert (
-            "manager_call_args" in context
-            and context["manager_call_args"] is not None
-            and "rel" in context["manager_call_args"]
-        )
-        assert "instance" in context and context["instance"] is not None
-        rel = context["manager_call_args"]["rel"]
-        instance = context["instance"]
-        return {
-            "model": instance.__class__,
-            "field": rel.field.name,
-            "instance_key": get_instance_key(instance),
-        }
+    def build_manager(superclass: type, rel) -> type:
+        manager = create_generic_related_manager(superclass, rel)
+        field = rel.field.name
 
-    def patched_create_generic_related_manager(*args, **kwargs):
-        manager_call_args = inspect.getcallargs(
-            create_generic_related_manager, *args, **kwargs
-        )
-        manager = create_generic_related_manager(*args, **kwargs)
-
-        def patch_init_method(func):
-            @functools.wraps(func)
-            # instance=None mirrors GenericRelatedObjectManager.__init__'s signature
-            def wrapper(self, instance=None):
-                self.get_queryset = patch_queryset_function(
-                    self.get_queryset,
-                    parser,
-                    context={
-                        "args": None,
-                        "kwargs": None,
-                        "manager_call_args": manager_call_args,
-                        "instance": instance,
-                    },
-                )
-                return func(self, instance)
-
-            return wrapper
+        def parser(manager, instance: Optional[models.Model]) -> QuerySource:
+            assert instance is not None
+            return {
+                "model": instance.__class__,
+                "field": field,
+                "instance_key": get_instance_key(instance),
+            }
 
-        manager.__init__ = patch_init_method(manager.__init__)  # type: ignore
+        patch_manager_get_queryset(manager, parser)
 
         def notify_fn(self, instance):
             n_plus_one_listener.notify(
                 instance.__class__,
-                manager_call_args["rel"].field.name,
+                field,
                 instance_key=get_instance_key(instance),
+                instance=instance,
             )
 
         _wrap_prefetch(manager, notify_fn)
 
         return manager
 
+    def patched_create_generic_related_manager(superclass, rel):
+        return _get_manager_class(
+            (create_generic_related_manager, superclass, rel),
+            lambda: build_manager(superclass, rel),
+        )
+
     patch_module_function(
         create_generic_related_manager,
         patched_create_generic_related_manager,
@@ -494,75 +484,325 @@ def patch_deferred_attribute():
             result = func(self, instance, *args, **kwargs)
             if result is None:
                 n_plus_one_listener.notify(
-                    instance.__class__, self.field.name, str(instance.pk)
+                    instance.__class__,
+                    self.field.name,
+                    get_instance_key(instance),
                 )
             return result
 
         return wrapper
 
-    DeferredAttribute._check_parent_chain = patched_check_parent_chain(  # type: ignore
-        DeferredAttribute._check_parent_chain  # type: ignore
+    _patch_attribute(
+        DeferredAttribute,
+        "_check_parent_chain",
+        patched_check_parent_chain(DeferredAttribute._check_parent_chain),  # type: ignore
     )
 
+    original_get = DeferredAttribute.__get__
+
+    def patched_get(self, instance, cls=None):
+        if instance is None:
+            return self
+        attname = self.field.attname
+        if _tracking_reads and attname in instance.__dict__:
+            reads = _nplusone_context.get().column_reads
+            if reads:
+                entry = reads.get(id(instance))
+                if entry is not None and entry[0]() is instance:
+                    entry[1].read.add(attname)
+        return original_get(self, instance, cls)
+
+    _patch_attribute(DeferredAttribute, "__get__", patched_get)
+
+
+# Whether `DeferredAttribute` has been made a data descriptor
+_tracking_reads = False
+
+
+def _track_reads():
+    """
+    Makes `DeferredAttribute` a data descriptor, so that reading a column
+    that's already loaded goes through its (patched) `__get__` instead of
+    straight to the instance's `__dict__`. Only done the first time
+    overfetching is tracked, since it makes every column read slower.
+    """
+    global _tracking_reads
+    if _tracking_reads:
+        return
+
+    def patched_set(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+    def patched_delete(self, instance):
+        try:
+            del instance.__dict__[self.field.attname]
+        except KeyError:
+            raise AttributeError(self.field.attname) from None
+
+    _patch_attribute(DeferredAttribute, "__set__", patched_set)
+    _patch_attribute(DeferredAttribute, "__delete__", patched_delete)
+    _tracking_reads = True
+
+
+_WIDE_FIELDS = (models.TextField, models.JSONField, models.BinaryField)
+
+# model -> (attnames of the concrete non-pk fields we can track, wide
+# fields among them)
+_model_columns: dict[type[models.Model], tuple[list[str], list]] = {}
+
+
+def _get_model_columns(model: type[models.Model]) -> tuple[list[str], list]:
+    columns = _model_columns.get(model)
+    if columns is None:
+        fields = [
+            field
+            for field in model._meta.concrete_fields
+            if not field.primary_key
+            # fields that change their value on save (e.g. auto_now) must
+            # stay loaded, since save() skips fields that look deferred
+            and type(field).pre_save is models.Field.pre_save
+        ]
+        columns = _model_columns[model] = (
+            [field.attname for field in fields],
+            [field for field in fields if isinstance(field, _WIDE_FIELDS)],
+        )
+    return columns
+
+
+def _track_columns(queryset: QuerySet, context):
+    """
+    Registers freshly fetched instances in the context's `column_reads`,
+    so that the patched `DeferredAttribute.__get__` notes which of their
+    columns are read. Only done for querysets of models with wide columns
+    that aren't allowlisted. The instances themselves are left untouched.
+    """
+    if queryset._iterable_class is not ModelIterable:  # type: ignore
+        return
+    instances = queryset._result_cache
+    if not instances:
+        return
+    model = queryset.model
+    attnames, wide = _get_model_columns(model)
+    if not wide:
+        return
+    caller = get_caller()
+    key = (model, caller)
+    usage = context.column_usage.get(key)
+    if usage is None:
+        usage = context.column_usage[key] = ColumnUsage(
+            model,
+            caller,
+            attnames,
+            [
+                field
+                for field in wide
+                if not _is_silenced(context, model, field.name)
+            ],
+        )
+    if not usage.wide:
+        return
+    _track_reads()
+    # every instance of a queryset has the same columns loaded
+    loaded = instances[0].__dict__
+    usage.loaded.update(attname for attname in attnames if attname in loaded)
+    reads = context.column_reads
+
+    def forget(ref: weakref.KeyedRef):
+        # the id may have been taken by a newer instance since
+        entry = reads.get(ref.key)
+        if entry is not None and entry[0] is ref:
+            del reads[ref.key]
+
+    for instance in instances:
+        entry = reads.get(id(instance))
+        if entry is not None and entry[0]() is instance:
+            continue
+        reads[id(instance)] = (
+            weakref.KeyedRef(instance, forget, id(instance)),
+            usage,
+        )
+
+
+def _is_silenced(context, model: type[models.Model], field: str) -> bool:
+    rule = n_plus_one_listener._get_rule(context, model, field)
+    return rule is not None and rule.silenced
+
 
 def patch_global_queryset():
     """
     We patch `_fetch_all` and `.get()` on querysets to let us ignore singly-loaded
     instances. We don't want to trigger N+1 errors from such instances because of
     the high false positive rate.
+
+    `_fetch_all` also notifies the listener when a queryset tracked by
+    `track_queryset` is evaluated, and `_clone` carries that tracking over
+    to querysets derived from it (e.g. via `.filter()`).
     """
 
+    # Class-level defaults, so that untracked querysets need no
+    # per-instance state.
+    _patch_attribute(QuerySet, "_zeal_source", None)
+    _patch_attribute(QuerySet, "_zeal_skip_notify", False)
+    _patch_attribute(QuerySet, "_zeal_reported", False)
+    # the PrefetchRecord of a queryset that holds prefetched results, and
+    # where `.prefetch_related()` was called on a queryset
+    _patch_attribute(QuerySet, "_zeal_prefetch", None)
+    _patch_attribute(QuerySet, "_zeal_prefetch_site", None)
+    # whether a tracked queryset was derived from the related manager's
+    # queryset, e.g. with `.filter()`, rather than evaluated as is
+    _patch_attribute(QuerySet, "_zeal_derived", False)
+
+    def patch_clone(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            clone = func(self, *args, **kwargs)
+            source = self._zeal_source
+            if source is not None:
+                clone._zeal_source = source
+                clone._zeal_derived = True
+            site = self._zeal_prefetch_site
+            if site is not None:
+                clone._zeal_prefetch_site = site
+            return clone
+
+        return wrapper
+
+    _patch_attribute(QuerySet, "_clone", patch_clone(QuerySet._clone))  # type: ignore
+
     def patch_fetch_all(func):
         @functools.wraps(func)
         def wrapper(self, *args, **kwargs):
-            should_ignore = (
-                is_single_query(self.query) and self._result_cache is None
+            context = _nplusone_context.get()
+            if not context.enabled:
+                return func(self, *args, **kwargs)
+            if self._result_cache is not None:
+                return func(self, *args, **kwargs)
+            source = self._zeal_source
+            parsed = None
+            key = None
+            if (
+                source is not None
+                and not self._zeal_skip_notify
+                and not _in_prefetch_queryset.get()
+            ):
+                parser, owner, instance = source
+                parsed = parser(owner, instance)
+                key = n_plus_one_listener.notify(
+                    parsed["model"],
+                    parsed["field"],
+                    parsed["instance_key"],
+                    instance=instance,
+                    filtered=self._zeal_derived,
+                )
+            should_ignore = is_single_query(self.query)
+            should_tag = context.suggest_fixes and (
+                source is None or parsed is not None
             )
-            ret = func(self, *args, **kwargs)  # call the original _fetch_all
+            fetching_token = _fetching.set(
+                (self, parsed) if should_tag else None
+            )
+            key_token = (
+                _query_key.set(key)
+                if key is not None and context.measure_queries
+                else None
+            )
+            # call the original _fetch_all
+            try:
+                if context.detect_sql and (
+                    source is not None or self._zeal_reported
+                ):
+                    token = _in_tracked_query.set(True)
+                    try:
+                        ret = func(self, *args, **kwargs)
+                    finally:
+                        _in_tracked_query.reset(token)
+                else:
+                    ret = func(self, *args, **kwargs)
+            finally:
+                if key_token is not None:
+                    _query_key.reset(key_token)
+                _fetching.reset(fetching_token)
+            if key_token is not None:
+                record_cost(key, rows=len(self._result_cache))  # type: ignore
             if should_ignore and len(self) > 0:
-                n_plus_one_listener.ignore(get_instance_key(self[0]))
+                n_plus_one_listener.ignore(get_instance_key(self[0]), self[0])
+            if should_tag and not self._prefetch_related_lookups:
+                _tag_origin(self, parsed)
+            if context.detect_overfetching:
+                _track_columns(self, context)
             return ret
 
         return wrapper
 
-    QuerySet._fetch_all = patch_fetch_all(QuerySet._fetch_all)
+    _patch_attribute(
+        QuerySet, "_fetch_all", patch_fetch_all(QuerySet._fetch_all)
+    )
 
     def patch_get(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            context = _nplusone_context.get()
+            if not context.enabled:
+                return func(*args, **kwargs)
             qs = args[0]
             # Detect N+1 on standalone .get() calls (e.g. in a loop).
             # Skip if the queryset is already tracked via a relation descriptor,
             # or if we're resolving a GenericForeignKey (its own patch reports
             # the N+1 on the parent model's GFK field instead).
-            if (
-                not getattr(qs, "__zeal_patched", False)
-                and not _in_gfk_get.get()
-            ):
-                n_plus_one_listener.notify(
+            key = None
+            if qs._zeal_source is None and not _in_gfk_get.get():
+                key = n_plus_one_listener.notify(
                     qs.model,
                     "get()",
                     instance_key=None,
                 )
-            ret = func(*args, **kwargs)
-            n_plus_one_listener.ignore(get_instance_key(ret))
+            key_token = (
+                _query_key.set(key)
+                if key is not None and context.measure_queries
+                else None
+            )
+            try:
+                if context.detect_sql:
+                    # the N+1 (if any) was reported above
+                    token = _in_tracked_query.set(True)
+                    try:
+                        ret = func(*args, **kwargs)
+                    finally:
+                        _in_tracked_query.reset(token)
+                else:
+                    ret = func(*args, **kwargs)
+            finally:
+                if key_token is not None:
+                    _query_key.reset(key_token)
+            if key_token is not None:
+                record_cost(key, rows=1)  # type: ignore
+            n_plus_one_listener.ignore(get_instance_key(ret), ret)
             return ret
 
         return wrapper
 
-    QuerySet.get = patch_get(QuerySet.get)
+    _patch_attribute(QuerySet, "get", patch_get(QuerySet.get))
 
     original_prefetch_related_objects = QuerySet._prefetch_related_objects  # type: ignore
 
     def patched_prefetch_related_objects(self):
+        fetching = _fetching.get()
+        if fetching is not None and fetching[0] is self:
+            # tag the instances first, so that the prefetched ones can be
+            # tagged from them
+            _tag_origin(self, fetching[1])
         token = _in_queryset_prefetch.set(True)
+        site_token = _prefetch_site.set(self._zeal_prefetch_site)
         try:
             return original_prefetch_related_objects(self)
         finally:
+            _prefetch_site.reset(site_token)
             _in_queryset_prefetch.reset(token)
 
-    QuerySet._prefetch_related_objects = (  # type: ignore
-        patched_prefetch_related_objects
+    _patch_attribute(
+        QuerySet,
+        "_prefetch_related_objects",
+        patched_prefetch_related_objects,
     )
 
     from django.db.models import query as _query_module
@@ -576,10 +816,167 @@ def patch_global_queryset():
         finally:
             _in_queryset_prefetch.reset(token)
 
-    _query_module.prefetch_related_objects = patched_module_prefetch
+    _patch_attribute(
+        _query_module, "prefetch_related_objects", patched_module_prefetch
+    )
+
+    def patch_prefetch_related(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            clone = func(self, *args, **kwargs)
+            context = _nplusone_context.get()
+            if context.enabled and context.detect_unused_prefetches:
+                clone._zeal_prefetch_site = get_caller()
+            return clone
+
+        return wrapper
 
+    _patch_attribute(
+        QuerySet,
+        "prefetch_related",
+        patch_prefetch_related(QuerySet.prefetch_related),
+    )
 
-def patch():
+    original_prefetch_one_level = _query_module.prefetch_one_level
+
+    def patched_prefetch_one_level(instances, prefetcher, lookup, level):
+        context = _nplusone_context.get()
+        cached = (
+            set(instances[0].__dict__.get("_prefetched_objects_cache", ()))
+            if context.enabled
+            and context.detect_unused_prefetches
+            and instances
+            else None
+        )
+        result = original_prefetch_one_level(
+            instances, prefetcher, lookup, level
+        )
+        if context.enabled:
+            if cached is not None:
+                _record_prefetch(
+                    context, instances, lookup, level, result[0], cached
+                )
+            if context.suggest_fixes and instances and result[0]:
+                origin = get_origin(
+                    instances[0].__dict__.get("_zeal_origin"),
+                    instances[0].__class__,
+                    lookup.prefetch_through.split(LOOKUP_SEP)[level],
+                )
+                if origin is not None:
+                    tag_instances(result[0], origin)
+        return result
+
+    _patch_attribute(
+        _query_module, "prefetch_one_level", patched_prefetch_one_level
+    )
+
+
+def _tag_origin(queryset: QuerySet, parsed: Optional[QuerySource]):
+    """
+    Records where the instances a queryset just loaded came from, so that
+    N+1s on their relations can suggest the lookup that would avoid them.
+    """
+    if queryset._iterable_class is not ModelIterable:  # type: ignore
+        return
+    instances = queryset._result_cache
+    if not instances:
+        return
+    if parsed is None:
+        origin = (queryset.model, get_caller(), ())
+    else:
+        instance = queryset._zeal_source[2]  # type: ignore
+        if instance is None:
+            return
+        origin = get_origin(
+            instance.__dict__.get("_zeal_origin"),
+            parsed["model"],
+            parsed["field"],
+        )
+        if origin is None:
+            return
+    select_related = queryset.query.select_related
+    tag_instances(
+        instances,
+        origin,
+        select_related if isinstance(select_related, dict) else None,
+    )
+
+
+def _record_prefetch(
+    context, instances, lookup, level, related_objects, cached: set[str]
+):
+    """
+    Tags the related managers' caches filled by `prefetch_one_level` with a
+    PrefetchRecord, so that reading any of them marks the prefetch as used.
+    `cached` are the names of the caches that the first instance had
+    before, so that only the cache filled by this lookup is tagged.
+    Single-object relations and `to_attr` lists are plain attributes that
+    we can't watch, so they aren't recorded.
+    """
+    if lookup.get_current_to_attr(level)[1]:
+        return
+    names = (
+        set(instances[0].__dict__.get("_prefetched_objects_cache", ()))
+        - cached
+    )
+    caches = []
+    for instance in instances:
+        prefetched = instance.__dict__.get("_prefetched_objects_cache", {})
+        for name in names:
+            queryset = prefetched.get(name)
+            if queryset is not None and queryset._result_cache is not None:
+                caches.append(queryset)
+    if not caches:
+        return
+    model = instances[0].__class__
+    field = lookup.prefetch_through.split(LOOKUP_SEP)[level]
+    if _is_silenced(context, model, field):
+        for queryset in caches:
+            queryset._zeal_prefetch = _silenced_prefetch
+        return
+    record = PrefetchRecord(
+        model=model,
+        field=field,
+        lookup=lookup.prefetch_through,
+        caller=_prefetch_site.get() or get_caller(),
+        rows=len(related_objects),
+    )
+    for queryset in caches:
+        queryset._zeal_prefetch = record
+    context.prefetches.append(record)
+
+
+# Tags the caches of prefetches that the allowlist silences. It's never
+# reported, since it isn't in any context's `prefetches`.
+_silenced_prefetch = PrefetchRecord(models.Model, "", "", ("", 0, ""), 0)
+
+
+def _reset_related_manager_caches():
+    """
+    Related manager classes are built by Django's factory functions the
+    first time a relation is accessed, and then cached on the descriptor.
+    Dropping those caches makes Django rebuild them with whichever factory
+    functions are currently installed.
+    """
+    for model in apps.get_models(include_auto_created=True):
+        for attr in vars(model).values():
+            if isinstance(
+                getattr(type(attr), "related_manager_cls", None),
+                cached_property,
+            ):
+                attr.__dict__.pop("related_manager_cls", None)
+    _manager_classes.clear()
+
+
+def install():
+    """
+    Patches the Django ORM so that zeal can detect N+1s. This is called
+    when the zeal app is loaded, and is a no-op if zeal is already
+    installed.
+    """
+    global _installed
+    if _installed:
+        return
     patch_forward_many_to_one_descriptor()
     patch_reverse_many_to_one_descriptor()
     patch_reverse_one_to_one_descriptor()
@@ -588,3 +985,37 @@ def patch():
     patch_generic_related_manager()
     patch_deferred_attribute()
     patch_global_queryset()
+    _connect_sql_wrapper()
+    if apps.ready:
+        # related managers built so far use Django's own factories. While
+        # the app registry is still loading (i.e. when called from
+        # `ZealConfig.ready()`), none can have been built yet.
+        _reset_related_manager_caches()
+    _installed = True
+
+
+def uninstall():
+    """
+    Restores the original Django callables replaced by `install()`, so
+    that zeal adds no overhead at all until it is installed again.
+
+    This should not be called while a zeal context is active.
+    """
+    global _installed, _tracking_reads
+    if not _installed:
+        return
+    while _installed_patches:
+        owner, name, original = _installed_patches.pop()
+        if original is _MISSING:
+            delattr(owner, name)
+        else:
+            setattr(owner, name, original)
+    _disconnect_sql_wrapper()
+    _reset_related_manager_caches()
+    _installed = False
+    _tracking_reads = False
+
+
+def patch():
+    # kept for backwards compatibility; use install() instead.
+    install()
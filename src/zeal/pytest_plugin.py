@@ -0,0 +1,194 @@
+"""
+A pytest plugin that runs every test in a zeal context, so that N+1s are
+detected without a hand-written fixture. It's registered through the
+`pytest11` entry point, and does nothing unless one of its options is
+passed.
+"""
+
+from typing import Optional
+
+import pytest
+
+_WORKEROUTPUT_KEY = "zeal_report"
+_WORKEROUTPUT_HITS_KEY = "zeal_baseline_hits"
+
+
+def pytest_addoption(parser: pytest.Parser):
+    group = parser.getgroup("zeal")
+    group.addoption(
+        "--zeal",
+        action="store_true",
+        default=False,
+        help="Detect N+1s in every test.",
+    )
+    group.addoption(
+        "--zeal-report",
+        metavar="PATH",
+        default=None,
+        help=(
+            "Collect the N+1s of every test into one session report, "
+            "written to PATH as JSON lines. Implies --zeal."
+        ),
+    )
+    group.addoption(
+        "--zeal-update-baseline",
+        action="store_true",
+        default=False,
+        help=(
+            "Replace ZEAL_BASELINE_FILE with the N+1s found in this "
+            "session, without failing any tests. Implies --zeal."
+        ),
+    )
+
+
+def pytest_configure(config: pytest.Config):
+    config.addinivalue_line(
+        "markers", "nozeal: don't detect N+1s in this test"
+    )
+    report_path = config.getoption("zeal_report")
+    update_baseline = config.getoption("zeal_update_baseline")
+    if config.getoption("zeal") or report_path or update_baseline:
+        config.pluginmanager.register(
+            ZealPlugin(config, report_path, update_baseline), "zeal-plugin"
+        )
+
+
+class ZealPlugin:
+    def __init__(
+        self,
+        config: pytest.Config,
+        report_path: Optional[str],
+        update_baseline: bool = False,
+    ):
+        # imported here so that merely having zeal installed doesn't
+        # import Django into every pytest run
+        from .report import SessionReport
+
+        self.config = config
+        self.report_path = report_path
+        self.update_baseline = update_baseline
+        # whether tests run in report mode, with their reports collected
+        self.collect = bool(report_path or update_baseline)
+        self.session_report = SessionReport()
+
+    @property
+    def is_worker(self) -> bool:
+        # pytest-xdist sets this on its worker processes
+        return hasattr(self.config, "workerinput")
+
+    @pytest.fixture(autouse=True)
+    def _zeal_context(self, request: pytest.FixtureRequest):
+        if request.node.get_closest_marker("nozeal") is not None:
+            yield
+            return
+
+        from .listeners import _reset, setup, teardown
+        from .signals import report_generated
+
+        token = setup(
+            report=True if self.collect else None,
+            raise_errors=False if self.update_baseline else None,
+        )
+        try:
+            yield
+        except BaseException:
+            _reset(token)
+            raise
+        if not self.collect:
+            teardown(token)
+            return
+
+        # teardown() raises after sending the report if ZEAL_RAISE is on,
+        # so it's collected from the signal
+        def collect(sender, report, **kwargs):
+            self.session_report.add(report, request.node.nodeid)
+
+        report_generated.connect(collect)
+        try:
+            teardown(token)
+        finally:
+            report_generated.disconnect(collect)
+
+    def _get_baseline(self):
+        from .baseline import get_baseline
+
+        return get_baseline()
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        # the controller merges the partial results of xdist workers
+        output = getattr(node, "workeroutput", {})
+        records = output.get(_WORKEROUTPUT_KEY)
+        if records:
+            self.session_report.merge(records)
+        hits = output.get(_WORKEROUTPUT_HITS_KEY)
+        baseline = self._get_baseline()
+        if hits and baseline is not None:
+            baseline.hits.update(tuple(hit) for hit in hits)
+
+    def pytest_sessionfinish(self, session: pytest.Session):
+        baseline = self._get_baseline()
+        if self.is_worker:
+            output = self.config.workeroutput  # type: ignore
+            if self.collect:
+                output[_WORKEROUTPUT_KEY] = self.session_report.records()
+            if baseline is not None:
+                output[_WORKEROUTPUT_HITS_KEY] = sorted(baseline.hits)
+            return
+        if self.report_path:
+            self.session_report.write(self.report_path)
+        if self.update_baseline:
+            if baseline is None:
+                raise pytest.UsageError(
+                    "--zeal-update-baseline requires ZEAL_BASELINE_FILE"
+                )
+            baseline.write(
+                [
+                    *baseline.hits,
+                    *(
+                        (
+                            record["model"],
+                            record["field"],
+                            baseline.site(
+                                record["filename"], record["function"]
+                            ),
+                        )
+                        for record in self.session_report.records()
+                    ),
+                ]
+            )
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.is_worker:
+            return
+        lines = []
+        baseline = self._get_baseline()
+        if self.update_baseline and baseline is not None:
+            lines.append(f"Updated {baseline.path}")
+        elif baseline is not None and baseline.stale():
+            stale = baseline.stale()
+            lines.append(
+                f"{len(stale)} entries in {baseline.path} weren't hit, "
+                "run with --zeal-update-baseline to remove them:"
+            )
+            lines.extend(
+                f"  {model}.{field} at {site}"
+                for model, field, site in stale[:10]
+            )
+        if self.report_path:
+            records = self.session_report.records()
+            lines.append(
+                f"{len(records)} N+1 call sites found, written to "
+                f"{self.report_path}"
+            )
+            for record in records[:10]:
+                tests = "test" if record["contexts"] == 1 else "tests"
+                lines.append(
+                    f"  {record['count']} queries in {record['contexts']} "
+                    f"{tests}: {record['model']}.{record['field']} at "
+                    f"{record['filename']}:{record['lineno']}"
+                )
+        if lines:
+            terminalreporter.section("zeal")
+            for line in lines:
+                terminalreporter.write_line(line)
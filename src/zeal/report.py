@@ -0,0 +1,157 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+
+
+@dataclass
+class ReportEntry:
+    """
+    One N+1 found in a zeal context: a model and field that were queried
+    `count` times from the same call site.
+    """
+
+    model: str
+    field: str
+    filename: str
+    lineno: int
+    function: str
+    count: int
+    # a few of the call stacks, as (filename, lineno, funcname) frames
+    # starting with the innermost one
+    stacks: list[list[tuple[str, int, str]]] = field(default_factory=list)
+    suggestion: Optional[str] = None
+    # only set with ZEAL_MEASURE_QUERIES
+    db_time_ms: Optional[float] = None
+    rows: Optional[int] = None
+
+    def format(self) -> str:
+        message = f"N+1 detected on {self.model}.{self.field}"
+        if self.db_time_ms is not None:
+            message += (
+                f": {self.count} queries, {self.db_time_ms:,.1f} ms DB "
+                f"time, {self.rows:,} rows"
+            )
+        else:
+            message += f" ({self.count} queries)"
+        message += f" at {self.filename}:{self.lineno} in {self.function}"
+        if self.suggestion is not None:
+            message += f"\nSuggestion: {self.suggestion}"
+        return message
+
+
+@dataclass
+class Report:
+    """
+    Everything zeal found in a zeal context in report mode (ZEAL_REPORT),
+    built once the context ends.
+    """
+
+    entries: list[ReportEntry] = field(default_factory=list)
+
+    def format(self) -> str:
+        noun = "N+1" if len(self.entries) == 1 else "N+1s"
+        return f"{len(self.entries)} {noun} detected:\n" + "\n".join(
+            entry.format() for entry in self.entries
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    def write(self, path: str):
+        """
+        Appends the report to `path` as a single line of JSON.
+        """
+        with open(path, "a") as f:
+            f.write(json.dumps(self.to_dict()) + "\n")
+
+
+# how many test ids a session report keeps per N+1
+SESSION_SAMPLE_TESTS = 5
+
+
+class SessionReport:
+    """
+    Aggregates the reports of many zeal contexts, e.g. one per test in a
+    pytest session, into one entry per N+1 call site. Entries are kept as
+    plain JSON-compatible dicts, so that the partial reports of several
+    processes (such as pytest-xdist workers) can be sent over and merged
+    cheaply.
+    """
+
+    def __init__(self):
+        self._entries: dict[tuple[str, str, str, int], dict[str, Any]] = {}
+
+    def add(self, report: Report, test: Optional[str] = None):
+        for entry in report.entries:
+            self._merge(
+                {
+                    "model": entry.model,
+                    "field": entry.field,
+                    "filename": entry.filename,
+                    "lineno": entry.lineno,
+                    "function": entry.function,
+                    "count": entry.count,
+                    "contexts": 1,
+                    "tests": [test] if test is not None else [],
+                    "stack": (
+                        [list(frame) for frame in entry.stacks[0]]
+                        if entry.stacks
+                        else []
+                    ),
+                    "suggestion": entry.suggestion,
+                    "db_time_ms": entry.db_time_ms,
+                    "rows": entry.rows,
+                }
+            )
+
+    def merge(self, records: list[dict[str, Any]]):
+        """
+        Merges records returned by another session report's `records()`.
+        """
+        for record in records:
+            self._merge(dict(record))
+
+    def _merge(self, record: dict[str, Any]):
+        key = (
+            record["model"],
+            record["field"],
+            record["filename"],
+            record["lineno"],
+        )
+        existing = self._entries.get(key)
+        if existing is None:
+            record["tests"] = record["tests"][:SESSION_SAMPLE_TESTS]
+            self._entries[key] = record
+            return
+        existing["count"] += record["count"]
+        existing["contexts"] += record["contexts"]
+        tests = existing["tests"]
+        for test in record["tests"]:
+            if len(tests) >= SESSION_SAMPLE_TESTS:
+                break
+            tests.append(test)
+        for name in ("db_time_ms", "rows"):
+            if record[name] is not None:
+                existing[name] = (existing[name] or 0) + record[name]
+
+    def records(self) -> list[dict[str, Any]]:
+        """
+        Returns the entries, most expensive first: by DB time if it was
+        measured, and then by number of queries.
+        """
+        return sorted(
+            self._entries.values(),
+            key=lambda record: (record["db_time_ms"] or 0, record["count"]),
+            reverse=True,
+        )
+
+    def write(self, path: str):
+        """
+        Writes the ranked entries to `path`, one line of JSON per entry.
+        """
+        with open(path, "w") as f:
+            for record in self.records():
+                f.write(json.dumps(record) + "\n")
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,3 +1,8 @@
 from django.dispatch import Signal
 
 nplusone_detected = Signal()
+duplicate_query_detected = Signal()
+unused_prefetch_detected = Signal()
+overfetch_detected = Signal()
+query_budget_exceeded = Signal()
+report_generated = Signal()
@@ -0,0 +1,77 @@
+import re
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+
+from django.apps import apps
+from django.db import models
+from django.db.models.signals import class_prepared
+
+# Set while the ORM runs a query that zeal already reports on through its
+# patched descriptors, so that the SQL engine doesn't count it again.
+_in_tracked_query: ContextVar[bool] = ContextVar(
+    "_in_tracked_query", default=False
+)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?|\$\d+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_TABLE = re.compile(r"\bFROM\s+[\"`\[]?(\w+)", re.IGNORECASE)
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Normalizes a SQL statement so that queries that only differ by their
+    parameters or literal values get the same fingerprint.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+_table_models: Optional[dict[str, type[models.Model]]] = None
+
+
+def _get_table_models() -> dict[str, type[models.Model]]:
+    global _table_models
+    if _table_models is None:
+        _table_models = {
+            model._meta.db_table: model
+            for model in apps.get_models(include_auto_created=True)
+        }
+    return _table_models
+
+
+@lru_cache(maxsize=1024)
+def parse_query(sql: str) -> Optional[tuple[type[models.Model], str]]:
+    """
+    Returns the model a SELECT statement reads from, along with its
+    fingerprint, or None if the statement isn't a SELECT on a Django
+    model's table. Results are cached per SQL string, since the ORM sends
+    the same string for each execution of a query.
+    """
+    if not sql.lstrip().upper().startswith("SELECT"):
+        return None
+    match = _TABLE.search(sql)
+    if match is None:
+        return None
+    model = _get_table_models().get(match.group(1))
+    if model is None:
+        return None
+    return (model, fingerprint(sql))
+
+
+def _reset_table_models(sender: type[models.Model], **kwargs):
+    # a model registered after startup (e.g. in tests) adds a table that
+    # earlier queries couldn't be attributed to
+    global _table_models
+    if sender._meta.apps is apps:
+        _table_models = None
+        parse_query.cache_clear()
+
+
+class_prepared.connect(_reset_table_models)
@@ -0,0 +1,372 @@
+import sys
+import weakref
+from collections import OrderedDict
+from collections.abc import Hashable, Iterator, Set
+from typing import Optional
+
+Frame = tuple[str, int, str]  # (filename, lineno, funcname)
+
+_MISSING = object()
+
+
+class StackTable:
+    """
+    Interns call stacks as nodes in a prefix tree, outermost frame first,
+    so that stacks sharing a call path share their nodes and each distinct
+    stack is identified by a single integer.
+    """
+
+    __slots__ = ("_nodes", "_frames", "_parents")
+
+    def __init__(self):
+        # (parent node id, frame) -> node id; the root has id -1
+        self._nodes: dict[tuple[int, Frame], int] = {}
+        self._frames: list[Frame] = []
+        self._parents: list[int] = []
+
+    def intern(self, stack: list[Frame]) -> int:
+        """
+        Returns the id of the given stack, innermost frame first (as
+        returned by `get_stack()`).
+        """
+        nodes = self._nodes
+        node = -1
+        for frame in reversed(stack):
+            key = (node, frame)
+            child = nodes.get(key)
+            if child is None:
+                child = len(self._frames)
+                nodes[key] = child
+                self._frames.append(frame)
+                self._parents.append(node)
+            node = child
+        return node
+
+    def get(self, node: int) -> list[Frame]:
+        """
+        Returns the stack with the given id, innermost frame first.
+        """
+        stack = []
+        while node != -1:
+            stack.append(self._frames[node])
+            node = self._parents[node]
+        return stack
+
+    def memory_usage(self) -> int:
+        size = (
+            sys.getsizeof(self._nodes)
+            + sys.getsizeof(self._frames)
+            + sys.getsizeof(self._parents)
+        )
+        for frame in self._frames:
+            size += sys.getsizeof(frame)
+        return size
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+
+class CallStore:
+    """
+    Counts how often each N+1 key was hit in a zeal context.
+
+    Only an integer is kept per key, plus the call stacks when
+    ZEAL_SHOW_ALL_CALLERS is on. Stacks are interned in a `StackTable`
+    and stored per key as runs of [stack id, count], so repeating the
+    same call path only increments a counter. The function that each key
+    was first recorded in is kept too, for reporting. With `max_keys` set, the
+    least recently hit keys are evicted once more than `max_keys` distinct
+    keys have been seen, so that long-running contexts use a bounded
+    amount of memory.
+    """
+
+    __slots__ = (
+        "_counts",
+        "_stacks",
+        "_functions",
+        "_table",
+        "max_keys",
+        "evictions",
+    )
+
+    def __init__(self, max_keys: Optional[int] = None):
+        # a plain dict is a bit faster when we don't need LRU ordering
+        self._counts: dict[Hashable, int] = (
+            {} if max_keys is None else OrderedDict()
+        )
+        self._stacks: dict[Hashable, list[list[int]]] = {}
+        self._functions: dict[Hashable, str] = {}
+        self._table = StackTable()
+        self.max_keys = max_keys
+        self.evictions = 0
+
+    def record(self, key: Hashable, stack: Optional[list] = None) -> int:
+        """
+        Records a call for `key`, along with its stack if given, and
+        returns the number of calls recorded for that key.
+        """
+        counts = self._counts
+        count = counts.get(key, 0) + 1
+        counts[key] = count
+        if stack is not None:
+            stack_id = self._table.intern(stack)
+            runs = self._stacks.get(key)
+            if runs is None:
+                self._stacks[key] = [[stack_id, 1]]
+            elif runs[-1][0] == stack_id:
+                runs[-1][1] += 1
+            else:
+                runs.append([stack_id, 1])
+        if self.max_keys is not None:
+            counts.move_to_end(key)  # type: ignore
+            self._evict()
+        return count
+
+    def set_function(self, key: Hashable, function: str):
+        """
+        Records the name of the function that `key`'s call site is in.
+        """
+        self._functions[key] = function
+
+    def function(self, key: Hashable) -> str:
+        """
+        Returns the name of the function that `key`'s call site is in.
+        """
+        return self._functions.get(key, "<unknown>")
+
+    def merge(self, other: "CallStore"):
+        """
+        Adds the calls recorded in `other` (e.g. by a child task) to this
+        store, as if they had been recorded here.
+        """
+        counts = self._counts
+        functions = self._functions
+        for key, count in other._counts.items():
+            counts[key] = counts.get(key, 0) + count
+            if key not in functions and key in other._functions:
+                functions[key] = other._functions[key]
+            for stack_id, run_count in other._stacks.get(key, []):
+                if other._table is not self._table:
+                    stack_id = self._table.intern(other._table.get(stack_id))
+                runs = self._stacks.setdefault(key, [])
+                if runs and runs[-1][0] == stack_id:
+                    runs[-1][1] += run_count
+                else:
+                    runs.append([stack_id, run_count])
+            if self.max_keys is not None:
+                counts.move_to_end(key)  # type: ignore
+        if self.max_keys is not None:
+            self._evict()
+
+    def _evict(self):
+        counts = self._counts
+        while len(counts) > self.max_keys:  # type: ignore
+            evicted, _ = counts.popitem(last=False)  # type: ignore
+            self._stacks.pop(evicted, None)
+            self._functions.pop(evicted, None)
+            self.evictions += 1
+
+    def stacks(self, key: Hashable) -> list[list[Frame]]:
+        """
+        Returns the stack of each recorded call for `key`, in order.
+        """
+        stacks = []
+        for stack_id, count in self._stacks.get(key, []):
+            stack = self._table.get(stack_id)
+            stacks.extend(stack for _ in range(count))
+        return stacks
+
+    def memory_usage(self) -> int:
+        """
+        Returns an estimate, in bytes, of the memory used by this store.
+        Keys are counted but the objects they refer to (e.g. models) are
+        not, since they're shared.
+        """
+        size = (
+            sys.getsizeof(self._counts)
+            + sys.getsizeof(self._stacks)
+            + sys.getsizeof(self._functions)
+        )
+        for key in self._counts:
+            size += sys.getsizeof(key)
+        for runs in self._stacks.values():
+            size += sys.getsizeof(runs)
+            size += sum(sys.getsizeof(run) for run in runs)
+        return size + self._table.memory_usage()
+
+    def copy(self) -> "CallStore":
+        copy = CallStore(self.max_keys)
+        copy._counts.update(self._counts)
+        copy._stacks = {
+            key: [[*run] for run in runs] for key, runs in self._stacks.items()
+        }
+        copy._functions.update(self._functions)
+        # the table is append-only, so copies can share it
+        copy._table = self._table
+        copy.evictions = self.evictions
+        return copy
+
+    def fork(self) -> "CallStore":
+        """
+        Returns an empty store for work that may run on another thread. It
+        has its own stack table, since tables aren't thread-safe, and its
+        stacks are re-interned into this store's table when it's merged
+        back.
+        """
+        return CallStore(self.max_keys)
+
+    def __getitem__(self, key: Hashable) -> int:
+        return self._counts[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._counts
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._counts)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CallStore):
+            return NotImplemented
+        return self._counts == other._counts and all(
+            self.stacks(key) == other.stacks(key) for key in self._counts
+        )
+
+    def items(self):
+        return self._counts.items()
+
+    def values(self):
+        return self._counts.values()
+
+
+class IgnoredKeys(Set):
+    """
+    The instance keys that N+1s shouldn't be reported for. When a key is
+    added along with the instance it was computed from, the key is only
+    kept while that instance is alive: it's held by a weak reference, and
+    dropped as soon as the instance is garbage collected. This keeps the
+    set small in long contexts that load millions of single instances,
+    since each of them is usually thrown away soon after. With `max_keys`
+    set, the oldest keys are also dropped once there are more than
+    `max_keys`.
+
+    Weak reference callbacks can run in any thread, in the middle of any
+    operation, so they only queue the key for removal. The keys are
+    removed by the next operation that changes or iterates the set, and
+    lookups treat them as gone in the meantime.
+    """
+
+    __slots__ = (
+        "_keys",
+        "_dead",
+        "_parent",
+        "_remove",
+        "max_keys",
+        "evictions",
+    )
+
+    def __init__(self, max_keys: Optional[int] = None):
+        # key -> weak reference to the instance, or None to keep the key
+        # until it's evicted
+        self._keys: OrderedDict[Hashable, Optional[weakref.KeyedRef]] = (
+            OrderedDict()
+        )
+        # references to collected instances whose keys are yet to be
+        # removed
+        self._dead: list[weakref.KeyedRef] = []
+        # the set that this one was forked from (see `fork`)
+        self._parent: Optional[IgnoredKeys] = None
+        self.max_keys = max_keys
+        self.evictions = 0
+        dead = self._dead
+
+        def remove(ref: weakref.KeyedRef):
+            # list.append is atomic, so this is safe from any thread
+            dead.append(ref)
+
+        self._remove = remove
+
+    def _remove_dead(self):
+        keys, dead = self._keys, self._dead
+        while dead:
+            ref = dead.pop()
+            # the key may have been given a newer instance since
+            if keys.get(ref.key) is ref:
+                del keys[ref.key]
+
+    def add(self, key: Hashable, instance: Optional[object] = None):
+        if self._dead:
+            self._remove_dead()
+        keys = self._keys
+        if key in keys:
+            keys.move_to_end(key)
+            if instance is None or keys[key] is None:
+                return
+        # the most recently loaded instance is the likeliest to be used
+        keys[key] = (
+            weakref.KeyedRef(instance, self._remove, key)
+            if instance is not None
+            else None
+        )
+        if self.max_keys is not None and len(keys) > self.max_keys:
+            keys.popitem(last=False)
+            self.evictions += 1
+
+    def memory_usage(self) -> int:
+        """
+        Returns an estimate, in bytes, of the memory used by this set.
+        """
+        self._remove_dead()
+        return sys.getsizeof(self._keys) + sum(
+            sys.getsizeof(key) + sys.getsizeof(ref)
+            for key, ref in self._keys.items()
+        )
+
+    def copy(self) -> "IgnoredKeys":
+        copy = IgnoredKeys(self.max_keys)
+        copy.update(self)
+        copy._parent = self._parent
+        copy.evictions = self.evictions
+        return copy
+
+    def fork(self) -> "IgnoredKeys":
+        """
+        Returns an empty set that also contains this set's keys, without
+        copying them: lookups fall back to this set. Only the keys added to
+        the fork itself are iterated over, so that merging it back with
+        `update` only adds those.
+        """
+        fork = IgnoredKeys(self.max_keys)
+        fork._parent = self
+        return fork
+
+    def update(self, other: "IgnoredKeys"):
+        """
+        Adds the keys of `other`, along with their instances.
+        """
+        other._remove_dead()
+        for key, ref in list(other._keys.items()):
+            if ref is None:
+                self.add(key)
+                continue
+            instance = ref()
+            if instance is not None:
+                self.add(key, instance)
+
+    def __contains__(self, key: object) -> bool:
+        # only reads, since forks look keys up from other threads
+        ref = self._keys.get(key, _MISSING)
+        if ref is None or (ref is not _MISSING and ref() is not None):
+            return True
+        return self._parent is not None and key in self._parent
+
+    def __iter__(self) -> Iterator[Hashable]:
+        self._remove_dead()
+        # instances may be collected while the caller iterates
+        return iter(list(self._keys))
+
+    def __len__(self) -> int:
+        self._remove_dead()
+        return len(self._keys)
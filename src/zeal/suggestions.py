@@ -0,0 +1,151 @@
+from typing import Optional
+
+from django.db import models
+
+# (name, whether it can be followed with select_related) for one relation
+Step = tuple[str, bool]
+
+# Where a model instance was loaded from: the model of the queryset that
+# was evaluated, where it was evaluated, and the relations followed from
+# there to reach the instance. Stored on instances as `_zeal_origin`.
+Origin = tuple[type[models.Model], tuple[str, int, str], tuple[Step, ...]]
+
+# (model, field name as reported by zeal) -> (step, related model)
+_relations: dict[
+    tuple[type[models.Model], str],
+    Optional[tuple[Step, Optional[type[models.Model]]]],
+] = {}
+
+
+def get_relation(
+    model: type[models.Model], field: str
+) -> Optional[tuple[Step, Optional[type[models.Model]]]]:
+    """
+    Returns the step to follow the relation `field` on `model`, along with
+    the model it points to, or None if `field` isn't a relation.
+    """
+    key = (model, field)
+    try:
+        return _relations[key]
+    except KeyError:
+        pass
+    result = None
+    for candidate in model._meta.get_fields():
+        if not candidate.is_relation:
+            continue
+        # reverse relations are accessed by their accessor name, e.g.
+        # `post_set`, and forward ones by their field name
+        if candidate.auto_created and not candidate.concrete:
+            name = candidate.get_accessor_name()  # type: ignore
+        else:
+            name = candidate.name
+        if name != field:
+            continue
+        selectable = bool(
+            (candidate.many_to_one or candidate.one_to_one)
+            # generic foreign keys can only be prefetched
+            and (candidate.concrete or candidate.auto_created)
+        )
+        result = ((name, selectable), candidate.related_model)
+        break
+    _relations[key] = result
+    return result
+
+
+def get_origin(
+    parent_origin: Optional[Origin], model: type[models.Model], field: str
+) -> Optional[Origin]:
+    """
+    Returns the origin of instances loaded through the relation `field`
+    of an instance of `model`, which itself came from `parent_origin`.
+    """
+    if parent_origin is None:
+        return None
+    relation = get_relation(model, field)
+    if relation is None:
+        return None
+    root, caller, path = parent_origin
+    return (root, caller, (*path, relation[0]))
+
+
+def get_suggestion(
+    instance: Optional[models.Model],
+    model: type[models.Model],
+    field: str,
+    filtered: bool = False,
+) -> Optional[str]:
+    """
+    Suggests how to load the relation `field` of `instance` up front,
+    based on the queryset that `instance` was loaded from. `filtered`
+    means that the relation's manager was filtered (or ordered, etc.)
+    before it was evaluated.
+    """
+    if instance is None:
+        return None
+    origin = get_origin(instance.__dict__.get("_zeal_origin"), model, field)
+    if origin is None:
+        return None
+    root, (filename, lineno, funcname), path = origin
+    related_model = get_relation(model, field)[1]  # type: ignore
+    # e.g. forward foreign keys are always fetched with a filtered .get()
+    filtered = filtered and not path[-1][1]
+    names = [name for name, _ in path]
+    select = []
+    for name, selectable in path:
+        if not selectable:
+            break
+        select.append(name)
+
+    suggestion = f"{root.__name__}.objects"
+    if len(select) == len(path) and not filtered:
+        suggestion += f'.select_related("{"__".join(select)}")'
+    else:
+        if select:
+            suggestion += f'.select_related("{"__".join(select)}")'
+        lookup = "__".join(names)
+        if filtered and related_model is not None:
+            to_attr = f"filtered_{names[-1]}"
+            suggestion += (
+                f'.prefetch_related(Prefetch("{lookup}", '
+                f"queryset={related_model.__name__}.objects.filter(...), "
+                f'to_attr="{to_attr}"))'
+                f", then read `{to_attr}` instead of filtering the related "
+                "manager"
+            )
+        else:
+            suggestion += f'.prefetch_related("{lookup}")'
+    return (
+        f"{suggestion} (for the queryset evaluated at {filename}:{lineno} "
+        f"in {funcname})"
+    )
+
+
+def tag_instances(
+    instances: list[models.Model],
+    origin: Origin,
+    select_related: Optional[dict] = None,
+):
+    """
+    Records `origin` on freshly loaded instances, along with the instances
+    that were loaded alongside them through `select_related`.
+    """
+    for instance in instances:
+        instance.__dict__["_zeal_origin"] = origin
+    if not select_related:
+        return
+    root, caller, path = origin
+    model = instances[0].__class__
+    for name, nested in select_related.items():
+        relation = get_relation(model, name)
+        if relation is None:
+            continue
+        related = [
+            related_instance
+            for instance in instances
+            if (related_instance := instance._state.fields_cache.get(name))
+            is not None
+        ]
+        if related:
+            tag_instances(
+                related, (root, caller, (*path, relation[0])), nested
+            )
@@ -1,25 +1,93 @@
 import os
 import sys
+from typing import Optional
 
+from django.conf import settings
+from django.core.signals import setting_changed
 from django.db.models.sql import Query
 
 _ZEAL_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# (project roots, excluded paths) as tuples of prefixes for str.startswith
+_path_prefixes: Optional[tuple[tuple[str, ...], tuple[str, ...]]] = None
+
+# filename -> whether frames from that file are internal. Filenames come
+# from code objects, so there's one entry per source file.
+_internal_files: dict[str, bool] = {}
+
+
+def _to_prefixes(paths: list[str]) -> tuple[str, ...]:
+    return tuple(os.path.join(os.path.abspath(path), "") for path in paths)
+
+
+def _get_path_prefixes() -> tuple[tuple[str, ...], tuple[str, ...]]:
+    global _path_prefixes
+    if _path_prefixes is None:
+        project_roots = (
+            settings.ZEAL_PROJECT_ROOTS
+            if hasattr(settings, "ZEAL_PROJECT_ROOTS")
+            else []
+        )
+        exclude_paths = (
+            settings.ZEAL_EXCLUDE_PATHS
+            if hasattr(settings, "ZEAL_EXCLUDE_PATHS")
+            else []
+        )
+        _path_prefixes = (
+            _to_prefixes(project_roots),
+            (os.path.join(_ZEAL_DIR, ""), *_to_prefixes(exclude_paths)),
+        )
+    return _path_prefixes
+
+
+def _reset_path_prefixes(*, setting: str, **kwargs):
+    global _path_prefixes
+    if setting in ("ZEAL_PROJECT_ROOTS", "ZEAL_EXCLUDE_PATHS"):
+        _path_prefixes = None
+        _internal_files.clear()
+
+
+setting_changed.connect(_reset_path_prefixes)
+
 
 def _is_internal_frame(fn: str) -> bool:
-    """Check if a filename belongs to site-packages or zeal internals."""
-    return "site-packages" in fn or fn.startswith(_ZEAL_DIR)
+    """
+    Check if a filename belongs to zeal internals or to code outside the
+    project. Paths in ZEAL_EXCLUDE_PATHS are always internal. Anything in
+    site-packages is internal too, unless it's in a project root that is
+    itself in site-packages; and if ZEAL_PROJECT_ROOTS is set, anything
+    outside of it is internal.
+    """
+    project_roots, exclude_paths = _get_path_prefixes()
+    if fn.startswith(exclude_paths):
+        return True
+    if project_roots:
+        # the most specific root wins, so that e.g. a virtualenv inside a
+        # project root stays internal unless a path in it is listed too
+        root = max(
+            (root for root in project_roots if fn.startswith(root)),
+            key=len,
+            default=None,
+        )
+        if root is None:
+            return True
+        return "site-packages" in fn[len(root) :]
+    return "site-packages" in fn
 
 
 def get_caller() -> tuple[str, int, str]:
     """
-    Returns (filename, lineno, funcname) of the first caller outside
-    site-packages/zeal, walking raw frame objects.
+    Returns (filename, lineno, funcname) of the first caller that isn't
+    internal (see `_is_internal_frame`), walking raw frame objects.
     """
+    internal_files = _internal_files
     frame = sys._getframe(1)
     while frame is not None:
         fn = frame.f_code.co_filename
-        if not _is_internal_frame(fn):
+        is_internal = internal_files.get(fn)
+        if is_internal is None:
+            is_internal = internal_files[fn] = _is_internal_frame(fn)
+        if not is_internal:
             result = (fn, frame.f_lineno, frame.f_code.co_name)
             del frame
             return result
@@ -27,16 +95,39 @@ def get_caller() -> tuple[str, int, str]:
     return ("<unknown>", 0, "<unknown>")
 
 
+def get_call_site() -> tuple[str, int]:
+    """
+    Returns (filename, lineno) of the same caller as `get_caller`. This is
+    all that's needed to tell call sites apart, so it's used on the hot
+    path; the function name is only looked up when an N+1 is reported.
+    """
+    internal_files = _internal_files
+    frame = sys._getframe(1)
+    while frame is not None:
+        fn = frame.f_code.co_filename
+        is_internal = internal_files.get(fn)
+        if is_internal is None:
+            is_internal = internal_files[fn] = _is_internal_frame(fn)
+        if not is_internal:
+            return (fn, frame.f_lineno)
+        frame = frame.f_back
+    return ("<unknown>", 0)
+
+
 def get_stack() -> list[tuple[str, int, str]]:
     """
     Returns the current call stack as (filename, lineno, funcname) tuples,
-    excluding site-packages and zeal internals.
+    excluding internal frames (see `_is_internal_frame`).
     """
+    internal_files = _internal_files
     result = []
     frame = sys._getframe(1)
     while frame is not None:
         fn = frame.f_code.co_filename
-        if not _is_internal_frame(fn):
+        is_internal = internal_files.get(fn)
+        if is_internal is None:
+            is_internal = internal_files[fn] = _is_internal_frame(fn)
+        if not is_internal:
             result.append((fn, frame.f_lineno, frame.f_code.co_name))
         frame = frame.f_back
     return result
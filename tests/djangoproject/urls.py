@@ -3,6 +3,6 @@ from django.urls import path
 from .social.views import all_users_and_profiles, single_user_and_profile
 
 urlpatterns = [
-    path("users/", all_users_and_profiles),
-    path("user/<int:id>/", single_user_and_profile),
+    path("users/", all_users_and_profiles, name="users"),
+    path("user/<int:id>/", single_user_and_profile, name="user"),
 ]
@@ -0,0 +1,196 @@
+import re
+import warnings
+
+import pytest
+from django.db import models
+from django.db.models.signals import class_prepared
+from django.test.utils import isolate_apps
+from djangoproject.social.models import Post, Profile, User
+from zeal import NPlusOneError, zeal_context, zeal_ignore
+from zeal.allowlist import (
+    CompiledAllowlist,
+    _validate_allowlist,
+    get_settings_allowlist,
+)
+from zeal.constants import ALL_APPS, get_model_fields
+from zeal.errors import ZealConfigError
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestCompiledAllowlist:
+    def test_matches_exact_entries(self):
+        allowlist = CompiledAllowlist(
+            [{"model": "social.User", "field": "posts"}]
+        )
+        assert allowlist.match(User, "posts") is not None
+        assert allowlist.match(User, "following") is None
+        assert allowlist.match(Post, "posts") is None
+
+    def test_matches_model_without_field(self):
+        allowlist = CompiledAllowlist([{"model": "social.User"}])
+        assert allowlist.match(User, "posts") is not None
+        assert allowlist.match(User, "get()") is not None
+        assert allowlist.match(Post, "author") is None
+
+    def test_matches_wildcards(self):
+        allowlist = CompiledAllowlist(
+            [
+                {"model": "social.U*", "field": "p?sts"},
+                {"model": "social.P[or]*", "field": "*"},
+            ]
+        )
+        assert allowlist.match(User, "posts") is not None
+        assert allowlist.match(User, "following") is None
+        assert allowlist.match(Post, "author") is not None
+        assert allowlist.match(Profile, "user") is not None
+
+    def test_first_matching_entry_wins(self):
+        allowlist = CompiledAllowlist(
+            [
+                {"model": "social.*", "field": "posts", "threshold": 3},
+                {"model": "social.User", "field": "posts", "threshold": 5},
+                {"model": "social.User", "threshold": 7},
+            ]
+        )
+        rule = allowlist.match(User, "posts")
+        assert rule is not None and rule.threshold == 3
+        rule = allowlist.match(User, "following")
+        assert rule is not None and rule.threshold == 7
+
+    def test_caches_lookups(self):
+        allowlist = CompiledAllowlist([{"model": "social.*"}])
+        assert allowlist.match(User, "posts") is allowlist.match(User, "posts")
+        assert (User, "posts") in allowlist._cache
+
+    def test_rules_without_overrides_silence_nplusones(self):
+        allowlist = CompiledAllowlist(
+            [
+                {"model": "social.User", "field": "posts"},
+                {"model": "social.Post", "field": "author", "raise": False},
+            ]
+        )
+        rule = allowlist.match(User, "posts")
+        assert rule is not None and rule.silenced
+        rule = allowlist.match(Post, "author")
+        assert rule is not None and not rule.silenced
+        assert rule.should_raise is False
+
+
+@pytest.mark.nozeal
+def test_compiles_settings_allowlist_once(settings):
+    settings.ZEAL_ALLOWLIST = [{"model": "social.User", "field": "posts"}]
+    allowlist = get_settings_allowlist()
+    with zeal_context():
+        pass
+    assert get_settings_allowlist() is allowlist
+
+    settings.ZEAL_ALLOWLIST = [{"model": "social.Post", "field": "author"}]
+    assert get_settings_allowlist() is not allowlist
+
+
+@pytest.mark.nozeal
+def test_validates_threshold(settings):
+    settings.ZEAL_ALLOWLIST = [{"model": "social.User", "threshold": "3"}]
+    with pytest.raises(
+        ZealConfigError,
+        match=re.escape("Threshold for 'social.User' must be an integer"),
+    ):
+        with zeal_context():
+            pass
+
+
+def test_can_override_threshold_per_rule(settings):
+    settings.ZEAL_ALLOWLIST = [
+        {"model": "social.User", "field": "posts", "threshold": 3}
+    ]
+    users = UserFactory.create_batch(3)
+    for user in users:
+        PostFactory.create(author=user)
+
+    # two calls is below this rule's threshold
+    for user in User.objects.all()[:2]:
+        _ = list(user.posts.all())
+
+    with pytest.raises(
+        NPlusOneError, match=re.escape("N+1 detected on social.User.posts")
+    ):
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+
+
+def test_zeal_ignore_beats_settings_overrides(settings):
+    settings.ZEAL_ALLOWLIST = [
+        {"model": "social.User", "field": "posts", "threshold": 2}
+    ]
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+
+    with zeal_ignore():
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+
+    # the settings rule still applies outside of zeal_ignore()
+    with pytest.raises(NPlusOneError):
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+
+
+def test_can_override_raise_per_rule(settings):
+    settings.ZEAL_RAISE = True
+    settings.ZEAL_ALLOWLIST = [
+        {"model": "social.Post", "field": "author", "raise": False}
+    ]
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+
+    # other fields still raise
+    with pytest.raises(NPlusOneError):
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        for post in Post.objects.all():
+            _ = post.author
+    assert len(w) == 1
+    assert "N+1 detected on social.Post.author" in str(w[0].message)
+
+
+class TestModelRegistry:
+    @pytest.fixture(autouse=True)
+    def empty_registry(self):
+        ALL_APPS.clear()
+
+    def test_looks_up_models_on_first_use(self):
+        _validate_allowlist([{"model": "social.User", "field": "posts"}])
+        assert list(ALL_APPS) == ["social.User"]
+        assert {"username", "posts", "profile", "followers"} <= ALL_APPS[
+            "social.User"
+        ]
+
+    def test_model_labels_are_case_sensitive(self):
+        assert get_model_fields("social.User") is not None
+        assert get_model_fields("social.user") is None
+        assert get_model_fields("social") is None
+        assert get_model_fields("foo.User") is None
+
+    def test_is_reset_when_a_model_is_registered(self):
+        get_model_fields("social.User")
+        # e.g. a model defined in a test module
+        class_prepared.send(sender=Profile)
+        assert ALL_APPS == {}
+
+    @isolate_apps("djangoproject.social")
+    def test_ignores_models_in_other_registries(self):
+        get_model_fields("social.User")
+
+        class Other(models.Model):
+            class Meta:
+                app_label = "social"
+
+        assert list(ALL_APPS) == ["social.User"]
@@ -0,0 +1,160 @@
+import json
+
+import pytest
+from djangoproject.social.models import User
+from zeal import NPlusOneError, ZealExecutor, zeal_context
+from zeal.baseline import Baseline, get_baseline
+from zeal.errors import ZealConfigError
+
+from .factories import PostFactory, UserFactory
+from .test_pytest_plugin import run_pytest
+
+pytestmark = pytest.mark.django_db
+
+
+def load_posts():
+    for user in User.objects.all():
+        _ = list(user.posts.all())
+
+
+def write_baseline(path, entries):
+    path.write_text(
+        json.dumps(
+            {
+                "version": 1,
+                "entries": [
+                    {"model": model, "field": field, "site": site}
+                    for model, field, site in entries
+                ],
+            }
+        )
+    )
+
+
+class TestBaseline:
+    def test_missing_file_is_empty(self, tmp_path):
+        baseline = Baseline.load(str(tmp_path / "missing.json"))
+        assert len(baseline) == 0
+
+    def test_rejects_invalid_files(self, tmp_path):
+        path = tmp_path / "baseline.json"
+        path.write_text("[]")
+        with pytest.raises(ZealConfigError, match="not a zeal baseline"):
+            Baseline.load(str(path))
+        path.write_text("{")
+        with pytest.raises(ZealConfigError, match="not valid JSON"):
+            Baseline.load(str(path))
+
+    def test_sites_are_relative_to_the_file(self, tmp_path):
+        baseline = Baseline(str(tmp_path / "baseline.json"))
+        site = baseline.site(str(tmp_path / "app" / "views.py"), "index")
+        assert site == "app/views.py:index"
+
+    def test_write_round_trips(self, tmp_path):
+        path = str(tmp_path / "baseline.json")
+        entries = [
+            ("social.User", "posts", "b.py:f"),
+            ("social.Post", "author", "a.py:g"),
+        ]
+        Baseline(path).write(entries)
+        baseline = Baseline.load(path)
+        assert all(entry in baseline for entry in entries)
+        assert len(baseline) == 2
+
+
+def load_baseline(path, extra_entries=()):
+    site = Baseline(str(path)).site(__file__, "load_posts")
+    entry = ("social.User", "posts", site)
+    write_baseline(path, [entry, *extra_entries])
+    baseline = get_baseline()
+    assert baseline is not None
+    return baseline, entry
+
+
+def test_baselined_nplusones_are_not_reported(tmp_path, settings):
+    baseline_file = tmp_path / "zeal-baseline.json"
+    settings.ZEAL_BASELINE_FILE = str(baseline_file)
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    load_baseline(baseline_file)
+    with zeal_context():
+        load_posts()
+
+
+def test_other_nplusones_are_still_reported(tmp_path, settings):
+    baseline_file = tmp_path / "zeal-baseline.json"
+    settings.ZEAL_BASELINE_FILE = str(baseline_file)
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    load_baseline(baseline_file)
+    with zeal_context():
+        with pytest.raises(NPlusOneError):
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+
+
+def load_user_posts(user):
+    return list(user.posts.all())
+
+
+# worker threads use their own database connections, so they can only see
+# committed data
+@pytest.mark.nozeal
+@pytest.mark.django_db(transaction=True)
+def test_covers_nplusones_merged_from_worker_threads(tmp_path, settings):
+    baseline_file = tmp_path / "zeal-baseline.json"
+    settings.ZEAL_BASELINE_FILE = str(baseline_file)
+    users = UserFactory.create_batch(2)
+    for user in users:
+        PostFactory.create(author=user)
+    site = Baseline(str(baseline_file)).site(__file__, "load_user_posts")
+    worker_entry = ("social.User", "posts", site)
+    baseline, _ = load_baseline(baseline_file, [worker_entry])
+    # each worker loads one user's posts, so the N+1 is only found when
+    # the workers' calls are merged, outside of load_user_posts
+    with zeal_context(), ZealExecutor(max_workers=2) as executor:
+        list(executor.map(load_user_posts, users))
+    assert baseline.hits == {worker_entry}
+
+
+def test_reports_stale_entries(tmp_path, settings):
+    baseline_file = tmp_path / "zeal-baseline.json"
+    settings.ZEAL_BASELINE_FILE = str(baseline_file)
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    stale = ("social.User", "followers", "gone.py:old_view")
+    baseline, entry = load_baseline(baseline_file, [stale])
+    with zeal_context():
+        load_posts()
+    assert baseline.hits == {entry}
+    assert baseline.stale() == [stale]
+
+
+@pytest.mark.nozeal
+def test_pytest_plugin_updates_baseline(tmp_path):
+    (tmp_path / "conftest.py").write_text(
+        "from django.conf import settings\n\n\n"
+        "def pytest_configure(config):\n"
+        '    settings.ZEAL_BASELINE_FILE = "zeal-baseline.json"\n'
+    )
+    result = run_pytest(tmp_path, "--zeal")
+    assert result.returncode == 1, result.stdout
+
+    result = run_pytest(tmp_path, "--zeal-update-baseline")
+    assert result.returncode == 0, result.stdout
+    assert "Updated zeal-baseline.json" in result.stdout
+    data = json.loads((tmp_path / "zeal-baseline.json").read_text())
+    assert data["entries"] == [
+        {
+            "model": "social.User",
+            "field": "posts",
+            "site": "test_app.py:load_posts",
+        }
+    ]
+
+    result = run_pytest(tmp_path, "--zeal")
+    assert result.returncode == 0, result.stdout
+    assert "weren't hit" not in result.stdout
+
+    result = run_pytest(tmp_path, "--zeal", "-k", "test_fine")
+    assert "1 entries in zeal-baseline.json weren't hit" in result.stdout
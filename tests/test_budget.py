@@ -0,0 +1,103 @@
+import re
+import warnings
+
+import pytest
+from djangoproject.social.models import Post, User
+from zeal import (
+    QueryBudgetError,
+    assert_max_queries,
+    zeal_context,
+    zeal_ignore,
+)
+from zeal.signals import query_budget_exceeded
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_does_not_alert_within_budget():
+    for user in UserFactory.create_batch(3):
+        PostFactory.create(author=user)
+    with zeal_context(max_queries=2):
+        _ = list(User.objects.all())
+        _ = list(Post.objects.all())
+
+
+def test_alerts_over_budget_with_breakdown(settings):
+    settings.ZEAL_RAISE = False
+    for user in UserFactory.create_batch(3):
+        PostFactory.create(author=user)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        with zeal_context(max_queries=3):
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+            _ = list(Post.objects.all())
+    [message] = [
+        str(warning.message)
+        for warning in w
+        if str(warning.message).startswith("Query budget")
+    ]
+    assert message.startswith(
+        "Query budget exceeded: 5 queries run, 3 allowed. "
+        "Queries by call site:\n"
+    )
+    assert re.search(
+        r"\n  3 x social\.User\.posts at .*/test_budget\.py:\d+\n"
+        r"  2 other queries$",
+        message,
+    )
+
+
+def test_reads_budget_from_settings(settings):
+    settings.ZEAL_MAX_QUERIES = 1
+    for user in UserFactory.create_batch(3):
+        PostFactory.create(author=user)
+    with pytest.raises(QueryBudgetError, match="2 queries run, 1 allowed"):
+        with zeal_context():
+            _ = list(User.objects.all())
+            _ = list(Post.objects.all())
+
+
+def test_sends_signal(settings, mocker):
+    settings.ZEAL_RAISE = False
+    for user in UserFactory.create_batch(3):
+        PostFactory.create(author=user)
+    receiver = mocker.Mock()
+    query_budget_exceeded.connect(receiver)
+    try:
+        with warnings.catch_warnings(), zeal_context(max_queries=0):
+            warnings.simplefilter("ignore")
+            _ = list(User.objects.all())
+    finally:
+        query_budget_exceeded.disconnect(receiver)
+    receiver.assert_called_once()
+    assert isinstance(receiver.call_args.kwargs["exception"], QueryBudgetError)
+
+
+def test_assert_max_queries_raises_regardless_of_setting(settings):
+    settings.ZEAL_RAISE = False
+    for user in UserFactory.create_batch(3):
+        PostFactory.create(author=user)
+    with pytest.raises(QueryBudgetError, match="1 allowed"):
+        with assert_max_queries(1):
+            _ = list(User.objects.all())
+            _ = list(Post.objects.all())
+
+
+def test_assert_max_queries_passes_within_budget():
+    for user in UserFactory.create_batch(3):
+        PostFactory.create(author=user)
+    with assert_max_queries(1):
+        _ = list(User.objects.all())
+
+
+def test_counts_queries_in_ignored_blocks():
+    for user in UserFactory.create_batch(3):
+        PostFactory.create(author=user)
+    with pytest.raises(QueryBudgetError):
+        with zeal_context(max_queries=1):
+            with zeal_ignore():
+                _ = list(User.objects.all())
+                _ = list(Post.objects.all())
@@ -0,0 +1,114 @@
+import re
+import warnings
+
+import pytest
+from django.db import connection
+from djangoproject.social.models import User
+from zeal import DuplicateQueryError, zeal_context, zeal_ignore
+from zeal.listeners import duplicate_query_listener
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def get_user(pk):
+    return User.objects.filter(pk=pk).first()
+
+
+def test_does_not_detect_duplicates_by_default():
+    user = UserFactory.create()
+    with zeal_context():
+        for _ in range(5):
+            get_user(user.pk)
+
+
+def test_detects_duplicate_queries(settings):
+    settings.ZEAL_DUPLICATE_QUERY_THRESHOLD = 3
+    user = UserFactory.create()
+    with zeal_context():
+        get_user(user.pk)
+        get_user(user.pk)
+        with pytest.raises(
+            DuplicateQueryError,
+            match=re.escape(
+                "Duplicate query detected on social.User (3 times)"
+            ),
+        ):
+            get_user(user.pk)
+
+
+def test_reports_each_caller(settings):
+    settings.ZEAL_DUPLICATE_QUERY_THRESHOLD = 3
+    settings.ZEAL_RAISE = False
+    user = UserFactory.create()
+    with zeal_context(), warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        get_user(user.pk)
+        _ = User.objects.filter(pk=user.pk).first()
+        get_user(user.pk)
+    assert len(w) == 1
+    message = str(w[0].message)
+    assert f"with params ({user.pk},)" in message
+    callers = re.findall(r"test_duplicates\.py:\d+ in (\w+)", message)
+    assert callers == ["get_user", "test_reports_each_caller", "get_user"]
+
+
+def test_ignores_queries_with_different_params(settings):
+    settings.ZEAL_DUPLICATE_QUERY_THRESHOLD = 3
+    users = UserFactory.create_batch(3)
+    with zeal_context():
+        for user in users:
+            get_user(user.pk)
+
+
+def test_ignores_writes(settings):
+    settings.ZEAL_DUPLICATE_QUERY_THRESHOLD = 3
+    user = UserFactory.create()
+    with zeal_context():
+        for _ in range(3):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE social_user SET username = %s WHERE id = %s",
+                    ["test", user.pk],
+                )
+
+
+def test_allowlist_applies_to_duplicates(settings):
+    settings.ZEAL_DUPLICATE_QUERY_THRESHOLD = 3
+    user = UserFactory.create()
+    with zeal_context(), zeal_ignore([{"model": "social.User"}]):
+        for _ in range(3):
+            get_user(user.pk)
+
+
+def test_duplicates_are_not_nplusones(settings):
+    settings.ZEAL_DUPLICATE_QUERY_THRESHOLD = 3
+    settings.ZEAL_DUPLICATE_QUERY_THRESHOLD = 2
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    with zeal_context():
+        # different params per user, so this is only an N+1
+        with pytest.raises(Exception) as excinfo:
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+        assert "N+1 detected" in str(excinfo.value)
+        assert not isinstance(excinfo.value, DuplicateQueryError)
+
+
+def test_sends_signal(settings, mocker):
+    settings.ZEAL_DUPLICATE_QUERY_THRESHOLD = 3
+    settings.ZEAL_RAISE = False
+    patched_signal = mocker.patch(
+        "zeal.listeners.duplicate_query_detected.send",
+    )
+    user = UserFactory.create()
+    with zeal_context(), warnings.catch_warnings(record=True):
+        warnings.simplefilter("always")
+        for _ in range(3):
+            get_user(user.pk)
+    patched_signal.assert_called_once()
+    assert patched_signal.call_args[1]["sender"] == duplicate_query_listener
+    exception = patched_signal.call_args[1]["exception"]
+    assert isinstance(exception, DuplicateQueryError)
@@ -0,0 +1,167 @@
+import re
+import threading
+
+import pytest
+from djangoproject.social.models import Post, User
+from zeal import (
+    NPlusOneError,
+    QueryBudgetError,
+    ZealExecutor,
+    assert_max_queries,
+    zeal_context,
+    zeal_ignore,
+)
+from zeal.executor import wrap
+from zeal.listeners import _nplusone_context
+
+from .factories import PostFactory, UserFactory
+
+# worker threads use their own database connections, so they can only see
+# committed data
+pytestmark = [pytest.mark.nozeal, pytest.mark.django_db(transaction=True)]
+
+
+def load_posts(user: User) -> list[Post]:
+    return list(user.posts.all())
+
+
+def load_all_posts() -> list[list[Post]]:
+    return [load_posts(user) for user in User.objects.all()]
+
+
+def test_detects_nplusones_in_worker_threads():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    with zeal_context(), ZealExecutor(max_workers=2) as executor:
+        future = executor.submit(load_all_posts)
+        with pytest.raises(
+            NPlusOneError,
+            match=re.escape("N+1 detected on social.User.posts"),
+        ):
+            future.result()
+
+
+def test_detects_nplusones_across_workers():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    with pytest.raises(
+        NPlusOneError,
+        match=(
+            re.escape("N+1 detected on social.User.posts at ")
+            + r".*test_executor\.py:\d+ in load_posts"
+        ),
+    ):
+        with zeal_context():
+            users = list(User.objects.all())
+            with ZealExecutor(max_workers=2) as executor:
+                # each worker loads the posts of one user
+                results = list(executor.map(load_posts, users))
+            assert [len(posts) for posts in results] == [1, 1]
+
+
+def test_worker_counts_are_merged_into_the_context():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    with zeal_context():
+        [user_1, user_2] = User.objects.all()
+        with ZealExecutor(max_workers=1) as executor:
+            executor.submit(load_posts, user_1).result()
+        context = _nplusone_context.get()
+        assert len(context.pending) == 1
+
+        # one more query from the same call site is an N+1
+        with pytest.raises(NPlusOneError):
+            load_posts(user_2)
+        assert not context.pending
+
+
+def test_merged_counts_respect_the_allowlist():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    with zeal_context():
+        users = list(User.objects.all())
+        with zeal_ignore([{"model": "social.User", "field": "posts"}]):
+            with ZealExecutor(max_workers=2) as executor:
+                list(executor.map(load_posts, users))
+
+
+def test_singly_loaded_instances_in_workers_are_not_nplusones():
+    users = UserFactory.create_batch(2)
+    for user in users:
+        PostFactory.create(author=user)
+
+    def load_user_posts(pk: int) -> list[Post]:
+        return load_posts(User.objects.get(pk=pk))
+
+    with zeal_context():
+        pks = [user.pk for user in users]
+        with zeal_ignore([{"model": "social.User", "field": "get()"}]):
+            with ZealExecutor(max_workers=2) as executor:
+                list(executor.map(load_user_posts, pks))
+
+
+def test_work_handed_off_in_zeal_ignore_is_merged_into_the_context():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    with pytest.raises(NPlusOneError):
+        with zeal_context():
+            users = list(User.objects.all())
+            with ZealExecutor(max_workers=2) as executor:
+                with zeal_ignore([{"model": "social.Post", "field": "*"}]):
+                    futures = [
+                        executor.submit(load_posts, user) for user in users
+                    ]
+                for future in futures:
+                    future.result()
+
+
+def test_work_merged_in_zeal_ignore_counts_towards_the_context():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    with pytest.raises(NPlusOneError):
+        with zeal_context():
+            users = list(User.objects.all())
+            with ZealExecutor(max_workers=1) as executor:
+                with zeal_ignore(
+                    [{"model": "social.User", "field": "following"}]
+                ):
+                    executor.submit(load_posts, users[0]).result()
+                    # merges the finished work before the block ends
+                    _ = list(users[0].following.all())
+            load_posts(users[1])
+
+
+def test_worker_queries_count_towards_the_budget():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    with pytest.raises(QueryBudgetError, match="3 queries run, 1 allowed"):
+        with assert_max_queries(1):
+            with ZealExecutor(max_workers=1) as executor:
+                executor.submit(
+                    lambda: (User.objects.count(), Post.objects.count())
+                ).result()
+            # the worker's queries are merged in at teardown
+            User.objects.count()
+
+
+def test_wrap_works_with_any_executor():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+    with zeal_context():
+        run = wrap(load_all_posts)
+        errors = []
+
+        def target():
+            try:
+                run()
+            except NPlusOneError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+    assert len(errors) == 1
+
+
+def test_wrap_is_a_no_op_outside_a_zeal_context():
+    assert wrap(load_all_posts) is load_all_posts
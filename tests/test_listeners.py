@@ -152,11 +152,11 @@ def test_resets_state_in_nested_context():
 
     # we're already in a zeal_context within each test, so let's set
     # some state.
-    n_plus_one_listener.ignore("Test:1")
-    n_plus_one_listener.notify(Post, "test_field", "Post:1")
+    n_plus_one_listener.ignore((User, 1))
+    n_plus_one_listener.notify(Post, "test_field", (Post, 1))
 
     context = _nplusone_context.get()
-    assert context.ignored == {"Test:1"}
+    assert context.ignored == {(User, 1)}
     assert len(context.calls.values()) == 1
     caller = list(context.calls.values())[0]
 
@@ -166,16 +166,16 @@ def test_resets_state_in_nested_context():
         assert context.ignored == set()
         assert list(context.calls.values()) == []
 
-        n_plus_one_listener.ignore("NestedTest:1")
-        n_plus_one_listener.notify(Post, "nested_test_field", "Post:1")
+        n_plus_one_listener.ignore((User, 2))
+        n_plus_one_listener.notify(Post, "nested_test_field", (Post, 1))
 
         context = _nplusone_context.get()
-        assert context.ignored == {"NestedTest:1"}
+        assert context.ignored == {(User, 2)}
         assert len(list(context.calls.values())) == 1
 
     # back outside the nested context, we're back to the old state
     context = _nplusone_context.get()
-    assert context.ignored == {"Test:1"}
+    assert context.ignored == {(User, 1)}
     assert list(context.calls.values()) == [caller]
 
 
@@ -258,6 +258,20 @@ def test_does_not_run_outside_of_context():
             _ = list(user.posts.all())
 
 
+@pytest.mark.nozeal
+def test_does_not_modify_default_context():
+    user = UserFactory.create()
+    n_plus_one_listener.ignore((User, user.pk))
+    n_plus_one_listener.notify(User, "posts", (User, user.pk))
+    with zeal_ignore():
+        _ = list(user.posts.all())
+
+    context = _nplusone_context.get()
+    assert not context.enabled
+    assert len(context.calls) == 0
+    assert len(context.ignored) == 0
+
+
 @pytest.mark.nozeal
 def test_validates_global_allowlist_model_name(settings):
     settings.ZEAL_ALLOWLIST = [{"model": "foo", "field": "*"}]
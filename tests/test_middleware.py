@@ -0,0 +1,294 @@
+import asyncio
+import re
+import warnings
+
+import pytest
+import pytest_mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.http import HttpRequest, HttpResponse
+from django.urls import URLResolver
+from djangoproject.social.models import Profile, User
+from zeal import NPlusOneError, QueryBudgetError, zeal_ignore
+from zeal.listeners import _nplusone_context
+from zeal.middleware import zeal_middleware
+
+from .factories import ProfileFactory, UserFactory
+
+# the middleware manages its own zeal context, so we don't want the
+# autouse fixture to enable zeal around these tests.
+pytestmark = [pytest.mark.nozeal, pytest.mark.django_db]
+
+
+@pytest.fixture
+def users_with_profiles():
+    [user_1, user_2] = UserFactory.create_batch(2)
+    ProfileFactory.create(user=user_1)
+    ProfileFactory.create(user=user_2)
+    return [user_1, user_2]
+
+
+def test_checks_every_request_without_sample_rate(users_with_profiles, client):
+    with pytest.raises(
+        NPlusOneError, match=re.escape("N+1 detected on social.User.profile")
+    ):
+        client.get("/users/")
+
+
+def test_skips_zeal_on_unsampled_requests(
+    settings, users_with_profiles, client, mocker: pytest_mock.MockerFixture
+):
+    settings.ZEAL_SAMPLE_RATE = 0
+    zeal_context = mocker.patch("zeal.middleware.zeal_context")
+
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        response = client.get("/users/")
+
+    assert response.status_code == 200
+    assert len(w) == 0
+    zeal_context.assert_not_called()
+
+
+def test_sampled_requests_warn_instead_of_raising(
+    settings, users_with_profiles, client
+):
+    settings.ZEAL_SAMPLE_RATE = 1
+    settings.ZEAL_RAISE = True
+
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        response = client.get("/users/")
+
+    assert response.status_code == 200
+    assert len(w) == 1
+    assert "N+1 detected on social.User.profile" in str(w[0].message)
+
+
+def test_sample_rate_is_respected(
+    settings, client, mocker: pytest_mock.MockerFixture
+):
+    settings.ZEAL_SAMPLE_RATE = 0.5
+    mocker.patch("zeal.middleware.random.random", side_effect=[0.4, 0.6])
+    zeal_context = mocker.patch("zeal.middleware.zeal_context")
+
+    client.get("/users/")
+    client.get("/users/")
+
+    zeal_context.assert_called_once_with(raise_errors=False)
+
+
+def test_sample_rate_can_be_set_per_url_name(
+    settings, users_with_profiles, client
+):
+    settings.ZEAL_SAMPLE_RATE = 1
+    settings.ZEAL_SAMPLE_RATES = {"users": 0}
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        response = client.get("/users/")
+    assert response.status_code == 200
+    assert len(w) == 0
+
+    settings.ZEAL_SAMPLE_RATE = 0
+    settings.ZEAL_SAMPLE_RATES = {"users": 1}
+    with pytest.warns(
+        UserWarning, match=re.escape("N+1 detected on social.User.profile")
+    ):
+        response = client.get("/users/")
+    assert response.status_code == 200
+
+
+def test_other_url_names_fall_back_to_sample_rate(
+    settings, users_with_profiles, client, mocker: pytest_mock.MockerFixture
+):
+    settings.ZEAL_SAMPLE_RATE = 1
+    settings.ZEAL_SAMPLE_RATES = {"users": 0}
+    zeal_context = mocker.patch("zeal.middleware.zeal_context")
+
+    response = client.get(f"/user/{users_with_profiles[0].pk}/")
+
+    assert response.status_code == 200
+    zeal_context.assert_called_once_with(raise_errors=False)
+
+
+def test_per_url_sample_rates_reuse_the_resolved_url(
+    settings, users_with_profiles, client, mocker: pytest_mock.MockerFixture
+):
+    settings.ZEAL_SAMPLE_RATES = {"users": 0}
+    resolve = mocker.spy(URLResolver, "resolve")
+
+    client.get("/users/")
+
+    assert resolve.call_count == 1
+
+
+def test_sample_rate_can_be_set_per_url_name_under_asgi(
+    settings, users_with_profiles, async_client
+):
+    settings.ZEAL_SAMPLE_RATE = 0
+    settings.ZEAL_SAMPLE_RATES = {"users": 1}
+    with pytest.warns(
+        UserWarning, match=re.escape("N+1 detected on social.User.profile")
+    ):
+        response = async_to_sync(async_client.get)("/users/")
+    assert response.status_code == 200
+
+
+def test_per_url_sample_rate_handles_unknown_urls(settings, client):
+    settings.ZEAL_SAMPLE_RATES = {"users": 1}
+    response = client.get("/does-not-exist/")
+    assert response.status_code == 404
+
+
+@sync_to_async
+def load_users() -> list[User]:
+    return list(User.objects.all())
+
+
+@sync_to_async
+def load_profile(user: User) -> Profile:
+    return user.profile
+
+
+@sync_to_async
+def load_profiles(users: list[User]) -> list[Profile]:
+    return [user.profile for user in users]
+
+
+class TestAsyncMiddleware:
+    def test_detects_nplusones(self, users_with_profiles):
+        async def get_response(request):
+            await load_profiles(await load_users())
+            return HttpResponse()
+
+        middleware = zeal_middleware(get_response)
+        with pytest.raises(
+            NPlusOneError,
+            match=re.escape("N+1 detected on social.User.profile"),
+        ):
+            async_to_sync(middleware)(HttpRequest())
+
+    def test_checks_query_budget(self, settings, users_with_profiles):
+        settings.ZEAL_MAX_QUERIES = 1
+
+        async def get_response(request):
+            # sync_to_async runs these on another thread's connection
+            await load_users()
+            await load_users()
+            await load_users()
+            return HttpResponse()
+
+        middleware = zeal_middleware(get_response)
+        with pytest.raises(QueryBudgetError, match="3 queries run, 1 allowed"):
+            async_to_sync(middleware)(HttpRequest())
+
+    def test_detects_nplusones_across_concurrent_tasks(
+        self, users_with_profiles
+    ):
+        async def get_response(request):
+            users = await load_users()
+            # each task loads a single profile from the same call site
+            await asyncio.gather(*(load_profile(user) for user in users))
+            return HttpResponse()
+
+        middleware = zeal_middleware(get_response)
+        with pytest.raises(
+            NPlusOneError,
+            match=re.escape("N+1 detected on social.User.profile"),
+        ):
+            async_to_sync(middleware)(HttpRequest())
+
+    def test_allowlist_applies_to_concurrent_tasks(self, users_with_profiles):
+        async def get_response(request):
+            users = await load_users()
+            with zeal_ignore([{"model": "social.User", "field": "profile"}]):
+                await asyncio.gather(*(load_profile(user) for user in users))
+            return HttpResponse()
+
+        middleware = zeal_middleware(get_response)
+        response = async_to_sync(middleware)(HttpRequest())
+        assert response.status_code == 200
+
+    def test_detects_nplusones_within_a_task(self, users_with_profiles):
+        async def get_response(request):
+            users = await load_users()
+            await asyncio.gather(load_profiles(users), asyncio.sleep(0))
+            return HttpResponse()
+
+        middleware = zeal_middleware(get_response)
+        with pytest.raises(
+            NPlusOneError,
+            match=re.escape("N+1 detected on social.User.profile"),
+        ):
+            async_to_sync(middleware)(HttpRequest())
+
+    def test_task_counts_roll_up_into_the_request(self, users_with_profiles):
+        counts = []
+
+        async def get_response(request):
+            [user_1, user_2] = await load_users()
+            await asyncio.gather(load_profile(user_1), asyncio.sleep(0))
+            context = _nplusone_context.get()
+            assert len(context.pending) == 2
+            try:
+                # one more query from the same call site is an N+1
+                await load_profile(user_2)
+            finally:
+                counts.extend(
+                    count
+                    for (model, field, _, _), count in context.calls.items()
+                    if (model, field) == (User, "profile")
+                )
+            return HttpResponse()
+
+        middleware = zeal_middleware(get_response)
+        with pytest.raises(
+            NPlusOneError,
+            match=re.escape("N+1 detected on social.User.profile"),
+        ):
+            async_to_sync(middleware)(HttpRequest())
+        assert counts == [2]
+
+    def test_concurrent_requests_are_isolated(self, users_with_profiles):
+        async def get_response(request):
+            users = await load_users()
+            # let the other request run in between
+            await asyncio.sleep(0)
+            await load_profile(users[request.index])
+            return HttpResponse()
+
+        middleware = zeal_middleware(get_response)
+
+        async def handle_requests():
+            requests = [HttpRequest(), HttpRequest()]
+            for index, request in enumerate(requests):
+                request.index = index  # type: ignore
+            return await asyncio.gather(
+                *(middleware(request) for request in requests)
+            )
+
+        responses = async_to_sync(handle_requests)()
+        assert [response.status_code for response in responses] == [
+            200,
+            200,
+        ]
+        # the requests' contexts never leak out
+        assert not _nplusone_context.get().enabled
+
+    def test_tasks_outliving_the_request_keep_its_context(
+        self, users_with_profiles
+    ):
+        tasks = []
+
+        async def get_response(request):
+            users = await load_users()
+            tasks.append(asyncio.ensure_future(load_profiles(users)))
+            return HttpResponse()
+
+        async def handle_request():
+            response = await zeal_middleware(get_response)(HttpRequest())
+            # the task still checks for N+1s after the request has ended
+            await tasks[0]
+            return response
+
+        with pytest.raises(NPlusOneError):
+            async_to_sync(handle_request)()
@@ -436,6 +436,13 @@ def test_detects_nplusone_due_to_deferred_fields_in_iterator():
         _ = post.author.username
 
 
+def test_ignores_deferred_fields_on_singly_loaded_instances():
+    users = UserFactory.create_batch(2)
+    with zeal_ignore([{"model": "social.User", "field": "get()"}]):
+        for user in users:
+            _ = User.objects.only("id").get(pk=user.pk).username
+
+
 def test_handles_prefetch_instead_of_select_related_with_deferred_fields():
     [user_1, user_2] = UserFactory.create_batch(2)
     PostFactory.create(author=user_1)
@@ -0,0 +1,135 @@
+import pickle
+import re
+import warnings
+
+import pytest
+from django.db.models.query_utils import DeferredAttribute
+from djangoproject.social.models import Post
+from zeal import OverfetchError, patch, zeal_context, zeal_ignore
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_does_not_detect_overfetching_by_default():
+    user = UserFactory.create()
+    PostFactory.create_batch(2, author=user)
+    with zeal_context():
+        for post in Post.objects.all():
+            _ = post.author_id
+
+
+def test_detects_unread_wide_columns(settings):
+    settings.ZEAL_DETECT_OVERFETCHING = True
+    settings.ZEAL_RAISE = False
+    user = UserFactory.create()
+    PostFactory.create_batch(2, author=user)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        with zeal_context():
+            for post in Post.objects.all():
+                _ = post.author_id
+    assert len(w) == 1
+    assert re.search(
+        r"Over-fetched columns on social\.Post at .*/test_overfetch\.py:\d+ "
+        r"in test_detects_unread_wide_columns: text loaded but never read\. "
+        r"Suggestion: \.only\('id', 'author'\)",
+        str(w[0].message),
+    )
+
+
+def test_does_not_report_read_columns(settings):
+    settings.ZEAL_DETECT_OVERFETCHING = True
+    user = UserFactory.create()
+    PostFactory.create_batch(2, author=user)
+    with zeal_context():
+        for post in Post.objects.all():
+            assert post.text
+        # reading the column on any instance counts
+        _ = Post.objects.all()[0].text
+
+
+def test_raises_at_end_of_context(settings):
+    settings.ZEAL_DETECT_OVERFETCHING = True
+    user = UserFactory.create()
+    PostFactory.create_batch(2, author=user)
+    with pytest.raises(OverfetchError):
+        with zeal_context():
+            _ = list(Post.objects.all())
+
+
+def test_ignores_deferred_columns(settings):
+    settings.ZEAL_DETECT_OVERFETCHING = True
+    user = UserFactory.create()
+    PostFactory.create_batch(2, author=user)
+    with zeal_context():
+        for post in Post.objects.only("id", "author"):
+            _ = post.author_id
+
+
+def test_allowlist_applies_to_overfetching(settings):
+    settings.ZEAL_DETECT_OVERFETCHING = True
+    user = UserFactory.create()
+    PostFactory.create_batch(2, author=user)
+    with zeal_context():
+        with zeal_ignore([{"model": "social.Post", "field": "text"}]):
+            _ = list(Post.objects.all())
+
+
+def test_tracked_instances_still_save_and_refresh(settings):
+    settings.ZEAL_DETECT_OVERFETCHING = True
+    settings.ZEAL_RAISE = False
+    user = UserFactory.create()
+    posts = PostFactory.create_batch(2, author=user)
+    with warnings.catch_warnings(), zeal_context():
+        warnings.simplefilter("ignore")
+        post = Post.objects.get(pk=posts[0].pk)
+        Post.objects.filter(pk=post.pk).update(text="updated")
+        post.refresh_from_db()
+        assert post.text == "updated"
+
+        post = Post.objects.get(pk=posts[0].pk)
+        post.author_id = UserFactory.create().pk
+        post.save()
+        assert Post.objects.values_list("text", flat=True).get(pk=post.pk) == (
+            "updated"
+        )
+
+
+def test_leaves_tracked_instances_untouched(
+    settings, django_assert_num_queries
+):
+    settings.ZEAL_DETECT_OVERFETCHING = True
+    user = UserFactory.create()
+    PostFactory.create(author=user)
+    with zeal_context():
+        post = Post.objects.get()
+        assert set(post.__dict__) == {"_state", "id", "author_id", "text"}
+        copy = pickle.loads(pickle.dumps(post))
+        assert copy.__dict__["text"] == post.text
+        post.author = user
+        assert post.text
+
+    # nothing is tracked, and nothing needs to be reloaded, once the
+    # context is over
+    with django_assert_num_queries(0):
+        assert post.text
+        assert copy.text
+        assert post.author == user
+
+
+def test_uninstall_stops_tracking_reads(settings):
+    settings.ZEAL_DETECT_OVERFETCHING = True
+    user = UserFactory.create()
+    PostFactory.create(author=user)
+    with zeal_context():
+        post = Post.objects.get()
+        assert post.text
+    assert hasattr(DeferredAttribute, "__set__")
+    try:
+        patch.uninstall()
+        assert not hasattr(DeferredAttribute, "__set__")
+        assert post.text
+    finally:
+        patch.install()
@@ -1,10 +1,17 @@
+import os
+import re
+import subprocess
 import sys
+from pathlib import Path
 
 import pytest
+from django.apps import apps
 from django.db import models
-from djangoproject.social.models import User
+from django.db.models.fields import related_descriptors
+from djangoproject.social.models import Post, User
+from zeal import NPlusOneError, listeners, patch, zeal_context
 
-from tests.factories import UserFactory
+from tests.factories import PostFactory, UserFactory
 
 pytestmark = pytest.mark.django_db
 
@@ -135,3 +142,200 @@ def test_handles_nested_relation_equality():
     result = CustomEqualityModel.objects.filter(name="leaf").first()
     assert result is not None
     _ = result.relation.relation
+
+
+@pytest.mark.nozeal
+def test_does_not_track_querysets_when_disabled():
+    user = UserFactory.create()
+    queryset = user.posts.all()
+    assert "_zeal_source" not in queryset.__dict__
+
+
+def test_tracks_related_querysets_without_per_instance_functions():
+    user = UserFactory.create()
+    queryset = user.posts.all()
+    assert queryset._zeal_source is not None  # type: ignore
+    assert "_fetch_all" not in queryset.__dict__
+    assert "_clone" not in queryset.__dict__
+
+    # clones share the source of the queryset they were derived from
+    filtered = queryset.filter(text="foo").exclude(text="bar")
+    assert filtered._zeal_source is queryset._zeal_source  # type: ignore
+
+    # untracked querysets are unaffected
+    assert User.objects.all()._zeal_source is None  # type: ignore
+
+
+@pytest.mark.nozeal
+def test_uninstall_restores_original_django_callables():
+    patches = list(patch._installed_patches)
+    assert patches
+    try:
+        patch.uninstall()
+        for owner, name, original in patches:
+            if original is patch._MISSING:
+                assert name not in vars(owner)
+            else:
+                assert vars(owner)[name] is original
+    finally:
+        patch.install()
+
+
+@pytest.mark.nozeal
+def test_does_not_detect_nplusones_when_uninstalled():
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+
+    # access a relation first so that Django caches the related manager
+    # class on the descriptor
+    with zeal_context(), pytest.raises(NPlusOneError):
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+
+    try:
+        patch.uninstall()
+        with zeal_context():
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+                _ = list(user.following.all())
+            for post in Post.objects.all():
+                _ = post.author
+    finally:
+        patch.install()
+
+    with zeal_context(), pytest.raises(NPlusOneError):
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+
+
+@pytest.mark.nozeal
+def test_lazy_patch_installs_on_first_setup(settings):
+    settings.ZEAL_LAZY_PATCH = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+
+    patch.uninstall()
+    try:
+        apps.get_app_config("zeal").ready()
+        assert not patch._installed
+
+        with zeal_context(), pytest.raises(NPlusOneError):
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+        assert patch._installed
+
+        # only the first setup() installs the patches
+        patch.uninstall()
+        with zeal_context():
+            assert not patch._installed
+    finally:
+        listeners._install_on_setup = False
+        patch.install()
+
+
+@pytest.mark.nozeal
+def test_lazy_patch_does_not_import_patches_at_startup(tmp_path):
+    (tmp_path / "lazy_settings.py").write_text(
+        "from djangoproject.settings import *\nZEAL_LAZY_PATCH = True\n"
+    )
+    script = (
+        "import sys, django; django.setup(); "
+        "print('zeal.patch' in sys.modules); "
+        "import zeal; zeal.setup(); "
+        "print('zeal.patch' in sys.modules)"
+    )
+    tests_dir = Path(__file__).parent
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path,
+        env={
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": "lazy_settings",
+            "PYTHONPATH": os.pathsep.join(
+                map(
+                    str,
+                    [
+                        tmp_path,
+                        tests_dir.parent / "src",
+                        tests_dir,
+                        tests_dir.parent,
+                    ],
+                )
+            ),
+        },
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["False", "True"]
+
+
+@pytest.mark.nozeal
+def test_install_skips_manager_reset_while_apps_are_loading(
+    monkeypatch, mocker
+):
+    patch.uninstall()
+    reset = mocker.spy(patch, "_reset_related_manager_caches")
+    try:
+        monkeypatch.setattr(apps, "ready", False)
+        patch.install()
+        reset.assert_not_called()
+
+        patch.uninstall()
+        monkeypatch.undo()
+        reset.reset_mock()
+        patch.install()
+        reset.assert_called_once()
+    finally:
+        monkeypatch.undo()
+        patch.install()
+
+
+def test_install_is_idempotent():
+    patches = list(patch._installed_patches)
+    patch.install()
+    assert patch._installed_patches == patches
+
+
+def test_manager_factories_are_memoized():
+    posts_rel = User._meta.get_field("posts")
+    first = related_descriptors.create_reverse_many_to_one_manager(
+        models.Manager, posts_rel
+    )
+    second = related_descriptors.create_reverse_many_to_one_manager(
+        models.Manager, posts_rel
+    )
+    assert first is second
+
+    following_rel = User._meta.get_field("following").remote_field
+    first = related_descriptors.create_forward_many_to_many_manager(
+        models.Manager, following_rel, reverse=False
+    )
+    second = related_descriptors.create_forward_many_to_many_manager(
+        models.Manager, following_rel, False
+    )
+    assert first is second
+    assert (
+        first
+        is not related_descriptors.create_forward_many_to_many_manager(
+            models.Manager, following_rel, reverse=True
+        )
+    )
+
+
+def test_detects_nplusone_with_custom_related_manager():
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    with pytest.raises(NPlusOneError, match=re.escape("social.User.posts")):
+        for user in User.objects.all():
+            _ = list(user.posts(manager="objects").all())
+
+
+def test_instance_keys_are_model_and_pk():
+    user = UserFactory.create()
+    assert patch.get_instance_key(user) == (User, user.pk)
+    assert patch.get_instance_key({"id": user.pk}) is None
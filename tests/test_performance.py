@@ -1,13 +1,17 @@
 import pytest
+from django.apps import apps
 from djangoproject.social.models import Post, Profile, User
-from zeal import zeal_context, zeal_ignore
+from zeal import allowlist, patch, zeal_context, zeal_ignore
+from zeal.allowlist import _validate_allowlist, get_settings_allowlist
+from zeal.constants import ALL_APPS
 
 from .factories import PostFactory, ProfileFactory, UserFactory
 
 pytestmark = [pytest.mark.nozeal, pytest.mark.django_db]
 
 
-def test_performance(benchmark):
+@pytest.fixture
+def workload_data():
     users = UserFactory.create_batch(10)
 
     # everyone follows everyone
@@ -31,34 +35,96 @@ def test_performance(benchmark):
     for user in users:
         PostFactory.create_batch(10, author=user)
 
+
+def _run_workload():
+    # Test forward & reverse many-to-one relationships (Post -> User, User -> Posts)
+    posts = Post.objects.all()
+    for post in posts:
+        _ = post.author.username  # forward many-to-one
+        _ = list(post.author.posts.all())  # reverse many-to-one
+
+    # Test forward & reverse one-to-one relationships (Profile -> User, User -> Profile)
+    profiles = Profile.objects.all()
+    for profile in profiles:
+        _ = profile.user.username  # forward one-to-one
+        _ = profile.user.profile.display_name  # reverse one-to-one
+
+    # Test forward & reverse many-to-many relationships
+    users = User.objects.all()
+    for user in users:
+        _ = list(user.following.all())  # forward many-to-many
+        _ = list(user.followers.all())  # reverse many-to-many
+        _ = list(user.blocked.all())  # many-to-many without related_name
+
+        # Test chained relationships
+        for follower in user.followers.all():
+            _ = follower.profile.display_name
+            _ = list(follower.posts.all())
+
+
+def test_performance(benchmark, workload_data):
     @benchmark
     def _run_benchmark():
         with (
             zeal_context(),
             zeal_ignore(),
         ):
-            # Test forward & reverse many-to-one relationships (Post -> User, User -> Posts)
-            posts = Post.objects.all()
-            for post in posts:
-                _ = post.author.username  # forward many-to-one
-                _ = list(post.author.posts.all())  # reverse many-to-one
-
-            # Test forward & reverse one-to-one relationships (Profile -> User, User -> Profile)
-            profiles = Profile.objects.all()
-            for profile in profiles:
-                _ = profile.user.username  # forward one-to-one
-                _ = profile.user.profile.display_name  # reverse one-to-one
-
-            # Test forward & reverse many-to-many relationships
-            users = User.objects.all()
-            for user in users:
-                _ = list(user.following.all())  # forward many-to-many
-                _ = list(user.followers.all())  # reverse many-to-many
-                _ = list(
-                    user.blocked.all()
-                )  # many-to-many without related_name
-
-                # Test chained relationships
-                for follower in user.followers.all():
-                    _ = follower.profile.display_name
-                    _ = list(follower.posts.all())
+            _run_workload()
+
+
+def test_performance_uninstalled(benchmark, workload_data):
+    """
+    With zeal uninstalled, this should match the unpatched Django ORM.
+    """
+    patch.uninstall()
+    try:
+
+        @benchmark
+        def _run_benchmark():
+            _run_workload()
+
+    finally:
+        patch.install()
+
+
+def test_startup_performance(benchmark, monkeypatch, settings):
+    """
+    What every process does at startup: installing the patches while the
+    app registry is loading, then validating ZEAL_ALLOWLIST the first time
+    zeal is enabled. Neither should do any work per installed model.
+    """
+    settings.ZEAL_ALLOWLIST = [
+        {"model": "social.User", "field": "posts"},
+        {"model": "social.Post", "field": "author"},
+    ]
+
+    def setup():
+        patch.uninstall()
+        ALL_APPS.clear()
+        allowlist._settings_allowlist = None
+
+    def start():
+        apps.get_app_config("zeal").ready()
+        get_settings_allowlist()
+
+    monkeypatch.setattr(apps, "ready", False)
+    try:
+        benchmark.pedantic(start, setup=setup, rounds=20)
+    finally:
+        monkeypatch.undo()
+        patch.install()
+    # unlike walking every model, only the allowlisted ones are looked up
+    assert sorted(ALL_APPS) == ["social.Post", "social.User"]
+
+
+def test_allowlist_validation_performance(benchmark):
+    @benchmark
+    def _run_benchmark():
+        # each model is looked up the first time an allowlist names it
+        ALL_APPS.clear()
+        _validate_allowlist(
+            [
+                {"model": "social.User", "field": "posts"},
+                {"model": "social.Post", "field": "author"},
+            ]
+        )
@@ -0,0 +1,135 @@
+import re
+import warnings
+
+import pytest
+from django.db.models import Prefetch
+from djangoproject.social.models import User
+from zeal import UnusedPrefetchError, zeal_context, zeal_ignore
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_does_not_detect_unused_prefetches_by_default():
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with zeal_context():
+        _ = list(User.objects.prefetch_related("posts"))
+
+
+def test_detects_unused_prefetch(settings):
+    settings.ZEAL_DETECT_UNUSED_PREFETCHES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with pytest.raises(
+        UnusedPrefetchError,
+        match=re.escape("Unused prefetch detected on social.User.posts"),
+    ):
+        with zeal_context():
+            queryset = User.objects.prefetch_related("posts")
+            for user in queryset:
+                _ = user.username
+
+
+def test_message_includes_site_and_rows(settings):
+    settings.ZEAL_DETECT_UNUSED_PREFETCHES = True
+    settings.ZEAL_RAISE = False
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        with zeal_context():
+            queryset = User.objects.prefetch_related("posts").order_by("id")
+            _ = list(queryset)
+    assert len(w) == 1
+    assert re.search(
+        r"prefetch_related\('posts'\) at .*/test_prefetch\.py:\d+ in "
+        r"test_message_includes_site_and_rows fetched 3 rows that were "
+        r"never read",
+        str(w[0].message),
+    )
+
+
+def test_reading_any_instance_counts_as_used(settings):
+    settings.ZEAL_DETECT_UNUSED_PREFETCHES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with zeal_context():
+        user = User.objects.prefetch_related("posts").first()
+        assert user is not None
+        _ = list(user.posts.all())
+
+
+def test_detects_unused_nested_prefetch(settings):
+    settings.ZEAL_DETECT_UNUSED_PREFETCHES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with pytest.raises(UnusedPrefetchError, match=r"social\.User\.posts"):
+        with zeal_context():
+            for user in User.objects.prefetch_related("following__posts"):
+                _ = list(user.following.all())
+
+
+def test_ignores_to_attr_prefetches(settings):
+    settings.ZEAL_DETECT_UNUSED_PREFETCHES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with zeal_context():
+        _ = list(
+            User.objects.prefetch_related(
+                Prefetch("posts", to_attr="post_list")
+            )
+        )
+
+
+def test_does_not_report_on_error(settings):
+    settings.ZEAL_DETECT_UNUSED_PREFETCHES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with pytest.raises(ValueError):
+        with zeal_context():
+            _ = list(User.objects.prefetch_related("posts"))
+            raise ValueError
+
+
+def test_allowlist_applies_to_unused_prefetches(settings):
+    settings.ZEAL_DETECT_UNUSED_PREFETCHES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with zeal_context():
+        with zeal_ignore([{"model": "social.User", "field": "posts"}]):
+            _ = list(User.objects.prefetch_related("posts"))
+
+
+def test_allowlisted_prefetch_does_not_hide_other_prefetches(settings):
+    settings.ZEAL_DETECT_UNUSED_PREFETCHES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create_batch(2, author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    with pytest.raises(
+        UnusedPrefetchError,
+        match=re.escape("Unused prefetch detected on social.User.following"),
+    ):
+        with zeal_context():
+            with zeal_ignore([{"model": "social.User", "field": "posts"}]):
+                queryset = User.objects.prefetch_related("posts", "following")
+                for user in queryset:
+                    _ = list(user.posts.all())
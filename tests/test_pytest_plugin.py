@@ -0,0 +1,228 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from djangoproject.social.models import User
+from zeal import setup, teardown
+from zeal.report import SessionReport
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+TESTS_DIR = Path(__file__).parent
+SRC_DIR = TESTS_DIR.parent / "src"
+
+TEST_FILE = """
+import pytest
+from djangoproject.social.models import User
+from tests.factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def users():
+    for user in UserFactory.create_batch(2):
+        PostFactory.create(author=user)
+
+
+def load_posts():
+    for user in User.objects.all():
+        _ = list(user.posts.all())
+
+
+def test_nplusone(users):
+    load_posts()
+
+
+def test_other_nplusone(users):
+    load_posts()
+
+
+@pytest.mark.nozeal
+def test_not_checked(users):
+    load_posts()
+
+
+def test_fine(users):
+    _ = list(User.objects.prefetch_related("posts"))
+"""
+
+
+def run_pytest(tmp_path: Path, *args: str) -> subprocess.CompletedProcess:
+    (tmp_path / "pytest.ini").write_text(
+        "[pytest]\n"
+        "DJANGO_SETTINGS_MODULE = djangoproject.settings\n"
+        "addopts = --nomigrations -p no:cacheprovider\n"
+    )
+    (tmp_path / "test_app.py").write_text(TEST_FILE)
+    return subprocess.run(
+        [sys.executable, "-m", "pytest", "-p", "zeal.pytest_plugin", *args],
+        cwd=tmp_path,
+        env={
+            **os.environ,
+            # `-p` plugins are imported before the ini's pythonpath applies
+            "PYTHONPATH": os.pathsep.join(
+                map(str, [SRC_DIR, TESTS_DIR, TESTS_DIR.parent])
+            ),
+        },
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+@pytest.mark.nozeal
+def test_does_nothing_without_options(tmp_path):
+    result = run_pytest(tmp_path)
+    assert result.returncode == 0, result.stdout
+    assert "4 passed" in result.stdout
+
+
+@pytest.mark.nozeal
+def test_zeal_option_fails_tests_with_nplusones(tmp_path):
+    result = run_pytest(tmp_path, "--zeal")
+    assert result.returncode == 1, result.stdout
+    assert "2 failed, 2 passed" in result.stdout
+    assert "NPlusOneError: N+1 detected on social.User.posts" in result.stdout
+
+
+@pytest.mark.nozeal
+def test_writes_session_report(tmp_path):
+    result = run_pytest(
+        tmp_path, "--zeal-report=report.jsonl", "-W", "ignore::UserWarning"
+    )
+    # ZEAL_RAISE still applies in report mode, once per test
+    assert result.returncode == 1, result.stdout
+    assert "4 passed, 2 errors" in result.stdout
+    assert "1 N+1 call sites found, written to report.jsonl" in result.stdout
+    [line] = (tmp_path / "report.jsonl").read_text().splitlines()
+    record = json.loads(line)
+    assert record["model"] == "social.User"
+    assert record["field"] == "posts"
+    assert record["count"] == 4
+    assert record["contexts"] == 2
+    assert record["tests"] == [
+        "test_app.py::test_nplusone",
+        "test_app.py::test_other_nplusone",
+    ]
+
+
+@pytest.mark.nozeal
+def test_merges_results_of_xdist_workers(tmp_path):
+    pytest.importorskip("xdist")
+    (tmp_path / "conftest.py").write_text(
+        "from django.conf import settings\n\n\n"
+        "def pytest_configure(config):\n"
+        '    settings.ZEAL_BASELINE_FILE = "zeal-baseline.json"\n'
+    )
+    result = run_pytest(
+        tmp_path,
+        "-n",
+        "2",
+        "--zeal-report=report.jsonl",
+        "-W",
+        "ignore::UserWarning",
+    )
+    assert "4 passed, 2 errors" in result.stdout
+    assert "1 N+1 call sites found, written to report.jsonl" in result.stdout
+    [line] = (tmp_path / "report.jsonl").read_text().splitlines()
+    record = json.loads(line)
+    assert record["count"] == 4
+    assert record["contexts"] == 2
+    assert sorted(record["tests"]) == [
+        "test_app.py::test_nplusone",
+        "test_app.py::test_other_nplusone",
+    ]
+
+    result = run_pytest(tmp_path, "-n", "2", "--zeal-update-baseline")
+    assert result.returncode == 0, result.stdout
+    data = json.loads((tmp_path / "zeal-baseline.json").read_text())
+    assert len(data["entries"]) == 1
+
+    # the baseline's entry is only hit on the workers
+    result = run_pytest(tmp_path, "-n", "2", "--zeal")
+    assert result.returncode == 0, result.stdout
+    assert "weren't hit" not in result.stdout
+
+
+class TestSessionReport:
+    def get_report(self, settings):
+        settings.ZEAL_RAISE = False
+        for user in UserFactory.create_batch(2):
+            PostFactory.create(author=user)
+        token = setup(report=True)
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+        with pytest.warns(UserWarning):
+            report = teardown(token)
+        assert report is not None
+        return report
+
+    def test_aggregates_reports(self, settings):
+        report = self.get_report(settings)
+        session = SessionReport()
+        session.add(report, "test_a")
+        session.add(report, "test_b")
+        [record] = session.records()
+        assert record["count"] == 4
+        assert record["contexts"] == 2
+        assert record["tests"] == ["test_a", "test_b"]
+        assert record["stack"][0][2] == "get_report"
+
+    def test_merges_records_from_other_processes(self, settings):
+        report = self.get_report(settings)
+        worker_1 = SessionReport()
+        worker_1.add(report, "test_a")
+        worker_2 = SessionReport()
+        worker_2.add(report, "test_b")
+        controller = SessionReport()
+        # records go through JSON-compatible types only
+        controller.merge(json.loads(json.dumps(worker_1.records())))
+        controller.merge(json.loads(json.dumps(worker_2.records())))
+        assert controller.records() == [
+            {**worker_1.records()[0], "count": 4, "contexts": 2}
+            | {"tests": ["test_a", "test_b"]}
+        ]
+
+    def test_ranks_by_db_time_then_count(self):
+        session = SessionReport()
+        base = {
+            "model": "social.User",
+            "filename": "f.py",
+            "contexts": 1,
+            "tests": [],
+            "stack": [],
+            "suggestion": None,
+            "rows": None,
+        }
+        session.merge(
+            [
+                {
+                    **base,
+                    "field": "a",
+                    "lineno": 1,
+                    "count": 9,
+                    "db_time_ms": 1.0,
+                },
+                {
+                    **base,
+                    "field": "b",
+                    "lineno": 2,
+                    "count": 2,
+                    "db_time_ms": 5.0,
+                },
+                {
+                    **base,
+                    "field": "c",
+                    "lineno": 3,
+                    "count": 3,
+                    "db_time_ms": 1.0,
+                },
+            ]
+        )
+        assert [r["field"] for r in session.records()] == ["b", "a", "c"]
@@ -0,0 +1,84 @@
+import re
+import warnings
+
+import pytest
+from django.db import connection
+from djangoproject.social.models import Post, User
+from zeal import NPlusOneError, zeal_context
+from zeal.listeners import _nplusone_context
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def costs_by_field():
+    return {
+        key[1]: (cost.time, cost.rows)
+        for key, cost in _nplusone_context.get().costs.items()
+    }
+
+
+def test_does_not_measure_by_default():
+    users = UserFactory.create_batch(3)
+    for i, user in enumerate(users):
+        PostFactory.create_batch(i + 1, author=user)
+    with zeal_context():
+        with pytest.raises(NPlusOneError) as exc_info:
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+        assert "DB time" not in str(exc_info.value)
+        assert _nplusone_context.get().costs == {}
+
+
+def test_includes_cost_in_alerts(settings):
+    settings.ZEAL_MEASURE_QUERIES = True
+    users = UserFactory.create_batch(3)
+    for i, user in enumerate(users):
+        PostFactory.create_batch(i + 1, author=user)
+    with zeal_context():
+        with pytest.raises(
+            NPlusOneError,
+            match=re.escape("N+1 detected on social.User.posts: 2 queries, ")
+            + r"[\d.,]+ ms DB time, 1 rows at ",
+        ):
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+
+
+def test_records_time_and_rows_per_key(settings):
+    settings.ZEAL_MEASURE_QUERIES = True
+    settings.ZEAL_RAISE = False
+    users = UserFactory.create_batch(3)
+    for i, user in enumerate(users):
+        PostFactory.create_batch(i + 1, author=user)
+    with zeal_context(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+        for post in Post.objects.all():
+            _ = post.author
+        costs = costs_by_field()
+    assert costs.keys() == {"posts", "author"}
+    assert costs["posts"][0] > 0
+    assert costs["posts"][1] == 6
+    assert costs["author"][1] == 6
+
+
+def test_records_cost_of_raw_sql(settings):
+    settings.ZEAL_MEASURE_QUERIES = True
+    settings.ZEAL_DETECT_SQL = True
+    settings.ZEAL_RAISE = False
+    users = UserFactory.create_batch(3)
+    for i, user in enumerate(users):
+        PostFactory.create_batch(i + 1, author=user)
+    with zeal_context(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for user in users:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT username FROM social_user WHERE id = %s",
+                    [user.id],
+                )
+        [(seconds, _)] = costs_by_field().values()
+    assert seconds > 0
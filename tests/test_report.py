@@ -0,0 +1,139 @@
+import json
+import re
+import warnings
+
+import pytest
+from djangoproject.social.models import Post, User
+from zeal import NPlusOneError, setup, teardown, zeal_context, zeal_ignore
+from zeal.listeners import REPORT_SAMPLE_STACKS
+from zeal.signals import report_generated
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def run_nplusones():
+    for user in User.objects.all():
+        _ = list(user.posts.all())
+    for post in Post.objects.all():
+        _ = post.author
+
+
+def test_teardown_returns_one_report_per_context(settings):
+    settings.ZEAL_REPORT = True
+    settings.ZEAL_RAISE = False
+    settings.ZEAL_SUGGEST_FIXES = True
+    for user in UserFactory.create_batch(5):
+        PostFactory.create(author=user)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        token = setup()
+        run_nplusones()
+        report = teardown(token)
+    assert len(w) == 1
+    assert report is not None
+    assert [(e.model, e.field, e.count) for e in report.entries] == [
+        ("social.User", "posts", 5),
+        ("social.Post", "author", 5),
+    ]
+    entry = report.entries[0]
+    assert entry.filename == __file__
+    assert len(entry.stacks) == REPORT_SAMPLE_STACKS
+    assert entry.stacks[0][0][2] == "run_nplusones"
+    assert entry.suggestion is not None
+    assert entry.suggestion.startswith(
+        'User.objects.prefetch_related("posts")'
+    )
+    message = str(w[0].message)
+    assert message.startswith("2 N+1s detected:\n")
+    assert "N+1 detected on social.User.posts (5 queries) at " in message
+
+
+def test_report_raises_once_at_teardown(settings):
+    settings.ZEAL_REPORT = True
+    for user in UserFactory.create_batch(5):
+        PostFactory.create(author=user)
+    with pytest.raises(NPlusOneError, match=re.escape("2 N+1s detected")):
+        with zeal_context():
+            run_nplusones()
+
+
+def test_empty_report_does_not_alert(settings):
+    settings.ZEAL_REPORT = True
+    settings.ZEAL_RAISE = False
+    for user in UserFactory.create_batch(5):
+        PostFactory.create(author=user)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        token = setup()
+        _ = list(User.objects.all())
+        report = teardown(token)
+    assert report is not None
+    assert report.entries == []
+    assert w == []
+
+
+def test_ignored_nplusones_are_left_out(settings):
+    settings.ZEAL_REPORT = True
+    settings.ZEAL_RAISE = False
+    for user in UserFactory.create_batch(5):
+        PostFactory.create(author=user)
+    token = setup()
+    with zeal_ignore([{"model": "social.User"}]):
+        run_nplusones()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        report = teardown(token)
+    assert report is not None
+    assert [e.field for e in report.entries] == ["author"]
+
+
+def test_sends_signal_and_writes_file(settings, tmp_path):
+    settings.ZEAL_REPORT = True
+    settings.ZEAL_RAISE = False
+    for user in UserFactory.create_batch(5):
+        PostFactory.create(author=user)
+    path = tmp_path / "zeal.jsonl"
+    settings.ZEAL_REPORT_FILE = str(path)
+    reports = []
+
+    def receiver(sender, report, **kwargs):
+        reports.append(report)
+
+    report_generated.connect(receiver)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for _ in range(2):
+                with zeal_context():
+                    run_nplusones()
+    finally:
+        report_generated.disconnect(receiver)
+    assert len(reports) == 2
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    data = json.loads(lines[0])
+    assert [
+        (entry["model"], entry["field"], entry["count"])
+        for entry in data["entries"]
+    ] == [("social.User", "posts", 5), ("social.Post", "author", 5)]
+    assert data["entries"][0]["suggestion"] == reports[0].entries[0].suggestion
+
+
+def test_includes_cost_when_measured(settings):
+    settings.ZEAL_REPORT = True
+    settings.ZEAL_RAISE = False
+    settings.ZEAL_MEASURE_QUERIES = True
+    for user in UserFactory.create_batch(5):
+        PostFactory.create(author=user)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        token = setup()
+        run_nplusones()
+        report = teardown(token)
+    assert report is not None
+    assert report.entries[0].rows == 5
+    assert report.entries[0].db_time_ms is not None
+    assert "5 queries" in report.format()
+    assert "ms DB time, 5 rows" in report.format()
@@ -0,0 +1,176 @@
+import re
+import threading
+import warnings
+
+import pytest
+from django.db import connection
+from django.db.models import prefetch_related_objects
+from django.db.models.signals import class_prepared
+from djangoproject.social.models import Post, Profile, User
+from zeal import NPlusOneError, patch, sql, zeal_context, zeal_ignore
+from zeal.listeners import _execute_wrapper
+from zeal.sql import fingerprint, parse_query
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestFingerprint:
+    def test_strips_parameters_and_literals(self):
+        assert fingerprint(
+            "SELECT * FROM t WHERE a = %s AND b = 'x''y' AND c = 1.5"
+        ) == ("SELECT * FROM t WHERE a = ? AND b = ? AND c = ?")
+
+    def test_keeps_identifiers_with_digits(self):
+        assert fingerprint('SELECT "t1"."a" FROM t1 LIMIT 21') == (
+            'SELECT "t1"."a" FROM t1 LIMIT ?'
+        )
+
+    def test_collapses_in_lists(self):
+        assert fingerprint("SELECT * FROM t WHERE id IN (1, 2,3)") == (
+            fingerprint("SELECT * FROM t WHERE id IN (%s)")
+        )
+
+    def test_collapses_whitespace(self):
+        assert fingerprint("SELECT *\n  FROM t") == "SELECT * FROM t"
+
+
+class TestParseQuery:
+    def test_maps_tables_to_models(self):
+        sql = 'SELECT "social_post"."id" FROM "social_post" WHERE id = 1'
+        assert parse_query(sql) == (
+            Post,
+            'SELECT "social_post"."id" FROM "social_post" WHERE id = ?',
+        )
+
+    def test_ignores_writes_and_unknown_tables(self):
+        assert parse_query('UPDATE "social_post" SET text = %s') is None
+        assert parse_query("SELECT * FROM unknown_table") is None
+        assert parse_query("SELECT 1") is None
+
+    def test_is_reset_when_a_model_is_registered(self):
+        parse_query('SELECT "social_post"."id" FROM "social_post"')
+        class_prepared.send(sender=Profile)
+        assert sql._table_models is None
+        assert parse_query.cache_info().currsize == 0
+
+
+def test_does_not_detect_sql_by_default():
+    [user_1, user_2] = UserFactory.create_batch(2)
+    with zeal_context():
+        for user in [user_1, user_2]:
+            _ = list(Post.objects.filter(author_id=user.id))
+
+
+def test_detects_repeated_raw_sql(settings):
+    settings.ZEAL_DETECT_SQL = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    with zeal_context():
+        with pytest.raises(
+            NPlusOneError,
+            match=re.escape("N+1 detected on social.User from SQL: SELECT"),
+        ):
+            for user in [user_1, user_2]:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT username FROM social_user WHERE id = %s",
+                        [user.id],
+                    )
+
+
+def test_detects_queries_from_managers(settings):
+    settings.ZEAL_DETECT_SQL = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    with zeal_context():
+        with pytest.raises(NPlusOneError, match="social.Post from SQL"):
+            for user in [user_1, user_2]:
+                _ = list(Post.objects.filter(author_id=user.id))
+
+
+def test_does_not_double_report_orm_nplusones(settings):
+    settings.ZEAL_DETECT_SQL = True
+    settings.ZEAL_RAISE = False
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    with zeal_context(), warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        for user in User.objects.all():
+            _ = list(user.posts.all())
+        for post in Post.objects.all():
+            _ = post.author
+    assert [str(warning.message).split(" at ")[0] for warning in w] == [
+        "N+1 detected on social.User.posts",
+        "N+1 detected on social.Post.author",
+    ]
+
+
+# the reverse foreign key's query runs inside get_prefetch_querysets(), the
+# many-to-many one only once Django evaluates the returned queryset
+@pytest.mark.parametrize("field", ["posts", "following"])
+def test_reports_per_instance_prefetches_once(settings, field):
+    settings.ZEAL_DETECT_SQL = True
+    settings.ZEAL_RAISE = False
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    user_1.following.add(user_2)
+    user_2.following.add(user_1)
+    with zeal_context(), warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        for user in [user_1, user_2]:
+            prefetch_related_objects([user], field)
+    assert [str(warning.message).split(" at ")[0] for warning in w] == [
+        f"N+1 detected on social.User.{field}",
+    ]
+
+
+def test_allowlist_applies_to_sql(settings):
+    settings.ZEAL_DETECT_SQL = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    with zeal_context(), zeal_ignore([{"model": "social.Post"}]):
+        for user in [user_1, user_2]:
+            _ = list(Post.objects.filter(author_id=user.id))
+
+
+def test_adds_execute_wrapper_once_per_connection(settings):
+    settings.ZEAL_DETECT_SQL = True
+    assert connection.execute_wrappers.count(_execute_wrapper) == 1
+    with zeal_context(), zeal_context():
+        assert connection.execute_wrappers.count(_execute_wrapper) == 1
+    assert connection.execute_wrappers.count(_execute_wrapper) == 1
+
+
+@pytest.mark.nozeal
+def test_execute_wrapper_does_nothing_outside_of_context(settings):
+    settings.ZEAL_DETECT_SQL = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    for user in [user_1, user_2]:
+        _ = list(Post.objects.filter(author_id=user.id))
+
+
+@pytest.mark.nozeal
+def test_adds_execute_wrapper_to_connections_of_other_threads():
+    wrappers = []
+
+    def target():
+        # connections are per thread
+        connection.ensure_connection()
+        wrappers.extend(connection.execute_wrappers)
+        connection.close()
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    assert wrappers == [_execute_wrapper]
+
+
+@pytest.mark.nozeal
+def test_uninstall_removes_execute_wrapper():
+    try:
+        patch.uninstall()
+        assert _execute_wrapper not in connection.execute_wrappers
+    finally:
+        patch.install()
+    assert _execute_wrapper in connection.execute_wrappers
@@ -0,0 +1,247 @@
+import pytest
+from djangoproject.social.models import User
+from zeal import get_memory_usage, zeal_context, zeal_ignore
+from zeal.listeners import _nplusone_context
+from zeal.store import CallStore, IgnoredKeys, StackTable
+
+from .factories import PostFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestStackTable:
+    def test_round_trips_stacks(self):
+        table = StackTable()
+        stack = [("a.py", 3, "inner"), ("b.py", 2, "outer")]
+        assert table.get(table.intern(stack)) == stack
+        assert table.get(table.intern([])) == []
+
+    def test_shares_common_prefixes(self):
+        table = StackTable()
+        outer = [("views.py", 10, "view"), ("main.py", 1, "main")]
+        first = table.intern([("a.py", 1, "a"), *outer])
+        second = table.intern([("b.py", 1, "b"), *outer])
+        assert first != second
+        # two shared outer frames plus one leaf per stack
+        assert len(table) == 4
+        assert table.intern([("a.py", 1, "a"), *outer]) == first
+        assert len(table) == 4
+
+
+class TestCallStore:
+    def test_counts_calls_per_key(self):
+        store = CallStore()
+        assert store.record("a") == 1
+        assert store.record("a") == 2
+        assert store.record("b") == 1
+        assert dict(store.items()) == {"a": 2, "b": 1}
+        assert store.stacks("a") == []
+
+    def test_keeps_stacks_when_given(self):
+        store = CallStore()
+        store.record("a", [("views.py", 1, "view")])
+        store.record("a", [("views.py", 2, "view")])
+        assert store.stacks("a") == [
+            [("views.py", 1, "view")],
+            [("views.py", 2, "view")],
+        ]
+
+    def test_repeated_stacks_are_run_length_encoded(self):
+        store = CallStore()
+        stack = [("views.py", 1, "view")]
+        for _ in range(100):
+            store.record("a", [*stack])
+        store.record("a", [("views.py", 2, "view")])
+        assert store._stacks["a"] == [[0, 100], [1, 1]]
+        assert len(store.stacks("a")) == 101
+        assert store.stacks("a")[0] == stack
+
+    def test_merges_other_stores(self):
+        store = CallStore()
+        store.record("a", [("views.py", 1, "view")])
+        fork = store.fork()
+        fork.record("a", [("views.py", 1, "view")])
+        fork.record("b")
+        other = CallStore()
+        other.record("a", [("tasks.py", 5, "task")])
+
+        store.merge(fork)
+        store.merge(other)
+
+        assert dict(store.items()) == {"a": 3, "b": 1}
+        assert store.stacks("a") == [
+            [("views.py", 1, "view")],
+            [("views.py", 1, "view")],
+            [("tasks.py", 5, "task")],
+        ]
+
+    def test_merging_respects_max_keys(self):
+        store = CallStore(max_keys=2)
+        store.record("a")
+        other = CallStore()
+        other.record("b")
+        other.record("c")
+        store.merge(other)
+        assert list(store) == ["b", "c"]
+        assert store.evictions == 1
+
+    def test_evicts_least_recently_used_keys(self):
+        store = CallStore(max_keys=2)
+        store.record("a", [])
+        store.record("b", [])
+        store.record("a", [])
+        store.record("c", [])
+        assert list(store) == ["a", "c"]
+        assert store.stacks("b") == []
+        assert store.evictions == 1
+        # an evicted key starts counting from scratch
+        assert store.record("b") == 1
+
+    def test_copy_is_independent(self):
+        store = CallStore()
+        store.record("a", [])
+        copy = store.copy()
+        copy.record("a", [])
+        assert store["a"] == 1
+        assert copy["a"] == 2
+        assert len(store.stacks("a")) == 1
+
+    def test_memory_usage_is_bounded_by_max_keys(self):
+        store = CallStore(max_keys=10)
+        for i in range(10):
+            store.record(("model", "field", "file.py", i))
+        usage = store.memory_usage()
+        for i in range(10, 1000):
+            store.record(("model", "field", "file.py", i))
+        assert len(store) == 10
+        # the dict may be resized as keys churn, but it doesn't keep growing
+        assert store.memory_usage() < usage * 2
+
+
+class TestIgnoredKeys:
+    def test_behaves_like_a_set(self):
+        ignored = IgnoredKeys()
+        ignored.add((User, 1))
+        ignored.add((User, 1))
+        assert ignored == {(User, 1)}
+        assert (User, 1) in ignored
+        assert (User, 2) not in ignored
+
+    def test_drops_oldest_keys(self):
+        ignored = IgnoredKeys(max_keys=2)
+        for key in ((User, 1), (User, 2), (User, 1), (User, 3)):
+            ignored.add(key)
+        assert ignored == {(User, 1), (User, 3)}
+        assert ignored.evictions == 1
+
+    def test_drops_keys_of_collected_instances(self):
+        ignored = IgnoredKeys()
+        user = User(pk=1)
+        ignored.add((User, 1), user)
+        ignored.add((User, 2))
+        assert ignored == {(User, 1), (User, 2)}
+        del user
+        assert ignored == {(User, 2)}
+
+    def test_keeps_keys_while_the_latest_instance_is_alive(self):
+        ignored = IgnoredKeys()
+        first, second = User(pk=1), User(pk=1)
+        ignored.add((User, 1), first)
+        ignored.add((User, 1), second)
+        del first
+        assert (User, 1) in ignored
+        del second
+        assert (User, 1) not in ignored
+
+    def test_collection_does_not_change_keys_during_iteration(self):
+        ignored = IgnoredKeys()
+        users = [User(pk=1), User(pk=2)]
+        ignored.add((User, 1), users[0])
+        ignored.add((User, 2), users[1])
+        keys = ignored._keys
+        for _ in keys:
+            # the callback could run mid-iteration in another thread
+            del users[:]
+        assert (User, 1) not in ignored
+        assert len(ignored) == 0
+
+    def test_copies_hold_instances_weakly(self):
+        ignored = IgnoredKeys()
+        user = User(pk=1)
+        ignored.add((User, 1), user)
+        copy = ignored.copy()
+        assert copy == {(User, 1)}
+        del user
+        assert copy == set()
+        assert ignored == set()
+
+    def test_forks_fall_back_to_the_parent(self):
+        ignored = IgnoredKeys()
+        ignored.add((User, 1))
+        fork = ignored.fork()
+        fork.add((User, 2))
+        ignored.add((User, 3))
+        assert (User, 1) in fork
+        assert (User, 3) in fork
+        assert (User, 2) not in ignored
+        # only the fork's own keys are merged back
+        assert fork == {(User, 2)}
+        ignored.update(fork)
+        assert ignored == {(User, 1), (User, 2), (User, 3)}
+
+
+def test_max_keys_setting_bounds_context(settings):
+    settings.ZEAL_MAX_KEYS = 1
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+
+    with zeal_context(raise_errors=False):
+        context = _nplusone_context.get()
+        with pytest.warns(UserWarning, match="social.User.following"):
+            for user in User.objects.all():
+                _ = list(user.following.all())
+        with pytest.warns(UserWarning, match="social.User.posts"):
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+        assert len(context.calls) == 1
+        assert context.calls.evictions == 1
+
+
+def test_singly_loaded_instances_are_not_kept():
+    users = UserFactory.create_batch(50)
+    for user in users:
+        PostFactory.create(author=user)
+    with (
+        zeal_context(),
+        zeal_ignore([{"model": "social.User", "field": "get()"}]),
+    ):
+        context = _nplusone_context.get()
+        for user in users:
+            # not an N+1, since each user is singly-loaded. each instance
+            # is thrown away on the next iteration.
+            _ = list(User.objects.get(pk=user.pk).posts.all())
+        assert len(context.ignored) <= 1
+
+        user = User.objects.get(pk=users[0].pk)
+        assert (User, user.pk) in context.ignored
+
+
+@pytest.mark.nozeal
+def test_get_memory_usage_measures_the_current_context(settings):
+    pks = [user.pk for user in UserFactory.create_batch(20)]
+    allowlist = [{"model": "social.User", "field": "get()"}]
+    assert get_memory_usage() == 0
+
+    with zeal_context(), zeal_ignore(allowlist):
+        empty = get_memory_usage()
+        # singly-loaded instances are remembered while they're alive
+        users = [User.objects.get(pk=pk) for pk in pks]
+        unbounded = get_memory_usage()
+    assert unbounded > empty
+
+    settings.ZEAL_MAX_KEYS = 1
+    with zeal_context(), zeal_ignore(allowlist):
+        users = [User.objects.get(pk=pk) for pk in pks]
+        assert get_memory_usage() < unbounded
+    assert len(users) == 20
@@ -0,0 +1,157 @@
+import re
+
+import pytest
+from djangoproject.social.models import Post, Profile, User
+from zeal import NPlusOneError, zeal_context
+from zeal.suggestions import get_relation
+
+from .factories import PostFactory, ProfileFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def suggestion(lookup: str) -> str:
+    return re.escape(f"Suggestion: {lookup} (for the queryset evaluated at ")
+
+
+class TestGetRelation:
+    def test_forward_relations_can_be_selected(self):
+        assert get_relation(Post, "author") == (("author", True), User)
+        assert get_relation(Profile, "user") == (("user", True), User)
+
+    def test_reverse_relations_use_accessor_names(self):
+        assert get_relation(User, "posts") == (("posts", False), Post)
+        assert get_relation(User, "user_set") == (("user_set", False), User)
+        assert get_relation(User, "profile") == (("profile", True), Profile)
+
+    def test_returns_none_for_plain_fields(self):
+        assert get_relation(Post, "text") is None
+
+
+def test_suggests_select_related_for_forward_relations(settings):
+    settings.ZEAL_SUGGEST_FIXES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    with zeal_context():
+        with pytest.raises(
+            NPlusOneError,
+            match=suggestion('Post.objects.select_related("author")'),
+        ):
+            for post in Post.objects.all():
+                _ = post.author
+
+
+def test_suggests_select_related_for_reverse_one_to_one(settings):
+    settings.ZEAL_SUGGEST_FIXES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    ProfileFactory.create(user=user_1)
+    ProfileFactory.create(user=user_2)
+    with zeal_context():
+        with pytest.raises(
+            NPlusOneError,
+            match=suggestion('User.objects.select_related("profile")'),
+        ):
+            for user in User.objects.all():
+                _ = user.profile
+
+
+def test_suggests_prefetch_related_for_many_relations(settings):
+    settings.ZEAL_SUGGEST_FIXES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    with zeal_context():
+        with pytest.raises(
+            NPlusOneError,
+            match=suggestion('User.objects.prefetch_related("posts")'),
+        ):
+            for user in User.objects.all():
+                _ = list(user.posts.all())
+
+
+def test_suggests_full_path_through_loaded_relations(settings):
+    settings.ZEAL_SUGGEST_FIXES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    with zeal_context():
+        with pytest.raises(
+            NPlusOneError,
+            match=suggestion(
+                'Post.objects.select_related("author")'
+                '.prefetch_related("author__posts")'
+            ),
+        ):
+            for post in Post.objects.select_related("author"):
+                _ = list(post.author.posts.all())
+
+
+def test_suggests_full_path_through_prefetched_relations(settings):
+    settings.ZEAL_SUGGEST_FIXES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    user_1.following.add(user_2)
+    user_2.following.add(user_1)
+    with zeal_context():
+        with pytest.raises(
+            NPlusOneError,
+            match=suggestion(
+                'User.objects.prefetch_related("following__posts")'
+            ),
+        ):
+            for user in User.objects.prefetch_related("following"):
+                for followed in user.following.all():
+                    _ = list(followed.posts.all())
+
+
+def test_suggests_prefetch_object_for_filtered_managers(settings):
+    settings.ZEAL_SUGGEST_FIXES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    with zeal_context():
+        with pytest.raises(
+            NPlusOneError,
+            match=re.escape(
+                'Suggestion: User.objects.prefetch_related(Prefetch("posts", '
+                'queryset=Post.objects.filter(...), to_attr="filtered_posts")), '
+                "then read `filtered_posts` instead of filtering the related "
+                "manager"
+            ),
+        ):
+            for user in User.objects.all():
+                _ = list(user.posts.filter(text__startswith="a"))
+
+
+def test_no_suggestion_without_a_known_origin(settings):
+    settings.ZEAL_SUGGEST_FIXES = True
+    [user_1, user_2] = UserFactory.create_batch(2)
+    with zeal_context():
+        with pytest.raises(NPlusOneError) as exc_info:
+            for user in [user_1, user_2]:
+                _ = list(user.posts.all())
+        assert "Suggestion" not in str(exc_info.value)
+
+
+@pytest.mark.nozeal
+def test_no_suggestion_by_default():
+    [user_1, user_2] = UserFactory.create_batch(2)
+    PostFactory.create(author=user_1)
+    PostFactory.create(author=user_2)
+    with zeal_context():
+        posts = list(Post.objects.prefetch_related("author"))
+        # nothing is recorded on the instances either
+        assert "_zeal_origin" not in posts[0].__dict__
+        assert "_zeal_origin" not in posts[0].author.__dict__
+        with pytest.raises(NPlusOneError) as exc_info:
+            for post in posts:
+                _ = list(post.author.posts.all())
+    assert "Suggestion" not in str(exc_info.value)
+
+
+@pytest.mark.nozeal
+def test_no_origin_is_recorded_outside_contexts():
+    UserFactory.create()
+    user = User.objects.first()
+    assert user is not None
+    assert "_zeal_origin" not in user.__dict__
@@ -1,4 +1,12 @@
-from zeal.util import _ZEAL_DIR, _is_internal_frame
+import os
+
+from zeal import util
+from zeal.util import (
+    _ZEAL_DIR,
+    _is_internal_frame,
+    get_call_site,
+    get_caller,
+)
 
 
 class TestIsInternalFrame:
@@ -26,3 +34,54 @@ class TestIsInternalFrame:
         assert not _is_internal_frame(
             "/home/user/projects/zeal-analytics/src/main.py"
         )
+
+
+class TestPathSettings:
+    def test_project_roots_include_site_packages(self, settings):
+        settings.ZEAL_PROJECT_ROOTS = ["/app/.venv/lib/site-packages/mylib"]
+        assert not _is_internal_frame(
+            "/app/.venv/lib/site-packages/mylib/views.py"
+        )
+        # anything outside the project roots is internal
+        assert _is_internal_frame("/app/src/myapp/views.py")
+        assert _is_internal_frame("/app/.venv/lib/site-packages/mylib2/a.py")
+
+    def test_site_packages_in_project_roots_are_internal(self, settings):
+        settings.ZEAL_PROJECT_ROOTS = ["/app"]
+        assert not _is_internal_frame("/app/myapp/views.py")
+        assert _is_internal_frame(
+            "/app/.venv/lib/python3.11/site-packages/django/db/query.py"
+        )
+
+        # unless they're listed explicitly
+        settings.ZEAL_PROJECT_ROOTS = [
+            "/app",
+            "/app/.venv/lib/python3.11/site-packages/mylib",
+        ]
+        assert not _is_internal_frame(
+            "/app/.venv/lib/python3.11/site-packages/mylib/views.py"
+        )
+        assert _is_internal_frame(
+            "/app/.venv/lib/python3.11/site-packages/django/db/query.py"
+        )
+
+    def test_excluded_paths_are_internal(self, settings):
+        settings.ZEAL_PROJECT_ROOTS = ["/app/src"]
+        settings.ZEAL_EXCLUDE_PATHS = ["/app/src/vendor"]
+        assert not _is_internal_frame("/app/src/myapp/views.py")
+        assert _is_internal_frame("/app/src/vendor/lib/query.py")
+        assert _is_internal_frame(f"{_ZEAL_DIR}/listeners.py")
+
+    def test_classification_is_cached_per_file(self, settings):
+        settings.ZEAL_EXCLUDE_PATHS = [os.path.dirname(__file__)]
+        assert get_caller()[0] != __file__
+        assert util._internal_files[__file__] is True
+
+        settings.ZEAL_EXCLUDE_PATHS = []
+        assert __file__ not in util._internal_files
+        assert get_caller()[0] == __file__
+
+
+def test_call_site_matches_caller():
+    fn, lineno, _ = get_caller()
+    assert get_call_site() == (fn, lineno + 1)